@@ -0,0 +1,65 @@
+"""Compare the memory used by plain result dicts and `diffbot.Result`s.
+
+Usage: python benchmarks/memory.py [count]
+
+Needs Python 3.4+ for `tracemalloc`.
+"""
+import json
+import os.path
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import diffbot  # noqa: E402 pylint: disable=wrong-import-position
+
+
+SITES = ['site{0}.example.com'.format(i) for i in range(50)]
+
+
+def response(i):
+    """Return the JSON text of a typical article API response."""
+    return json.dumps({'objects': [{
+        'type': 'article',
+        'title': 'Article {0}'.format(i),
+        'text': 'Lorem ipsum dolor sit amet. ' * 10,
+        'date': 'Mon, 13 Jan 2014 20:45:00 GMT',
+        'author': 'Author {0}'.format(i % 100),
+        'pageUrl': 'http://{0}/{1}'.format(SITES[i % 50], i),
+        'resolvedPageUrl': 'http://{0}/{1}'.format(SITES[i % 50], i),
+        'siteName': SITES[i % 50],
+        'humanLanguage': 'en',
+        'diffbotUri': 'article|3|{0}'.format(i),
+        'sentiment': 0.25,
+        'images': [{'url': 'http://{0}/{1}.png'.format(SITES[i % 50], i),
+                    'primary': True, 'width': 640, 'height': 480}],
+        'tags': [{'label': 'tag{0}'.format(j), 'score': 0.5,
+                  'uri': 'http://example.com/tag{0}'.format(j)}
+                 for j in range(3)],
+    }]})
+
+
+def measure(wrap, texts):
+    """Return the bytes held by the results of `wrap` for `texts`."""
+    tracemalloc.start()
+    results = [wrap(json.loads(text)) for text in texts]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del results
+    return size
+
+
+def main():
+    """Run the benchmark."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    texts = [response(i) for i in range(count)]
+    plain = measure(lambda response: response['objects'][0], texts)
+    compact = measure(lambda response: diffbot.objects(response)[0], texts)
+    for name, size in (('dict', plain), ('Article', compact)):
+        print('{0:8} {1:8.1f} MiB {2:6.0f} B/result'.format(
+            name, size / 2.0 ** 20, size / float(count)))
+    print('saved    {0:.0%}'.format(1 - compact / float(plain)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+"""Throughput and latency benchmarks, against a local stand-in API server.
+
+Usage: python benchmarks/run.py [options]
+
+Runs the single-call, bulk, batch request, streaming download and command
+line batch paths over HTTP, against `tests/fake_api.py` running in a
+separate process, and times importing the module. Each benchmark runs
+`--repeat` times, keeping the best result, to reduce noise. Results are
+saved as JSON in `benchmarks/results/`. Pass `--baseline` with an earlier
+results file to report regressions; the exit status is 1 if any metric got
+worse by more than `--tolerance`.
+
+It benchmarks the installed `diffbot` module (on Python 3, that is the one
+converted by 2to3), so install the version to measure first.
+"""
+import argparse
+import json
+import multiprocessing
+import os.path
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'tests'))
+
+import diffbot  # noqa: E402 pylint: disable=wrong-import-position
+import fake_api  # noqa: E402 pylint: disable=wrong-import-position
+
+
+def serve(options, conn):
+    """Run the API server until told to stop."""
+    server = fake_api.MockServer(**options).start()
+    conn.send(server.url)
+    conn.recv()
+    server.stop()
+
+
+def percentile(values, fraction):
+    """The value below which `fraction` of `values` are."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def urls(count):
+    """Distinct page URLs, so that nothing is answered from a cache."""
+    return ['http://example.com/{0}'.format(i) for i in range(count)]
+
+
+def bench_single(client, args):
+    """Sequential API calls."""
+    latencies = []
+    start = time.time()
+    for url in urls(args.calls):
+        call = time.time()
+        client.article(url)
+        latencies.append(time.time() - call)
+    elapsed = time.time() - start
+    return {
+        'calls_per_s': args.calls / elapsed,
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+    }
+
+
+def bench_bulk(client, args):
+    """Concurrent API calls, using `api_many`."""
+    start = time.time()
+    errors = sum(isinstance(result, Exception) for _, result in
+                 client.article_many(urls(args.calls), workers=args.workers))
+    elapsed = time.time() - start
+    return {'calls_per_s': args.calls / elapsed, 'errors': errors}
+
+
+def bench_batch(client, args):
+    """API calls packed into batch requests."""
+    start = time.time()
+    with client.batch(workers=args.workers) as batch:
+        futures = [batch.api('article', url) for url in urls(args.calls)]
+    elapsed = time.time() - start
+    errors = 0
+    for future in futures:
+        try:
+            future.result()
+        except EnvironmentError:
+            errors += 1
+    return {'calls_per_s': args.calls / elapsed, 'errors': errors}
+
+
+def bench_download(client, args):
+    """Streaming and saving crawl results."""
+    job = diffbot.Job('token', 'bench', pool=client.pool)
+    start = time.time()
+    count = sum(1 for _ in job.iter_download())
+    elapsed = time.time() - start
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'data.json')
+        start = time.time()
+        job.download_to(path)
+        saved = time.time() - start
+        size = os.path.getsize(path)
+    finally:
+        shutil.rmtree(tmp)
+    return {
+        'records_per_s': count / elapsed,
+        'stream_mb_per_s': size / elapsed / 2 ** 20,
+        'save_mb_per_s': size / saved / 2 ** 20,
+    }
+
+
+def bench_cli(client, args):
+    """The command line tool in batch mode."""
+    tmp = tempfile.mkdtemp()
+    argv = sys.argv
+    try:
+        src = os.path.join(tmp, 'urls.txt')
+        with open(src, 'w') as dst:
+            dst.write('\n'.join(urls(args.calls)) + '\n')
+        sys.argv = ['diffbot', 'article', src, 'token', '-b',
+                    '-w', str(args.workers), '-o', os.path.join(tmp, 'out')]
+        start = time.time()
+        diffbot.cli()
+        elapsed = time.time() - start
+    finally:
+        sys.argv = argv
+        shutil.rmtree(tmp)
+    return {'calls_per_s': args.calls / elapsed}
+
+
+IMPORT_SCRIPT = """
+import sys
+import time
+start = time.time()
+import diffbot
+sys.stdout.write(str(time.time() - start))
+"""
+
+
+def bench_import(client, args):
+    """Importing the module, in a fresh interpreter."""
+    elapsed = float(subprocess.check_output(
+        [sys.executable, '-c', IMPORT_SCRIPT]).decode('ascii'))
+    return {'import_s': elapsed}
+
+
+BENCHMARKS = [
+    ('single', bench_single),
+    ('bulk', bench_bulk),
+    ('batch', bench_batch),
+    ('download', bench_download),
+    ('cli', bench_cli),
+    ('import', bench_import),
+]
+
+
+def better(metric):
+    """Return the function picking the better of two values of `metric`."""
+    # Rates should go up, latencies and errors down.
+    return max if metric.endswith('_per_s') else min
+
+
+def compare(results, baseline, tolerance):
+    """Print the changes from `baseline`; return the regressions."""
+    regressions = []
+    for name, metrics in sorted(results.items()):
+        for metric, value in sorted(metrics.items()):
+            old = baseline.get(name, {}).get(metric)
+            if not old or metric == 'errors':
+                continue
+            change = value / float(old) - 1
+            worse = -change if better(metric) is max else change
+            flag = worse > tolerance and 'REGRESSION' or ''
+            if flag:
+                regressions.append((name, metric))
+            print('{0:9} {1:16} {2:12.4f} {3:+7.1%} {4}'.format(
+                name, metric, value, change, flag))
+    return regressions
+
+
+def main():
+    """Run the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--calls', type=int, default=500,
+                        help='API calls per benchmark.')
+    parser.add_argument('--workers', type=int, default=diffbot.DEFAULT_WORKERS,
+                        help='Concurrent requests in bulk mode.')
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='Server response latency, in seconds.')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='Fraction of requests failing with a 503.')
+    parser.add_argument('--payload-size', type=int, default=10000,
+                        help='Size of the text of each result, in bytes.')
+    parser.add_argument('--records', type=int, default=20000,
+                        help='Records in the crawl download.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs of each benchmark; the best is kept.')
+    parser.add_argument('--only', action='append',
+                        choices=[name for name, _ in BENCHMARKS],
+                        help='Run only this benchmark (can be repeated).')
+    parser.add_argument('--label', default='current',
+                        help='Name of the results file.')
+    parser.add_argument('--baseline', help='Results file to compare with.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative slowdown before failing.')
+    args = parser.parse_args()
+
+    options = {'latency': args.latency, 'error_rate': args.error_rate,
+               'payload_size': args.payload_size, 'records': args.records}
+    conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve, args=(options, child_conn))
+    server.start()
+    diffbot.API_ROOT = conn.recv()
+    results = {}
+    try:
+        with diffbot.Client('token', pool_size=args.workers) as client:
+            for name, bench in BENCHMARKS:
+                if args.only and name not in args.only:
+                    continue
+                runs = [bench(client, args) for _ in range(args.repeat)]
+                results[name] = dict(
+                    (metric, better(metric)(run[metric] for run in runs))
+                    for metric in runs[0])
+    finally:
+        conn.send(None)
+        server.join()
+
+    report = {
+        'label': args.label,
+        'time': time.time(),
+        'python': platform.python_version(),
+        'options': dict(options, calls=args.calls, workers=args.workers,
+                        repeat=args.repeat),
+        'results': results,
+    }
+    path = os.path.join(HERE, 'results', args.label + '.json')
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as dst:
+        json.dump(report, dst, indent=2, sort_keys=True)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    print('Saved to {0}.'.format(path))
+    if args.baseline:
+        with open(args.baseline) as src:
+            baseline = json.load(src)['results']
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
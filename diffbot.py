@@ -1,21 +1,1571 @@
 """Diffbot API wrapper."""
-import argparse
+import codecs
+import collections
+import functools
 import json
 import os
+import re
+import struct
 import sys
-import urllib
-import urllib2
+import threading
+import time
 
 try:
-    import requests
+    from collections.abc import Mapping
 except ImportError:
-    pass
+    from collections import Mapping
+
+
+class _LazyModule(object):
+    """A module that is imported on first use.
+
+    If the module is not available, using it raises `NameError`, as if the
+    import had failed at the top level.
+    """
+
+    def __init__(self, name):
+        """Initialise the module proxy."""
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            try:
+                __import__(self._name)
+            except ImportError:
+                raise NameError('{0} is not available.'.format(self._name))
+            self._module = sys.modules[self._name]
+        return getattr(self._module, attr)
+
+
+# The HTTP transports are loaded lazily, so that importing this module stays
+# cheap. The `urllib2` fallback is imported where it is used.
+requests = _LazyModule('requests')
 
 
 ENCODING = 'utf-8'
 
-API_ROOT = 'http://api.diffbot.com'
-API_VERSION = 3
+API_ROOT = 'http://api.diffbot.com'
+API_VERSION = 3
+
+
+DEFAULT_POOL_SIZE = 10
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+DEFAULT_WORKERS = 8
+
+
+def _parallel(func, items, workers=DEFAULT_WORKERS, ordered=False):
+    """Call `func` on each item using a pool of worker threads.
+
+    Yields `(item, result)` pairs as the calls complete, or in input order if
+    `ordered` is set. If a call raises, the exception instance is yielded as
+    its result. `items` is consumed lazily: at most `2 * workers` items are
+    read ahead of the results consumed by the caller.
+    """
+    import Queue
+    slots = Queue.Queue(2 * workers)
+    tasks = Queue.Queue()
+    results = Queue.Queue()
+    stop = threading.Event()
+    done = object()
+
+    def feed():
+        count = 0
+        try:
+            for item in items:
+                slots.put(None)
+                if stop.is_set():
+                    break
+                tasks.put((count, item))
+                count += 1
+        except Exception as exc:  # pylint: disable=broad-except
+            results.put((done, exc))
+        else:
+            results.put((done, count))
+        for _ in range(workers):
+            tasks.put(None)
+
+    def work():
+        for index, item in iter(tasks.get, None):
+            try:
+                result = func(item)
+            except Exception as exc:  # pylint: disable=broad-except
+                result = exc
+            results.put((index, (item, result)))
+
+    threads = [threading.Thread(target=feed)]
+    threads.extend(threading.Thread(target=work) for _ in range(workers))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    total = None
+    yielded = 0
+    pending = {}
+    try:
+        while total is None or yielded < total:
+            index, value = results.get()
+            if index is done:
+                if isinstance(value, Exception):
+                    raise value
+                total = value
+                continue
+            if not ordered:
+                slots.get()
+                yielded += 1
+                yield value
+                continue
+            pending[index] = value
+            while yielded in pending:
+                slots.get()
+                yielded += 1
+                yield pending.pop(yielded - 1)
+    finally:
+        stop.set()
+        # Unblock the feeder so that it can notice the stop flag.
+        try:
+            while True:
+                slots.get_nowait()
+        except Queue.Empty:
+            pass
+
+
+def _urlencode(url, params):
+    """Add query parameters to a URL, for `urllib2`."""
+    import urllib
+    if not params:
+        return url
+    return '{0}?{1}'.format(url, urllib.urlencode(params))
+
+
+def _urlopen(url, data=None, headers=None, timeout=None):
+    """Make an HTTP request using `urllib2`.
+
+    Unless an `Accept-Encoding` header is given, a gzip-encoded response is
+    asked for, and decoded on the fly.
+    """
+    import urllib2
+    headers = dict(headers or {})
+    headers.setdefault('Accept-Encoding', 'gzip')
+    req = urllib2.Request(url, data, headers)
+    if timeout is None:
+        response = urllib2.urlopen(req)
+    else:
+        response = urllib2.urlopen(req, timeout=timeout)
+    if response.info().get('Content-Encoding') == 'gzip':
+        return _GzipResponse(response)
+    return response
+
+
+class _GzipResponse(object):
+    """A `urllib2` response whose gzip-encoded body is decoded on read."""
+
+    def __init__(self, response):
+        """Wrap the response."""
+        import zlib
+        self._response = response
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def read(self, size=-1):
+        """Read and decode (roughly) `size` bytes of the body."""
+        if size < 0:
+            return (self._decompressor.decompress(self._response.read()) +
+                    self._decompressor.flush())
+        while True:
+            chunk = self._response.read(size)
+            if not chunk:
+                return self._decompressor.flush()
+            data = self._decompressor.decompress(chunk)
+            if data:
+                return data
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+# Request bodies smaller than this are not worth compressing.
+COMPRESS_MIN_SIZE = 1024
+
+# The gzip level for request bodies: fast, and most of the size reduction.
+COMPRESS_LEVEL = 1
+
+
+def _body(data):
+    """Return `data` as bytes, encoding it only if it is text."""
+    if isinstance(data, (bytes, bytearray)):
+        return bytes(data)
+    if hasattr(data, 'tobytes'):  # memoryview
+        return data.tobytes()
+    return data.encode(ENCODING)
+
+
+def _encode_post(data, content_type, compress=False):
+    """Return the body and headers of a POST request.
+
+    With `compress` set, bodies of at least `COMPRESS_MIN_SIZE` bytes are
+    gzip-encoded.
+    """
+    data = _body(data)
+    headers = {'Content-Type': content_type}
+    if compress and len(data) >= COMPRESS_MIN_SIZE:
+        import zlib
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED,
+                                      16 + zlib.MAX_WBITS)
+        data = compressor.compress(data) + compressor.flush()
+        headers['Content-Encoding'] = 'gzip'
+    return data, headers
+
+
+class Stream(object):
+    """A streamed HTTP response.
+
+    Iterating over it yields the body in chunks of bytes. The connection is
+    released when the body is exhausted or the stream is closed.
+    """
+
+    def __init__(self, status, headers, chunks, close):
+        """Initialise the stream."""
+        self.status = status
+        self.headers = headers
+        self._chunks = chunks
+        self._close = close
+
+    def __iter__(self):
+        try:
+            for chunk in self._chunks:
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        """Release the connection."""
+        self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _iter_text(chunks):
+    """Decode chunks of bytes incrementally."""
+    decoder = codecs.getincrementaldecoder(ENCODING)()
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', True)
+    if text:
+        yield text
+
+
+def _iter_lines(chunks):
+    """Split chunks of bytes into lines of text, keeping line endings."""
+    rest = u''
+    for text in _iter_text(chunks):
+        lines = (rest + text).split(u'\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line + u'\n'
+    if rest:
+        yield rest
+
+
+def _decode_cell(value):
+    """Decode a cell (or a list of extra cells) read by Python 2's `csv`."""
+    if isinstance(value, bytes):
+        return value.decode(ENCODING)
+    if isinstance(value, list):
+        return [_decode_cell(item) for item in value]
+    return value
+
+
+def _iter_csv(chunks):
+    """Parse CSV records, yielding dicts keyed by the column names."""
+    import csv
+    if sys.version_info[0] >= 3:
+        return csv.DictReader(_iter_lines(chunks))
+    # Python 2's `csv` only reads bytes.
+    reader = csv.DictReader(line.encode(ENCODING)
+                            for line in _iter_lines(chunks))
+    return (dict((_decode_cell(key), _decode_cell(value))
+                 for key, value in row.items()) for row in reader)
+
+
+def _iter_json_array(chunks):
+    """Parse a JSON array incrementally, yielding its items.
+
+    Only the data of the items being parsed is kept in memory.
+    """
+    decoder = json.JSONDecoder()
+    texts = _iter_text(chunks)
+    buf = u''
+    pos = 0
+    state = 'start'
+    while True:
+        pos = _WHITESPACE.match(buf, pos).end()
+        if pos == len(buf):
+            text = next(texts, None)
+            if text is None:
+                raise ValueError('Unexpected end of JSON array.')
+            buf, pos = text, 0
+        elif state == 'start':
+            if buf[pos] != u'[':
+                raise ValueError('Expected a JSON array.')
+            pos += 1
+            state = 'first'
+        elif state != 'item' and buf[pos] == u']':
+            return
+        elif state == 'next':
+            if buf[pos] != u',':
+                raise ValueError('Expected "," or "]" in JSON array.')
+            pos += 1
+            state = 'item'
+        else:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+                if end == len(buf) and buf[pos] not in u'{["':
+                    # A number (or literal) may go on in the next chunk.
+                    raise ValueError('Incomplete JSON value.')
+            except ValueError:
+                # The item is incomplete. Read at least as much data as is
+                # buffered already, so that large items are parsed only a
+                # logarithmic number of times.
+                buf = [buf[pos:]]
+                size = 0
+                for text in texts:
+                    buf.append(text)
+                    size += len(text)
+                    if size >= len(buf[0]):
+                        break
+                if not size:
+                    raise
+                buf, pos = u''.join(buf), 0
+                continue
+            pos = end
+            yield item
+            state = 'next'
+
+
+def fast_decoder():
+    """Return the fastest JSON decoder available.
+
+    That is `orjson.loads` or `ujson.loads` if installed, else `json.loads`.
+    Pass it to `Client` as the `decoder` argument.
+    """
+    for name in ('orjson', 'ujson'):
+        try:
+            return __import__(name).loads
+        except ImportError:
+            pass
+    return json.loads
+
+
+# Fields whose values repeat a lot across results, and are interned.
+_INTERNED_FIELDS = frozenset(('type', 'siteName', 'humanLanguage',
+                              'publisherCountry', 'publisherRegion',
+                              'availability', 'brand', 'provider'))
+
+# Most strings shared by `_intern`. Past that, new strings are not shared,
+# so that arbitrary keys (e.g. of product `specs`) can't grow the table for
+# the life of the process.
+INTERN_LIMIT = 10000
+
+_interned = {}
+
+
+def _intern(value):
+    """Return a shared copy of `value`, if there is room for it.
+
+    Unlike the `intern` builtin, this also works for unicode on Python 2.
+    """
+    shared = _interned.get(value)
+    if shared is not None:
+        return shared
+    if len(_interned) < INTERN_LIMIT:
+        _interned[value] = value
+    return value
+
+
+def _compact(value, key=None):
+    """Intern the keys and repeated values of a decoded JSON value."""
+    if isinstance(value, Mapping):
+        return dict((_intern(k), _compact(v, k)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_compact(item) for item in value]
+    if key in _INTERNED_FIELDS:
+        return _intern(value)
+    return value
+
+
+class Result(object):
+    """A compact API result object.
+
+    The common fields are stored in slots, and are `None` if missing. Other
+    fields are still available as attributes. Keys and repeated values such
+    as `type` and `siteName` are interned, so many results can be kept in
+    memory cheaply. `raw` gives back the result as a dict.
+    """
+
+    __slots__ = ('_extra',)
+
+    fields = ()
+
+    def __init__(self, obj):
+        """Initialise the result from a decoded API object."""
+        extra = {}
+        for key, value in obj.items():
+            value = _compact(value, key)
+            if key in self.fields:
+                setattr(self, key, value)
+            else:
+                extra[_intern(key)] = value
+        self._extra = extra or None
+
+    def __getattr__(self, name):
+        if name in self.fields:
+            return None
+        if not name.startswith('_') and name in (self._extra or ()):
+            return self._extra[name]
+        raise AttributeError(name)
+
+    @property
+    def raw(self):
+        """The result as a dict, with all of its fields."""
+        raw = dict(self._extra or ())
+        for field in self.fields:
+            try:
+                raw[field] = object.__getattribute__(self, field)
+            except AttributeError:
+                pass
+        return raw
+
+    def __repr__(self):
+        return '<{0} {1!r}>'.format(type(self).__name__,
+                                    getattr(self, 'pageUrl', None))
+
+
+class Article(Result):
+    """A result of the article API."""
+
+    fields = ('type', 'title', 'text', 'html', 'date', 'estimatedDate',
+              'author', 'authorUrl', 'pageUrl', 'resolvedPageUrl',
+              'siteName', 'publisherCountry', 'publisherRegion',
+              'humanLanguage', 'diffbotUri', 'icon', 'sentiment', 'images',
+              'videos', 'tags', 'breadcrumb', 'numPages', 'nextPages')
+    __slots__ = fields
+
+
+class Product(Result):
+    """A result of the product API."""
+
+    fields = ('type', 'title', 'text', 'pageUrl', 'resolvedPageUrl',
+              'siteName', 'humanLanguage', 'diffbotUri', 'brand',
+              'offerPrice', 'regularPrice', 'saveAmount', 'shippingAmount',
+              'offerPriceDetails', 'regularPriceDetails',
+              'saveAmountDetails', 'productId', 'upc', 'sku', 'mpn', 'isbn',
+              'availability', 'specs', 'images', 'discussion')
+    __slots__ = fields
+
+
+class Image(Result):
+    """A result of the image API."""
+
+    fields = ('type', 'title', 'url', 'pageUrl', 'resolvedPageUrl',
+              'humanLanguage', 'diffbotUri', 'anchorUrl', 'height', 'width',
+              'naturalHeight', 'naturalWidth', 'displayHeight',
+              'displayWidth', 'xpath', 'mentions', 'faces', 'ocr')
+    __slots__ = fields
+
+
+class Discussion(Result):
+    """A result of the discussion API."""
+
+    fields = ('type', 'title', 'pageUrl', 'resolvedPageUrl', 'siteName',
+              'humanLanguage', 'diffbotUri', 'provider', 'rssUrl',
+              'numPosts', 'participants', 'posts', 'tags', 'nextPage',
+              'nextPages')
+    __slots__ = fields
+
+
+RESULT_TYPES = {
+    'article': Article,
+    'product': Product,
+    'image': Image,
+    'discussion': Discussion,
+}
+
+
+def wrap(obj):
+    """Return the `Result` for an object of an API response.
+
+    Objects of other types are returned as compacted dicts.
+    """
+    cls = RESULT_TYPES.get(obj.get('type'))
+    if cls is None:
+        return _compact(obj)
+    return cls(obj)
+
+
+def objects(response):
+    """Return the objects of an API response as `Result`s."""
+    return [wrap(obj) for obj in response.get('objects', ())]
+
+
+class Pool(object):
+    """HTTP connection pool.
+
+    With `requests` installed, connections are kept alive and reused between
+    calls. A single pool can be shared between several clients (and threads)
+    by passing it to them as the `pool` argument.
+    """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, keep_alive=True, block=False):
+        """Initialise the pool.
+
+        `size` is the number of connections kept open per host, `block`
+        makes callers wait for a free connection instead of opening
+        throwaway ones when all of them are in use.
+        """
+        self.size = size
+        self.keep_alive = keep_alive
+        self.block = block
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """The shared `requests.Session`, created on first use.
+
+        Raises `NameError` when `requests` is not available.
+        """
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(
+                        pool_connections=self.size,
+                        pool_maxsize=self.size,
+                        pool_block=self.block)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    if not self.keep_alive:
+                        session.headers['Connection'] = 'close'
+                    self._session = session
+        return self._session
+
+    @staticmethod
+    def _report(call, response, size=None):
+        """Record the status, size and timing of a `requests` response."""
+        call.status = response.status_code
+        call.bytes_received = size
+        call.response_time = response.elapsed.total_seconds()
+
+    @staticmethod
+    def _decode(response, decoder):
+        """Decode a `requests` response, using `decoder` if given."""
+        if decoder is None:
+            return response.json()
+        return decoder(response.content.decode(ENCODING))
+
+    def get(self, url, params=None, timeout=None, decoder=None, call=None):
+        """HTTP GET request.
+
+        The JSON response is decoded with `decoder` (`json.loads` by
+        default). The status, size and timing of the response are recorded
+        in `call`, a `Call`, if given.
+        """
+        try:
+            response = self.session.get(url, params=params, timeout=timeout)
+            if call is not None:
+                self._report(call, response, len(response.content))
+            response.raise_for_status()
+            # If JSON fails, return raw data
+            # (e.g. when downloading CSV job logs).
+            try:
+                return self._decode(response, decoder)
+            except ValueError:
+                return response.text
+        except NameError:
+            response = _urlopen(_urlencode(url, params), timeout=timeout)
+            data = response.read()
+            if call is not None:
+                call.status = response.getcode()
+                call.bytes_received = len(data)
+            data = data.decode(ENCODING)
+            try:
+                return (decoder or json.loads)(data)
+            except ValueError:
+                return data
+
+    def post(self, url, data, content_type, params=None, timeout=None,
+             decoder=None, compress=False, call=None):
+        """HTTP POST request.
+
+        `data` is text, or bytes (also a `bytearray` or `memoryview`) to be
+        sent as is. With `compress` set, large bodies are gzip-encoded.
+        """
+        data, headers = _encode_post(data, content_type, compress)
+        if call is not None:
+            call.bytes_sent = len(data)
+        try:
+            response = self.session.post(url, params=params, data=data,
+                                         timeout=timeout, headers=headers)
+            if call is not None:
+                self._report(call, response, len(response.content))
+            response.raise_for_status()
+            return self._decode(response, decoder)
+        except NameError:
+            response = _urlopen(_urlencode(url, params), data, headers,
+                                timeout)
+            body = response.read()
+            if call is not None:
+                call.status = response.getcode()
+                call.bytes_received = len(body)
+            return (decoder or json.loads)(body.decode(ENCODING))
+
+    def stream(self, url, params=None, headers=None, timeout=None,
+               call=None):
+        """Streamed HTTP GET request, returning a `Stream`."""
+        try:
+            response = self.session.get(url, params=params, headers=headers,
+                                        timeout=timeout, stream=True)
+            if call is not None:
+                self._report(call, response)
+            try:
+                response.raise_for_status()
+            except Exception:
+                response.close()
+                raise
+            return Stream(response.status_code, response.headers,
+                          response.iter_content(CHUNK_SIZE), response.close)
+        except NameError:
+            response = _urlopen(_urlencode(url, params), headers=headers,
+                                timeout=timeout)
+            if call is not None:
+                call.status = response.getcode()
+            return Stream(response.getcode(), response.info(),
+                          iter(functools.partial(response.read, CHUNK_SIZE),
+                               b''),
+                          response.close)
+
+    def close(self):
+        """Close all pooled connections."""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Future(object):
+    """The result of a call that may still be in progress."""
+
+    def __init__(self):
+        """Initialise the future."""
+        self._done = threading.Event()
+        self._result = None
+        self._exception = None
+
+    def done(self):
+        """Return `True` if the result is available."""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Wait for the result, returning `True` if it is available."""
+        self._done.wait(timeout)
+        return self._done.is_set()
+
+    def set_result(self, result):
+        """Set the result and wake up waiting threads."""
+        self._result = result
+        self._done.set()
+
+    def set_exception(self, exception):
+        """Set the exception to raise and wake up waiting threads."""
+        self._exception = exception
+        self._done.set()
+
+    def result(self):
+        """Wait for the result, or raise the exception of the call."""
+        self._done.wait()
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+class SingleFlight(object):
+    """Share the result of concurrent identical calls.
+
+    While a call for a given key is in progress, other threads calling `do`
+    with the same key wait for it and get its result (or exception), instead
+    of making the call themselves.
+    """
+
+    def __init__(self):
+        """Initialise the call registry."""
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args):
+        """Call `func(*args)`, unless a call for `key` is already running."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if leader:
+            try:
+                future.set_result(func(*args))
+            except Exception as exc:  # pylint: disable=broad-except
+                future.set_exception(exc)
+            finally:
+                with self._lock:
+                    del self._calls[key]
+        return future.result()
+
+
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-\d+/(\d+|\*)$')
+
+
+def _content_range(value):
+    """The start and the total size in a `Content-Range` header.
+
+    Either is `None` if unknown.
+    """
+    match = _CONTENT_RANGE.match(value or '')
+    if match is None:
+        return None, None
+    total = match.group(2)
+    return int(match.group(1)), None if total == '*' else int(total)
+
+
+def _validator(headers):
+    """The ETag or Last-Modified date of a response, for `If-Range`."""
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    # Weak ETags can't be used with If-Range.
+    return headers.get('Last-Modified')
+
+
+def _read_part_info(part):
+    """The validator and the size of the file a partial download is of."""
+    try:
+        with open(part + '.info') as src:
+            info = json.load(src)
+    except (EnvironmentError, ValueError):
+        return None, None
+    return info.get('validator'), info.get('size')
+
+
+def _write_part_info(part, validator, size):
+    """Save the validator and the size of the file being downloaded."""
+    with open(part + '.info', 'w') as dst:
+        json.dump({'validator': validator, 'size': size}, dst)
+
+
+def _remove_part(part):
+    """Remove a partial download and its info file."""
+    for path in (part, part + '.info'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _status_code(exc):
+    """HTTP status code of a failed request, or `None`."""
+    response = getattr(exc, 'response', None)
+    if response is not None:
+        return getattr(response, 'status_code', None)
+    return getattr(exc, 'code', None)
+
+
+def _overloaded(exc):
+    """Return `True` if the error means the API is overloaded."""
+    status = _status_code(exc)
+    return status is not None and (status == 429 or 500 <= status < 600)
+
+
+class RateLimiter(object):
+    """Token bucket rate limiter.
+
+    Allows `rate` calls per second on average, with bursts of up to `burst`
+    calls. The limiter is thread-safe. If `path` is given, the bucket is
+    stored in that file, so that several processes using the same path
+    share one budget (this requires `fcntl`, i.e. a POSIX system).
+    """
+
+    _state = struct.Struct('!dd')
+
+    def __init__(self, rate, burst=None, path=None):
+        """Initialise the limiter with a full bucket."""
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.path = path
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._file = None
+        self._pid = None
+
+    def acquire(self):
+        """Take a token from the bucket, waiting for one if needed."""
+        while True:
+            with self._lock:
+                wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def _take(self):
+        """Take a token, or return the number of seconds to wait for one."""
+        if self.path is None:
+            self._tokens, self._updated, wait = self._refill(
+                self._tokens, self._updated)
+            return wait
+        import fcntl
+        if self._pid != os.getpid():
+            # Locks are not exclusive between processes sharing a file
+            # descriptor, so each process opens the file on its own.
+            self._file = open(self.path, 'a+b')
+            self._pid = os.getpid()
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        try:
+            self._file.seek(0)
+            data = self._file.read(self._state.size)
+            if len(data) == self._state.size:
+                tokens, updated = self._state.unpack(data)
+            else:
+                tokens, updated = self.burst, time.time()
+            tokens, updated, wait = self._refill(tokens, updated)
+            self._file.seek(0)
+            self._file.truncate()
+            self._file.write(self._state.pack(tokens, updated))
+            self._file.flush()
+            return wait
+        finally:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def _refill(self, tokens, updated):
+        """Refill the bucket and try to take a token from it."""
+        now = time.time()
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, now, 0
+        return tokens, now, (1 - tokens) / self.rate
+
+
+class ConcurrencyController(object):
+    """Adaptive (AIMD) limit on the number of requests in flight.
+
+    The limit grows by about one request per round of successful requests
+    (additive increase), and is multiplied by `decrease` when the API
+    responds with 429 or 5xx (multiplicative decrease). It always stays
+    between `minimum` and `maximum`.
+    """
+
+    def __init__(self, initial=DEFAULT_WORKERS, minimum=1, maximum=100,
+                 decrease=0.5):
+        """Initialise the controller."""
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Wait until another request is allowed to start."""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, overloaded=False):
+        """Mark a request as finished, adjusting the limit."""
+        with self._cond:
+            self.in_flight -= 1
+            if overloaded:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+class RetryPolicy(object):
+    """When and how to retry failed requests.
+
+    A request is attempted up to `attempts` times. Failures with an HTTP
+    status in `statuses`, or without a status but matching `exceptions`
+    (connection errors and timeouts by default), are retried after an
+    exponential backoff with full jitter: a random delay of up to `backoff`
+    seconds after the first failure, doubling each time up to `max_backoff`.
+
+    With a `deadline` (in seconds), no attempt starts after the deadline,
+    the transport timeout is limited to the time left, and so is the
+    Diffbot `timeout` parameter if the call has one.
+
+    With `hedge` set, a duplicate API call is sent if the first one didn't
+    finish within `hedge` seconds, and the first response wins. Only API
+    GET requests are hedged; uploads, crawl jobs and downloads are not. If
+    `hedge` is `True`, the delay is the 95th percentile of recent latencies
+    of such calls.
+    """
+
+    samples = 100
+
+    def __init__(self, attempts=3, backoff=0.1, max_backoff=10.0,
+                 statuses=RETRY_STATUSES, exceptions=(EnvironmentError,),
+                 deadline=None, hedge=None):
+        """Initialise the policy."""
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = statuses
+        self.exceptions = exceptions
+        self.deadline = deadline
+        self.hedge = hedge
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=self.samples)
+
+    def retryable(self, exc):
+        """Return `True` if the error should be retried."""
+        status = _status_code(exc)
+        if status is not None:
+            return status in self.statuses
+        return isinstance(exc, self.exceptions)
+
+    def delay(self, attempt):
+        """Seconds to wait before retrying after `attempt` failures."""
+        import random
+        return random.uniform(0, min(self.max_backoff,
+                                     self.backoff * 2 ** (attempt - 1)))
+
+    def record(self, latency):
+        """Record the latency of a successful request."""
+        with self._lock:
+            self._latencies.append(latency)
+
+    def hedge_delay(self):
+        """Seconds to wait before sending a hedged request, or `None`."""
+        if self.hedge is not True:
+            return self.hedge
+        with self._lock:
+            if len(self._latencies) < self.samples // 5:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[int(len(latencies) * 0.95)]
+
+
+class Hooks(object):
+    """Callbacks for the HTTP requests made by a client.
+
+    Subclass it and override any of the methods, then pass an instance to
+    `Client` in its `hooks` list. They are called from the threads making
+    the requests, and receive the `Call` being made.
+    """
+
+    def before_request(self, call):
+        """Called before a request waits for the rate and concurrency
+        limits."""
+
+    def after_response(self, call):
+        """Called when a request succeeded."""
+
+    def on_error(self, call, exc):
+        """Called when a request failed with `exc`."""
+
+
+class Call(object):
+    """An HTTP request made by a client, as reported to `Hooks`.
+
+    `api` is the name of the endpoint, e.g. `article` or `crawl`. `attempt`
+    counts the earlier tries of the same call. `status`, the byte counts and
+    `response_time`, the seconds until the response headers arrived, are
+    `None` if not known. Timestamps are from `time.time()`.
+    """
+
+    __slots__ = ('api', 'url', 'params', 'attempt', 'status', 'bytes_sent',
+                 'bytes_received', 'started', 'sent', 'finished',
+                 'response_time')
+
+    def __init__(self, api, url, params=None, attempt=0):
+        """Initialise the call record."""
+        self.api = api
+        self.url = url
+        self.params = params
+        self.attempt = attempt
+        self.status = self.bytes_sent = self.bytes_received = None
+        self.started = time.time()
+        self.sent = self.finished = self.response_time = None
+
+    @property
+    def queued(self):
+        """Seconds spent waiting for the rate and concurrency limits."""
+        return (self.sent or self.started) - self.started
+
+    @property
+    def duration(self):
+        """Seconds from sending the request to decoding the response."""
+        if self.finished is None:
+            return None
+        return self.finished - (self.sent or self.started)
+
+    def __repr__(self):
+        return '<Call {0} {1} ({2})>'.format(self.api, self.status,
+                                             self.duration)
+
+
+# Upper bounds of the latency histogram buckets, 1 ms to ~2 min, 10% apart.
+LATENCY_BUCKETS = tuple(0.001 * 1.1 ** i for i in range(123))
+
+
+class Metrics(Hooks):
+    """Counters and latency histograms per API, as a hook.
+
+    Latencies are request durations, not including the time queued for the
+    rate and concurrency limits, and are bucketed, so percentiles are
+    accurate to about 10%.
+    """
+
+    def __init__(self):
+        """Initialise the metrics."""
+        self._apis = {}
+        self._lock = threading.Lock()
+
+    def _record(self, call, error):
+        """Add a call to the metrics of its API."""
+        import bisect
+        with self._lock:
+            stats = self._apis.get(call.api)
+            if stats is None:
+                stats = self._apis[call.api] = {
+                    'calls': 0, 'errors': 0, 'retries': 0, 'bytes_sent': 0,
+                    'bytes_received': 0, 'queued': 0.0, 'total': 0.0,
+                    'statuses': {}, 'histogram': [0] * (
+                        len(LATENCY_BUCKETS) + 1),
+                }
+            stats['calls'] += 1
+            stats['errors'] += error
+            stats['retries'] += call.attempt > 0
+            stats['bytes_sent'] += call.bytes_sent or 0
+            stats['bytes_received'] += call.bytes_received or 0
+            stats['queued'] += call.queued
+            stats['total'] += call.duration
+            if call.status is not None:
+                stats['statuses'][call.status] = \
+                    stats['statuses'].get(call.status, 0) + 1
+            stats['histogram'][bisect.bisect_left(
+                LATENCY_BUCKETS, call.duration)] += 1
+
+    def after_response(self, call):
+        """Record a successful call."""
+        self._record(call, False)
+
+    def on_error(self, call, exc):
+        """Record a failed call."""
+        self._record(call, True)
+
+    @staticmethod
+    def _percentile(histogram, count, fraction):
+        """The latency below which `fraction` of the calls completed."""
+        rank = fraction * count
+        seen = 0
+        for bucket, hits in enumerate(histogram):
+            seen += hits
+            if seen >= rank:
+                break
+        if bucket < len(LATENCY_BUCKETS):
+            return LATENCY_BUCKETS[bucket]
+        return float('inf')
+
+    def stats(self):
+        """Return a snapshot of the metrics, as a dict keyed by API name.
+
+        Each value has the counts of `calls`, `errors`, `retries` and
+        `statuses`, the `bytes_sent` and `bytes_received`, and the `mean`,
+        `p50`, `p95` and `p99` latencies, and mean time `queued`, in
+        seconds.
+        """
+        with self._lock:
+            result = {}
+            for api, stats in self._apis.items():
+                calls = stats['calls']
+                histogram = stats['histogram']
+                result[api] = dict(
+                    (key, stats[key]) for key in (
+                        'calls', 'errors', 'retries', 'bytes_sent',
+                        'bytes_received'))
+                result[api].update({
+                    'statuses': dict(stats['statuses']),
+                    'queued': stats['queued'] / calls,
+                    'mean': stats['total'] / calls,
+                    'p50': self._percentile(histogram, calls, 0.5),
+                    'p95': self._percentile(histogram, calls, 0.95),
+                    'p99': self._percentile(histogram, calls, 0.99),
+                })
+            return result
+
+    def reset(self):
+        """Clear all metrics."""
+        with self._lock:
+            self._apis.clear()
+
+
+class Cache(object):
+    """Base class for response caches.
+
+    Entries expire `ttl` seconds after they were stored (never, if `ttl` is
+    `None`), and the least recently used entries are evicted once there are
+    more than `maxsize` of them. `hits` and `misses` count lookups.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        """Initialise the cache."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value stored under `key`, or `None`."""
+        with self._lock:
+            value = self._get(key, time.time())
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Store `value` under `key`."""
+        expires = None if self.ttl is None else time.time() + self.ttl
+        with self._lock:
+            self._set(key, value, expires)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._clear()
+
+    def _get(self, key, now):
+        raise NotImplementedError
+
+    def _set(self, key, value, expires):
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+
+class MemoryCache(Cache):
+    """In-memory LRU response cache.
+
+    Cached results are returned as-is, not copied, so they should not be
+    modified by the caller.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        """Initialise the cache."""
+        Cache.__init__(self, maxsize=maxsize, ttl=ttl)
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key, now):
+        try:
+            value, expires = self._entries.pop(key)
+        except KeyError:
+            return None
+        if expires is not None and expires <= now:
+            return None
+        self._entries[key] = value, expires
+        return value
+
+    def _set(self, key, value, expires):
+        self._entries.pop(key, None)
+        self._entries[key] = value, expires
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _clear(self):
+        self._entries.clear()
+
+
+class SQLiteCache(Cache):
+    """On-disk LRU response cache, stored in an SQLite database.
+
+    Results are stored as JSON, so they survive restarts and can be shared
+    between processes. Access times are written in batches, and entries
+    evicted a hundredth of `maxsize` at a time, to keep lookups cheap.
+    """
+
+    # Reads whose access times are held back before being written.
+    _TOUCH_BATCH = 1000
+
+    def __init__(self, path, maxsize=100000, ttl=None):
+        """Initialise the cache, creating the database if needed."""
+        import sqlite3
+        Cache.__init__(self, maxsize=maxsize, ttl=ttl)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # With a write-ahead log, commits needn't wait for the disk.
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS cache ('
+                             'key TEXT PRIMARY KEY, value TEXT, '
+                             'expires REAL, accessed REAL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS cache_accessed '
+                             'ON cache (accessed)')
+        self._touched = {}
+        self._count = self._db.execute(
+            'SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    def _get(self, key, now):
+        row = self._db.execute('SELECT value, expires FROM cache '
+                               'WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= now:
+            with self._db:
+                self._db.execute('DELETE FROM cache WHERE key = ?', (key,))
+            self._touched.pop(key, None)
+            return None
+        self._touched[key] = now
+        if len(self._touched) >= self._TOUCH_BATCH:
+            self._touch()
+        return json.loads(row[0])
+
+    def _touch(self):
+        """Write the held back access times."""
+        if not self._touched:
+            return
+        with self._db:
+            self._db.executemany('UPDATE cache SET accessed = ? '
+                                 'WHERE key = ?', [
+                                     (accessed, key) for key, accessed
+                                     in self._touched.items()])
+        self._touched = {}
+
+    def _set(self, key, value, expires):
+        value = json.dumps(value)
+        now = time.time()
+        self._touched.pop(key, None)
+        with self._db:
+            updated = self._db.execute(
+                'UPDATE cache SET value = ?, expires = ?, accessed = ? '
+                'WHERE key = ?', (value, expires, now, key)).rowcount
+            if not updated:
+                self._db.execute('INSERT INTO cache VALUES (?, ?, ?, ?)',
+                                 (key, value, expires, now))
+                self._count += 1
+        if self._count > self.maxsize:
+            self._evict()
+
+    def _evict(self):
+        """Remove the least recently used entries, down to below `maxsize`."""
+        self._touch()
+        keep = self.maxsize - self.maxsize // 100
+        with self._db:
+            # Other processes may have added or evicted entries too.
+            count = self._db.execute(
+                'SELECT COUNT(*) FROM cache').fetchone()[0]
+            if count > self.maxsize:
+                self._db.execute('DELETE FROM cache WHERE key IN ('
+                                 'SELECT key FROM cache ORDER BY accessed '
+                                 'LIMIT ?)', (count - keep,))
+                count = keep
+        self._count = count
+
+    def _clear(self):
+        with self._db:
+            self._db.execute('DELETE FROM cache')
+        self._touched = {}
+        self._count = 0
+
+    def close(self):
+        """Write the held back access times, and close the database."""
+        with self._lock:
+            self._touch()
+        self._db.close()
+
+
+# Query parameters that only track where a visitor came from.
+TRACKING_PARAMS = frozenset((
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'mc_cid', 'mc_eid',
+    '_ga', '_hsenc', '_hsmi', 'igshid', 'ref_src',
+))
+
+_DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+
+def canonicalize_url(url, https=False):
+    """Return the canonical form of a URL.
+
+    The scheme and host are lower-cased, the default port, the fragment and
+    tracking parameters (`utm_*` and `TRACKING_PARAMS`) are removed, and the
+    remaining query parameters are sorted. With `https` set, `http` URLs are
+    upgraded to `https`.
+    """
+    import urlparse
+    scheme, netloc, path, query, _ = urlparse.urlsplit(url.strip())
+    scheme = scheme.lower()
+    if https and scheme == 'http':
+        scheme = 'https'
+    userinfo, at, host = netloc.rpartition('@')
+    host, colon, port = host.lower().partition(':')
+    if port == _DEFAULT_PORTS.get(scheme):
+        colon = port = ''
+    netloc = userinfo + at + host.rstrip('.') + colon + port
+    params = sorted(param for param in query.split('&') if param and not (
+        param.split('=', 1)[0].startswith('utm_') or
+        param.split('=', 1)[0] in TRACKING_PARAMS))
+    return urlparse.urlunsplit((scheme, netloc, path or '/', '&'.join(params),
+                                ''))
+
+
+class DedupIndex(object):
+    """An exact index of the URLs (or other keys) seen so far."""
+
+    def __init__(self):
+        """Initialise the index."""
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._seen)
+
+    def __contains__(self, key):
+        return key in self._seen
+
+    def add(self, key):
+        """Add `key` to the index; return whether it was new."""
+        with self._lock:
+            if key in self._seen:
+                return False
+            self._seen.add(key)
+            return True
+
+
+class BloomFilter(object):
+    """A memory-bounded index of the keys seen so far.
+
+    It takes about `1.44 * log2(1 / error_rate)` bits per key, up to
+    `capacity` keys. Keys it has seen are always reported as such, but a new
+    key is wrongly reported as seen with a probability of `error_rate`.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        """Initialise the filter."""
+        import math
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError('Invalid Bloom filter capacity or error rate.')
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._size = int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        self._hashes = max(1, int(round(
+            self._size / float(capacity) * math.log(2))))
+        self._bits = bytearray((self._size + 7) // 8)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def _positions(self, key):
+        """The bit positions for `key`."""
+        import hashlib
+        if not isinstance(key, bytes):
+            key = key.encode(ENCODING)
+        first, second = struct.unpack('<QQ', hashlib.md5(key).digest())
+        return [(first + i * second) % self._size
+                for i in range(self._hashes)]
+
+    def __contains__(self, key):
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7))
+                   for pos in self._positions(key))
+
+    def add(self, key):
+        """Add `key` to the filter; return whether it was (probably) new."""
+        positions = self._positions(key)
+        bits = self._bits
+        new = False
+        with self._lock:
+            for pos in positions:
+                mask = 1 << (pos & 7)
+                if not bits[pos >> 3] & mask:
+                    bits[pos >> 3] |= mask
+                    new = True
+            if new:
+                self._count += 1
+        return new
+
+
+# Crawl submissions with a longer query string are POSTed as a form.
+MAX_QUERY_LENGTH = 2000
+
+# Seeds per crawl job when splitting a seed list with `Client.split_seeds`.
+DEFAULT_SEEDS_PER_JOB = 10000
+
+
+# Calls per batch request, and seconds to wait for more before sending one.
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_LINGER = 0.05
+
+
+def _batch_result(response, decoder):
+    """The result of a call in a batch, from its part of the response."""
+    code = response.get('code')
+    body = response.get('body') or ''
+    if code != 200:
+        exc = EnvironmentError('Batched call failed with status {0}: {1}'
+                               .format(code, body))
+        exc.code = code
+        raise exc
+    return (decoder or json.loads)(body)
+
+
+def _settle_batch(client, calls, responses):
+    """Resolve the futures of batched `(path, key, future)` calls."""
+    for index, (_, key, future) in enumerate(calls):
+        if future.done():
+            continue  # Cancelled.
+        if index >= len(responses):
+            future.set_exception(ValueError(
+                'Batch response has {0} results for {1} calls.'
+                .format(len(responses), len(calls))))
+            continue
+        try:
+            result = _batch_result(responses[index], client._decoder)
+        except Exception as exc:  # pylint: disable=broad-except
+            future.set_exception(exc)
+            continue
+        if key is not None:
+            client._cache.set(key, result)
+        future.set_result(result)
+
+
+class Batch(object):
+    """API calls packed into requests to the batch endpoint.
+
+    Queued calls are sent once `size` of them are waiting, or `linger`
+    seconds after the first one, whichever comes first. Up to `workers`
+    batch requests are in flight at once; queueing more calls blocks.
+    """
+
+    def __init__(self, client, size=DEFAULT_BATCH_SIZE,
+                 linger=DEFAULT_LINGER, workers=DEFAULT_WORKERS):
+        """Initialise the batch."""
+        if size < 1:
+            raise ValueError('A batch needs room for at least one call.')
+        self.size = size
+        self.linger = linger
+        self._client = client
+        self._lock = threading.Condition()
+        self._calls = []
+        self._timer = None
+        self._slots = threading.BoundedSemaphore(workers)
+        self._sending = 0
+        self._closed = False
+
+    def api(self, name, url, **kwargs):
+        """Queue an API call, returning a `Future` of its result."""
+        path, key, result = self._client._batch_call(name, url, **kwargs)
+        future = Future()
+        if result is not None:
+            future.set_result(result)
+            return future
+        with self._lock:
+            if self._closed:
+                raise ValueError('The batch is closed.')
+            self._calls.append((path, key, future))
+            calls = None
+            if len(self._calls) >= self.size:
+                calls = self._take()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.linger, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if calls:
+            self._dispatch(calls)
+        return future
+
+    def _take(self):
+        """Take the queued calls; called with the lock held."""
+        calls, self._calls = self._calls, []
+        if calls:
+            self._sending += 1
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return calls
+
+    def flush(self):
+        """Send the queued calls now."""
+        with self._lock:
+            calls = self._take()
+        if calls:
+            self._dispatch(calls)
+
+    def _dispatch(self, calls):
+        """Send a batch request in a new thread."""
+        self._slots.acquire()
+        thread = threading.Thread(target=self._send, args=(calls,))
+        thread.daemon = True
+        thread.start()
+
+    def _send(self, calls):
+        """Send a batch request, and resolve the futures of its calls."""
+        client = self._client
+        try:
+            try:
+                responses = client._post_batch([path for path, _, _ in calls])
+            except Exception as exc:  # pylint: disable=broad-except
+                for _, _, future in calls:
+                    future.set_exception(exc)
+                return
+            _settle_batch(client, calls, responses)
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._sending -= 1
+                self._lock.notify_all()
+
+    def close(self):
+        """Send the queued calls, and wait for all batch requests."""
+        with self._lock:
+            self._closed = True
+        self.flush()
+        with self._lock:
+            while self._sending:
+                self._lock.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 
 class Client(object):
@@ -24,108 +1574,454 @@ class Client(object):
     _apis = frozenset(('article', 'frontpage', 'product', 'image', 'analyze',
                        'discussion'))
 
-    def __init__(self, token, version=API_VERSION):
-        """Initialise the client."""
+    def __init__(self, token, version=API_VERSION, pool=None,
+                 pool_size=DEFAULT_POOL_SIZE, keep_alive=True, cache=None,
+                 single_flight=False, rate_limiter=None, controller=None,
+                 retry=None, decoder=None, compress=False,
+                 canonicalize=False, hooks=()):
+        """Initialise the client.
+
+        Each client gets its own connection pool, unless a shared `Pool` is
+        passed in. A shared pool is not closed when the client is closed.
+
+        If a `Cache` is passed in, API results are looked up there first.
+        With `single_flight` set, identical API calls made concurrently from
+        several threads share a single HTTP request.
+
+        Requests wait for a `RateLimiter` and a `ConcurrencyController`, if
+        given. Both can be shared between clients. Failed requests are
+        retried according to `retry`, a `RetryPolicy`.
+
+        JSON responses are decoded with `decoder`, if given, e.g. the one
+        returned by `fast_decoder()`.
+
+        With `compress` set, large `text` and `html` uploads are sent
+        gzip-encoded.
+
+        With `canonicalize` set, URLs are passed through `canonicalize_url`
+        (or `canonicalize`, if it is a function) before they are sent.
+
+        Each HTTP request is reported to the `Hooks` in `hooks`, e.g. a
+        `Metrics` collector.
+        """
         self._token = token
         self._version = version
+        self._cache = cache
+        self._flights = SingleFlight() if single_flight else None
+        self._limiter = rate_limiter
+        self._controller = controller
+        self._retry = retry
+        self._decoder = decoder
+        self._compress = compress
+        if canonicalize is True:
+            canonicalize = canonicalize_url
+        self._canonicalize = canonicalize or None
+        self._hooks = tuple(hooks)
+        self._owns_pool = pool is None
+        if pool is None:
+            pool = Pool(size=pool_size, keep_alive=keep_alive)
+        self._pool = pool
 
-    @staticmethod
-    def _get(url, params=None):
-        """HTTP GET request."""
-        try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            # If JSON fails, return raw data
-            # (e.g. when downloading CSV job logs).
+    @property
+    def pool(self):
+        """The connection pool used by this client."""
+        return self._pool
+
+    def close(self):
+        """Close the connection pool, unless it is shared."""
+        if self._owns_pool:
+            self._pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _transport(self):
+        """Transport options to pass on to jobs created by this client."""
+        return {
+            'pool': self._pool,
+            'rate_limiter': self._limiter,
+            'controller': self._controller,
+            'retry': self._retry,
+            'decoder': self._decoder,
+            'hooks': self._hooks,
+        }
+
+    def _send(self, func, *args, **kwargs):
+        """Make an HTTP request, retrying it according to the policy.
+
+        Only requests sent with `hedge` set (idempotent API calls) are
+        hedged.
+        """
+        hedge = kwargs.pop('hedge', False)
+        retry = self._retry
+        if retry is None:
+            return self._attempt(func, *args, **kwargs)
+        deadline = retry.deadline and time.time() + retry.deadline
+        attempt = 0
+        while True:
+            if deadline:
+                remaining = deadline - time.time()
+                kwargs['timeout'] = remaining
+                params = kwargs.get('params')
+                if params and 'timeout' in params:
+                    kwargs['params'] = dict(params, timeout=min(
+                        int(params['timeout']), int(remaining * 1000)))
+            start = time.time()
             try:
-                return response.json()
-            except ValueError:
-                return response.text
-        except NameError:
-            url = '{0}?{1}'.format(url, urllib.urlencode(params))
-            return json.loads(urllib2.urlopen(url).read().decode(ENCODING))
+                delay = hedge and retry.hedge_delay() or None
+                if delay is None:
+                    result = self._attempt(func, *args, attempt=attempt,
+                                           **kwargs)
+                else:
+                    result = self._hedge(delay, func, *args, attempt=attempt,
+                                         **kwargs)
+            except Exception as exc:  # pylint: disable=broad-except
+                attempt += 1
+                if attempt >= retry.attempts or not retry.retryable(exc):
+                    raise
+                pause = retry.delay(attempt)
+                if deadline and time.time() + pause >= deadline:
+                    raise
+                time.sleep(pause)
+            else:
+                if hedge:
+                    retry.record(time.time() - start)
+                return result
+
+    def _hedge(self, delay, func, *args, **kwargs):
+        """Make an HTTP request, and a duplicate if it takes too long.
+
+        Returns the first successful response, or raises the last error if
+        both requests fail. A losing `Stream` is closed.
+        """
+        outcome = Future()
+        lock = threading.Lock()
+        started = []
+        failed = []
+
+        def attempt():
+            try:
+                result = self._attempt(func, *args, **kwargs)
+            except Exception as exc:  # pylint: disable=broad-except
+                with lock:
+                    failed.append(exc)
+                    if len(failed) == len(started):
+                        outcome.set_exception(exc)
+                return
+            with lock:
+                if not outcome.done():
+                    outcome.set_result(result)
+                    return
+            if isinstance(result, Stream):
+                result.close()
+
+        for _ in range(2):
+            with lock:
+                if outcome.done():
+                    break
+                started.append(threading.Thread(target=attempt))
+                started[-1].daemon = True
+                started[-1].start()
+            if outcome.wait(delay):
+                break
+        return outcome.result()
+
+    def _attempt(self, func, *args, **kwargs):
+        """Make an HTTP request, subject to rate and concurrency limits.
+
+        `attempt` counts the earlier tries, as reported to the hooks.
+        """
+        attempt = kwargs.pop('attempt', 0)
+        if self._hooks:
+            return self._observe(attempt, func, *args, **kwargs)
+        return self._limited(func, *args, **kwargs)
+
+    def _observe(self, attempt, func, url, *args, **kwargs):
+        """Make an HTTP request, reporting it to the hooks."""
+        root = self.endpoint('')
+        if url.startswith(root):
+            api = url[len(root):].split('/', 1)[0]
+        else:
+            api = url
+        call = kwargs['call'] = Call(api, url, kwargs.get('params'), attempt)
+        hooks = self._hooks
+        for hook in hooks:
+            hook.before_request(call)
+
+        def send(*send_args, **send_kwargs):
+            call.sent = time.time()
+            return func(*send_args, **send_kwargs)
 
-    @staticmethod
-    def _post(url, data, content_type, params=None):
-        """HTTP POST request."""
         try:
-            response = requests.post(url, params=params, data=data, headers={
-                'Content-Type': content_type,
-            })
-            response.raise_for_status()
-            return response.json()
-        except NameError:
-            url = '{0}?{1}'.format(url, urllib.urlencode(params))
-            req = urllib2.Request(url, data.encode(ENCODING), {
-                'Content-Type': content_type,
-            })
-            return json.loads(urllib2.urlopen(req).read().decode(ENCODING))
+            result = self._limited(send, url, *args, **kwargs)
+        except Exception as exc:
+            call.finished = time.time()
+            if call.status is None:
+                call.status = _status_code(exc)
+            for hook in hooks:
+                hook.on_error(call, exc)
+            raise
+        call.finished = time.time()
+        for hook in hooks:
+            hook.after_response(call)
+        return result
+
+    def _limited(self, func, *args, **kwargs):
+        """Make an HTTP request, subject to rate and concurrency limits."""
+        if self._limiter is not None:
+            self._limiter.acquire()
+        if self._controller is None:
+            return func(*args, **kwargs)
+        self._controller.acquire()
+        overloaded = False
+        try:
+            return func(*args, **kwargs)
+        except Exception as exc:
+            overloaded = _overloaded(exc)
+            raise
+        finally:
+            self._controller.release(overloaded)
+
+    def _get(self, url, params=None, hedge=False):
+        """HTTP GET request, hedged if `hedge` is set."""
+        return self._send(self._pool.get, url, params=params,
+                          decoder=self._decoder, hedge=hedge)
+
+    def _post(self, url, data, content_type, params=None):
+        """HTTP POST request."""
+        return self._send(self._pool.post, url, data, content_type,
+                          params=params, decoder=self._decoder,
+                          compress=self._compress)
+
+    def _batch_call(self, name, url, **kwargs):
+        """Prepare an API call for the batch endpoint.
+
+        Returns its path relative to the API root, its cache key (or `None`)
+        and its cached result (or `None`).
+        """
+        endpoint, params, data, _ = self._prepare(name, url, **kwargs)
+        if data is not None:
+            raise ValueError('Only GET calls can be batched, not `text` or '
+                             '`html` uploads.')
+        key = result = None
+        if self._cache is not None:
+            key = self._key(name, params, data)
+            result = self._cache.get(key)
+        return _urlencode(endpoint[len(API_ROOT):], params), key, result
+
+    def _batch_form(self, paths):
+        """The form to POST to the batch endpoint, for the given paths."""
+        import urllib
+        batch = json.dumps([{'method': 'GET', 'relative_url': path}
+                            for path in paths])
+        return urllib.urlencode({'token': self._token, 'batch': batch})
+
+    def _post_batch(self, paths):
+        """POST GET requests for the given paths to the batch endpoint."""
+        return self._send(self._pool.post, self.endpoint('batch'),
+                          self._batch_form(paths),
+                          'application/x-www-form-urlencoded',
+                          compress=self._compress)
+
+    def _stream(self, url, params=None, headers=None):
+        """Streamed HTTP GET request."""
+        return self._send(self._pool.stream, url, params=params,
+                          headers=headers)
 
     def endpoint(self, name):
         """Generate the URL endpoint for the given API."""
         return '{0}/v{1}/{2}'.format(API_ROOT, self._version, name)
 
-    def api(self, name, url, **kwargs):
-        """Generic API method."""
+    def _canonical(self, url):
+        """Canonicalize `url`, if enabled."""
+        if self._canonicalize is None:
+            return url
+        return self._canonicalize(url)
+
+    def _check_api(self, name):
+        """Make sure that `name` is a valid API name."""
         if name not in self._apis:
             raise ValueError('API name must be one of {0}, not {1!r}.'.format(
                 tuple(self._apis), name))
+
+    def _prepare(self, name, url, **kwargs):
+        """Validate the arguments of an API call.
+
+        Returns the endpoint URL, the query parameters, and the data and
+        content type to POST, the latter two being `None` for GET requests.
+        """
+        self._check_api(name)
         fields = kwargs.get('fields')
         timeout = kwargs.get('timeout')
         text = kwargs.get('text')
         html = kwargs.get('html')
         if text and html:
             raise ValueError(u'Both `text` and `html` arguments provided!')
-        params = {'url': url, 'token': self._token}
+        params = {'url': self._canonical(url), 'token': self._token}
         if timeout:
             params['timeout'] = timeout
         if fields:
             if not isinstance(fields, str):
                 fields = ','.join(sorted(fields))
             params['fields'] = fields
-        url = self.endpoint(name)
+        data = content_type = None
         if text or html:
+            data = text or html
             content_type = html and 'text/html' or 'text/plain'
-            return self._post(url, text or html, content_type, params=params)
-        return self._get(url, params=params)
+        return self.endpoint(name), params, data, content_type
+
+    def _key(self, name, params, data):
+        """Cache key for an API call, as returned by `_prepare`."""
+        fields = params.get('fields')
+        if fields:
+            fields = ','.join(sorted(set(fields.split(','))))
+        if data is not None:
+            import hashlib
+            data = hashlib.sha1(_body(data)).hexdigest()
+        return json.dumps([name, params['url'], self._version, fields,
+                           params.get('timeout'), data])
+
+    def _call(self, url, params, data, content_type):
+        """Make the HTTP request for an API call."""
+        if data is not None:
+            return self._post(url, data, content_type, params=params)
+        return self._get(url, params=params, hedge=True)
+
+    def _fetch(self, key, url, params, data, content_type):
+        """Make the HTTP request for an API call and cache the result."""
+        result = self._call(url, params, data, content_type)
+        if self._cache is not None:
+            self._cache.set(key, result)
+        return result
+
+    def api(self, name, url, **kwargs):
+        """Generic API method."""
+        url, params, data, content_type = self._prepare(name, url, **kwargs)
+        if self._cache is None and self._flights is None:
+            return self._call(url, params, data, content_type)
+        key = self._key(name, params, data)
+        if self._cache is not None:
+            result = self._cache.get(key)
+            if result is not None:
+                return result
+        if self._flights is None:
+            return self._fetch(key, url, params, data, content_type)
+        return self._flights.do(key, self._fetch, key, url, params, data,
+                                content_type)
+
+    def api_many(self, name, urls, workers=DEFAULT_WORKERS, ordered=False,
+                 dedupe=None, **kwargs):
+        """Generic API method for many URLs.
+
+        Calls the API for each URL in `urls` using a pool of `workers`
+        threads, all sharing this client's connection pool. Returns a
+        generator of `(url, result)` pairs, in completion order, or in input
+        order if `ordered` is set. Failed calls don't stop the batch, their
+        result is the exception that was raised.
+
+        URLs already in `dedupe`, a `DedupIndex` or `BloomFilter`, are
+        skipped. Pass `True` for a new `DedupIndex`.
+        """
+        self._check_api(name)
+        if dedupe is True:
+            dedupe = DedupIndex()
+        if dedupe is not None:
+            urls = (url for url in urls if dedupe.add(self._canonical(url)))
+        return _parallel(functools.partial(self.api, name, **kwargs), urls,
+                         workers=workers, ordered=ordered)
 
     def article(self, url, **kwargs):
         """Article API."""
         return self.api('article', url, **kwargs)
 
+    def article_many(self, urls, **kwargs):
+        """Article API for many URLs."""
+        return self.api_many('article', urls, **kwargs)
+
     def frontpage(self, url, **kwargs):
         """Frontpage API."""
         return self.api('frontpage', url, **kwargs)
 
+    def frontpage_many(self, urls, **kwargs):
+        """Frontpage API for many URLs."""
+        return self.api_many('frontpage', urls, **kwargs)
+
     def product(self, url, **kwargs):
         """Product API."""
         return self.api('product', url, **kwargs)
 
+    def product_many(self, urls, **kwargs):
+        """Product API for many URLs."""
+        return self.api_many('product', urls, **kwargs)
+
     def image(self, url, **kwargs):
         """Image API."""
         return self.api('image', url, **kwargs)
 
+    def image_many(self, urls, **kwargs):
+        """Image API for many URLs."""
+        return self.api_many('image', urls, **kwargs)
+
     def analyze(self, url, **kwargs):
         """Classifier (analyze) API."""
         return self.api('analyze', url, **kwargs)
 
+    def analyze_many(self, urls, **kwargs):
+        """Classifier (analyze) API for many URLs."""
+        return self.api_many('analyze', urls, **kwargs)
+
     def discussion(self, url, **kwargs):
         """Discussion API."""
         return self.api('discussion', url, **kwargs)
 
+    def discussion_many(self, urls, **kwargs):
+        """Discussion API for many URLs."""
+        return self.api_many('discussion', urls, **kwargs)
+
+    def batch(self, size=DEFAULT_BATCH_SIZE, linger=DEFAULT_LINGER,
+              workers=DEFAULT_WORKERS):
+        """Return a `Batch`, to make many API calls in few requests.
+
+        Use it as a context manager, so that the last calls get sent:
+
+            with client.batch() as batch:
+                futures = [batch.api('article', url) for url in urls]
+            results = [future.result() for future in futures]
+        """
+        return Batch(self, size, linger, workers)
+
+    def job_manager(self, names=(), on_change=None):
+        """Create a `JobManager` for monitoring crawl jobs."""
+        return JobManager(self, names, on_change=on_change)
+
+    def _seeds(self, urls):
+        """Canonical crawl seeds, without duplicates.
+
+        `urls` is a list, or a string of whitespace-separated URLs.
+        """
+        if not isinstance(urls, (list, tuple)):
+            urls = urls.split()
+        seeds = DedupIndex()
+        return [url for url in map(self._canonical, urls) if seeds.add(url)]
+
     def crawl(self, urls, name='crawl', api='analyze', **kwargs):
         """Crawlbot API.
 
-        Returns a diffbot.Job object to check and retrieve crawl status.
+        Returns a diffbot.Job object to check and retrieve crawl status,
+        with the status returned on creation as its first `snapshot`.
+
+        Submissions too long for a query string (e.g. with many seeds) are
+        POSTed as a form instead.
         """
-        # If multiple seed URLs are specified, join with whitespace.
-        if isinstance(urls, list):
-            urls = ' '.join(urls)
         url = self.endpoint('crawl')
         process_url = self.endpoint(api)
         params = {
             'token': self._token,
-            'seeds': urls,
+            # If multiple seed URLs are specified, join with whitespace.
+            'seeds': ' '.join(self._seeds(urls)),
             'name': name,
             'apiUrl': process_url,
         }
@@ -134,9 +2030,142 @@ class Client(object):
         params['maxToCrawl'] = 10
         params.update(kwargs)
 
-        self._get(url, params=params)
+        import urllib
+        query = urllib.urlencode(params)
+        if len(query) > MAX_QUERY_LENGTH:
+            res = self._send(self._pool.post, url, query,
+                             'application/x-www-form-urlencoded',
+                             compress=self._compress)
+        else:
+            res = self._get(url, params=params)
+
+        job = Job(self._token, name, self._version, **self._transport())
+        for status in res.get('jobs') or ():
+            if status.get('name') == name:
+                job._update(status)
+                break
+        return job
+
+    def split_seeds(self, urls, name, seeds_per_job=DEFAULT_SEEDS_PER_JOB):
+        """Split crawl seeds between jobs of at most `seeds_per_job` seeds.
+
+        Returns `(name, seeds)` pairs, to pass to `crawl_many`. The jobs are
+        named `name-0`, `name-1`, etc., unless a single job is enough.
+        """
+        seeds = self._seeds(urls)
+        if len(seeds) <= seeds_per_job:
+            return [(name, seeds)]
+        return [('{0}-{1}'.format(name, index),
+                 seeds[start:start + seeds_per_job])
+                for index, start in enumerate(
+                    range(0, len(seeds), seeds_per_job))]
+
+    def crawl_many(self, crawls, workers=DEFAULT_WORKERS, **kwargs):
+        """Start many crawl jobs concurrently.
+
+        `crawls` maps job names to their seeds, as a dict or `(name, urls)`
+        pairs. `kwargs` are passed on to `crawl` for each job. Returns a
+        generator of `(name, job)` pairs, in completion order. A failed
+        submission doesn't stop the others, its job is the exception that
+        was raised.
+        """
+        if isinstance(crawls, dict):
+            crawls = crawls.items()
+        results = _parallel(lambda crawl: self.crawl(crawl[1], crawl[0],
+                                                     **kwargs),
+                            crawls, workers=workers)
+        return ((crawl[0], job) for crawl, job in results)
+
+
+# Crawl job status codes.
+FINISHED_CODES = frozenset((1, 2, 3, 4, 5, 9))
+RUNNING_CODES = frozenset((0, 6, 7, 8))
+
+
+def _record_key(record):
+    """The identity of a crawl record: its Diffbot URI or page URL."""
+    return record.get('diffbotUri') or record.get('pageUrl') or \
+        record.get('resolvedPageUrl')
+
 
-        return Job(self._token, name, self._version)
+class SyncCheckpoint(object):
+    """The records seen by `Job.sync`, stored in an SQLite database.
+
+    Each record key is stored with a hash of the record's content, and the
+    number of the last sync that saw it. Updates are written in batches of
+    `batch_size` records.
+    """
+
+    def __init__(self, path, batch_size=1000):
+        """Open the checkpoint, creating the database if needed."""
+        import sqlite3
+        self.batch_size = batch_size
+        self._pending = {}
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS records ('
+                             'key TEXT PRIMARY KEY, hash TEXT, '
+                             'generation INTEGER)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS syncs ('
+                             'generation INTEGER PRIMARY KEY, '
+                             'started REAL, finished REAL)')
+
+    def __len__(self):
+        self.flush()
+        return self._db.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def begin(self):
+        """Start a sync, returning its number."""
+        with self._db:
+            return self._db.execute('INSERT INTO syncs (started) VALUES (?)',
+                                    (time.time(),)).lastrowid
+
+    def changed(self, key, digest):
+        """Return whether a record is new, or its hash is not `digest`."""
+        if key in self._pending:
+            return self._pending[key][0] != digest
+        row = self._db.execute('SELECT hash FROM records WHERE key = ?',
+                               (key,)).fetchone()
+        return row is None or row[0] != digest
+
+    def update(self, key, digest, generation):
+        """Record that sync `generation` saw a record."""
+        self._pending[key] = (digest, generation)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the pending updates."""
+        if not self._pending:
+            return
+        with self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO records VALUES (?, ?, ?)',
+                [(key, digest, generation) for key, (digest, generation)
+                 in self._pending.items()])
+        self._pending.clear()
+
+    def finish(self, generation):
+        """Mark sync `generation` as complete."""
+        self.flush()
+        with self._db:
+            self._db.execute('UPDATE syncs SET finished = ? '
+                             'WHERE generation = ?', (time.time(), generation))
+
+    def removed(self):
+        """Return the keys missing from the last complete sync."""
+        self.flush()
+        row = self._db.execute('SELECT MAX(generation) FROM syncs '
+                               'WHERE finished IS NOT NULL').fetchone()
+        if row[0] is None:
+            return []
+        return [key for key, in self._db.execute(
+            'SELECT key FROM records WHERE generation < ?', (row[0],))]
+
+    def close(self):
+        """Write the pending updates, and close the database."""
+        self.flush()
+        self._db.close()
 
 
 class Job(Client):
@@ -145,17 +2174,43 @@ class Job(Client):
     This is used to check crawl status once a crawl job was started.
     """
 
-    def __init__(self, token, name, version=API_VERSION):
-        Client.__init__(self, token, version)
+    # Seconds for which `is_finished` and `is_running` reuse a status.
+    status_max_age = 1.0
+
+    # Job status counters used to detect progress while waiting.
+    progress_counters = ('pageCrawlAttempts', 'pageCrawlSuccesses',
+                         'pageProcessAttempts', 'pageProcessSuccesses',
+                         'objectsFound', 'urlsHarvested')
+
+    def __init__(self, token, name, version=API_VERSION, **kwargs):
+        Client.__init__(self, token, version, **kwargs)
         self._name = name
         self._url = self.endpoint('crawl')
+        self._snapshot = None
+        self._snapshot_time = None
+
+    @property
+    def name(self):
+        """Name of the crawl job."""
+        return self._name
+
+    @property
+    def snapshot(self):
+        """The last job status fetched, or `None`."""
+        return self._snapshot
+
+    def _update(self, job):
+        """Store a freshly fetched job status."""
+        self._snapshot = job
+        self._snapshot_time = time.time()
+        return job
 
     def control(self, **kwargs):
         params = {'token': self._token, 'name': self._name}
         params.update(kwargs)
         res = self._get(self._url, params)
         job = next(j for j in res['jobs'] if j['name'] == self._name)
-        return job
+        return self._update(job)
 
     def pause(self):
         return self.control(pause=1)
@@ -169,27 +2224,526 @@ class Job(Client):
     def delete(self):
         return self.control(delete=1)
 
-    def status(self):
+    def status(self, max_age=None):
+        """Fetch the job status.
+
+        If `max_age` is given, the last status is reused if it was fetched
+        less than `max_age` seconds ago.
+        """
+        if max_age is not None and self._snapshot is not None and \
+                time.time() - self._snapshot_time < max_age:
+            return self._snapshot
         return self.control()
 
-    def status_code(self):
-        response = self.status()
+    def status_code(self, max_age=None):
+        response = self.status(max_age)
         return response['jobStatus']['status']
 
     def is_finished(self):
-        status_code = self.status_code()
-        finished_codes = [1, 2, 3, 4, 5, 9]
-        return status_code in finished_codes
+        return self.status_code(self.status_max_age) in FINISHED_CODES
 
     def is_running(self):
-        status_code = self.status_code()
-        running_codes = [0, 6, 7, 8]
-        return status_code in running_codes
+        return self.status_code(self.status_max_age) in RUNNING_CODES
+
+    def wait(self, timeout=None, on_progress=None, interval=1.0,
+             max_interval=60.0):
+        """Wait for the job to finish, returning its last status.
+
+        The status is polled every `interval` seconds at first. The interval
+        is halved when the job's counters changed since the previous poll,
+        and doubled (up to `max_interval`) when they didn't. Each status is
+        passed to `on_progress`, if given.
+
+        If `timeout` seconds pass before the job finishes, the last status
+        is returned anyway.
+        """
+        min_interval = interval
+        deadline = None if timeout is None else time.time() + timeout
+        progress = None
+        while True:
+            job = self.status()
+            if on_progress is not None:
+                on_progress(job)
+            if job['jobStatus']['status'] in FINISHED_CODES:
+                return job
+            counters = tuple(job.get(key) for key in self.progress_counters)
+            if progress is not None and counters != progress:
+                interval = max(min_interval, interval / 2.0)
+            elif progress is not None:
+                interval = min(max_interval, interval * 2)
+            progress = counters
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return job
+                time.sleep(min(interval, remaining))
+            else:
+                time.sleep(interval)
+
+    def _download_url(self, format):
+        """URL of the crawl results in the given format."""
+        return '{0}/download/{1}-{2}_data.{3}'.format(
+            self._url, self._token, self._name, format)
 
     def download(self, format='json'):
-        download_url = '{0}/download/{1}-{2}_data.{3}'\
-            .format(self._url, self._token, self._name, format)
-        return self._get(download_url)
+        return self._get(self._download_url(format))
+
+    def iter_download(self, format='json'):
+        """Stream the crawl results, yielding one record at a time.
+
+        JSON records are yielded as parsed objects, CSV records as dicts
+        keyed by the column names. Only the record being parsed is kept in
+        memory, no matter how large the download is.
+        """
+        if format not in ('json', 'csv'):
+            raise ValueError('Format must be one of {0}, not {1!r}.'.format(
+                ('json', 'csv'), format))
+        stream = self._stream(self._download_url(format))
+        if format == 'csv':
+            return _iter_csv(stream)
+        return _iter_json_array(stream)
+
+    def sync(self, checkpoint, format='json', key=_record_key, ignore=()):
+        """Stream the crawl results, yielding only new and changed records.
+
+        `checkpoint` is a `SyncCheckpoint` (or the path of one), holding
+        the `key` and a content hash of each record seen before. Fields in
+        `ignore` (e.g. timestamps) are left out of the hash. A record is
+        checkpointed once the next one is asked for, so records from an
+        interrupted sync are yielded again by the next one.
+        """
+        import hashlib
+        opened = not isinstance(checkpoint, SyncCheckpoint)
+        if opened:
+            checkpoint = SyncCheckpoint(checkpoint)
+        ignore = frozenset(ignore)
+        try:
+            generation = checkpoint.begin()
+            for record in self.iter_download(format):
+                content = record
+                if ignore:
+                    content = dict((field, value) for field, value
+                                   in record.items() if field not in ignore)
+                digest = hashlib.sha1(json.dumps(
+                    content, sort_keys=True, separators=(',', ':')
+                ).encode(ENCODING)).hexdigest()
+                record_key = key(record) or digest
+                if checkpoint.changed(record_key, digest):
+                    yield record
+                checkpoint.update(record_key, digest, generation)
+            checkpoint.finish(generation)
+        finally:
+            if opened:
+                checkpoint.close()
+
+    def download_to(self, path, format='json', attempts=3, hash='sha256',
+                    expected_hash=None):
+        """Download the crawl results to a file, in chunks.
+
+        Data is written to `path + '.part'` first. If that file exists,
+        the download resumes where it left off, using an HTTP Range request.
+        It starts over if the server doesn't support ranges, or if the file
+        changed since (e.g. the export of a repeat crawl was rewritten).
+        Interrupted downloads are resumed up to `attempts` times.
+
+        The size of the file is checked against the size reported by the
+        server, and its `hash` digest against `expected_hash`, if given.
+        Returns the hex digest of the file.
+        """
+        part = path + '.part'
+        url = self._download_url(format)
+        for attempt in range(1, attempts + 1):
+            try:
+                digest = self._download_part(url, part, hash)
+                break
+            except EnvironmentError as exc:
+                if attempt == attempts:
+                    raise
+                if _status_code(exc) == 416:
+                    # The partial file is invalid (e.g. the data changed).
+                    _remove_part(part)
+        if expected_hash is not None and digest != expected_hash:
+            _remove_part(part)
+            raise ValueError('Downloaded file has {0} {1}, not {2}.'.format(
+                hash, digest, expected_hash))
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(part, path)
+        _remove_part(part)
+        return digest
+
+    def _download_part(self, url, part, hash):
+        """Download or resume a partial file, returning its digest."""
+        import hashlib
+        checksum = hashlib.new(hash)
+        stream, offset, size = self._open_part(url, part)
+        with stream:
+            mode = offset and 'r+b' or 'wb'
+            with open(part, mode) as dst:
+                while offset:
+                    chunk = dst.read(min(offset, CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    checksum.update(chunk)
+                    offset -= len(chunk)
+                for chunk in stream:
+                    checksum.update(chunk)
+                    dst.write(chunk)
+                written = dst.tell()
+        if size is not None and written != size:
+            raise IOError('Incomplete download: got {0} of {1} bytes.'.format(
+                written, size))
+        return checksum.hexdigest()
+
+    def _open_part(self, url, part):
+        """Request the rest of a partial file, or all of it.
+
+        The range request is only honoured if the file is still the one the
+        partial file was cut from: its ETag or Last-Modified date, saved next
+        to the partial file, is sent as `If-Range`, and must match that of
+        the response, as must the `Content-Range`. Returns the stream, the
+        number of bytes of the partial file to keep, and the size of the
+        whole file.
+        """
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        validator, total = _read_part_info(part)
+        # Compressed transfers would make the sizes and ranges differ from
+        # those of the file on disk.
+        headers = {'Accept-Encoding': 'identity'}
+        if offset:
+            headers['Range'] = 'bytes={0}-'.format(offset)
+            if validator:
+                headers['If-Range'] = validator
+        stream = self._stream(url, headers=headers)
+        size = stream.headers.get('Content-Length')
+        size = None if size is None else int(size)
+        if offset and stream.status == 206:
+            start, whole = _content_range(stream.headers.get('Content-Range'))
+            current = _validator(stream.headers)
+            if start in (None, offset) and (
+                    None in (total, whole) or total == whole) and (
+                    None in (validator, current) or validator == current):
+                if whole is None and size is not None:
+                    whole = offset + size
+                return stream, offset, whole
+            # The range is of another file, e.g. a rewritten export.
+            stream.close()
+            del headers['Range']
+            headers.pop('If-Range', None)
+            stream = self._stream(url, headers=headers)
+            size = stream.headers.get('Content-Length')
+            size = None if size is None else int(size)
+        _write_part_info(part, _validator(stream.headers), size)
+        return stream, 0, size
+
+
+class JobManager(object):
+    """Monitor many crawl jobs at once.
+
+    Each poll fetches the list of all crawl jobs in one request, and passes
+    the status of each managed job to its `Job` object. Callbacks are
+    called as `callback(job, previous_code, code)` whenever the status code
+    of a job changes (`previous_code` is `None` the first time). A job
+    missing from the list, e.g. deleted or misspelled, is reported once
+    with a `code` of `None`, and listed in `missing`.
+    """
+
+    def __init__(self, client, names=(), on_change=None):
+        """Initialise the manager, adding the named jobs."""
+        self._client = client
+        self._url = client.endpoint('crawl')
+        self._jobs = {}
+        self._missing = set()
+        self._callbacks = []
+        for name in names:
+            self.add(name)
+        if on_change is not None:
+            self.on_change(on_change)
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def __iter__(self):
+        return iter(self._jobs.values())
+
+    def __getitem__(self, name):
+        return self._jobs[name]
+
+    def add(self, job):
+        """Add a `Job`, or the name of a job, returning the `Job`."""
+        if not isinstance(job, Job):
+            job = Job(self._client._token, job, self._client._version,
+                      **self._client._transport())
+        self._jobs[job.name] = job
+        return job
+
+    def remove(self, name):
+        """Stop monitoring a job."""
+        del self._jobs[name]
+        self._missing.discard(name)
+
+    @property
+    def missing(self):
+        """The jobs missing from the job list at the last poll."""
+        return [self._jobs[name] for name in sorted(self._missing)]
+
+    def on_change(self, callback):
+        """Register a callback for status changes."""
+        self._callbacks.append(callback)
+
+    def poll(self):
+        """Fetch the status of all jobs, returning the jobs that changed."""
+        res = self._client._get(self._url, {'token': self._client._token})
+        statuses = dict((job['name'], job) for job in res['jobs'])
+        changed = []
+        for name, job in self._jobs.items():
+            status = statuses.get(name)
+            was_missing = name in self._missing
+            if status is None and was_missing:
+                continue
+            previous = None
+            if job.snapshot is not None and not was_missing:
+                previous = job.snapshot['jobStatus']['status']
+            if status is None:
+                self._missing.add(name)
+                code = None
+            else:
+                self._missing.discard(name)
+                job._update(status)
+                code = status['jobStatus']['status']
+            if code != previous or status is None:
+                changed.append(job)
+                for callback in self._callbacks:
+                    callback(job, previous, code)
+        return changed
+
+    def wait(self, timeout=None, interval=10.0):
+        """Poll until all jobs are finished, or `timeout` seconds pass.
+
+        Returns the jobs that are not finished yet. Jobs missing from the
+        job list are not waited for; see `missing`.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            self.poll()
+            pending = [job for name, job in self._jobs.items()
+                       if name not in self._missing and
+                       job.snapshot['jobStatus']['status'] not in
+                       FINISHED_CODES]
+            if not pending:
+                return pending
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return pending
+                time.sleep(min(interval, remaining))
+            else:
+                time.sleep(interval)
+
+
+# How often a `ProcessRunner` checks for dead worker processes.
+_POLL_INTERVAL = 0.1
+
+
+def _call_spec(client, name, spec, kwargs):
+    """Call the API for a URL, or a dict with a `url` and API arguments."""
+    if isinstance(spec, dict):
+        kwargs = dict(kwargs, **spec)
+        spec = kwargs.pop('url')
+        name = kwargs.pop('api', name)
+    return client.api(name, spec, **kwargs)
+
+
+def _process_worker(token, options, limiter, threads, tasks, results):
+    """Run the API calls of shards, in a worker process of a runner."""
+    import pickle
+    if limiter is not None:
+        limiter = RateLimiter(*limiter)
+    client = Client(token, rate_limiter=limiter, **options)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            shard, name, items, kwargs = task
+            calls = _parallel(
+                lambda item: _call_spec(client, name, item[1], kwargs),
+                items, workers=threads)
+            for (index, spec), result in calls:
+                if isinstance(result, Exception):
+                    try:
+                        pickle.dumps(result)
+                    except Exception:  # pylint: disable=broad-except
+                        code = _status_code(result)
+                        result = EnvironmentError(str(result))
+                        result.code = code
+                results.put((shard, index, spec, result))
+            results.put((shard, None, None, None))
+    finally:
+        client.close()
+
+
+class ProcessRunner(object):
+    """Run API calls in several processes, each with its own `Client`.
+
+    Threads in one process share a single core, so decoding responses limits
+    their throughput. The runner splits the input into shards of
+    `shard_size` URLs, and hands them out to `processes` worker processes
+    (one per CPU by default), which make the calls using `threads` threads.
+
+    `options` are passed on to the clients. A `rate_limiter` is shared by
+    all processes, so it must have a `path`. If a worker process dies, the
+    unfinished calls of its shards are handed out again, up to `restarts`
+    times; after that, their result is a `RuntimeError`.
+    """
+
+    def __init__(self, token, processes=None, threads=DEFAULT_WORKERS,
+                 shard_size=100, rate_limiter=None, restarts=3, **options):
+        """Initialise the runner."""
+        if rate_limiter is not None and rate_limiter.path is None:
+            raise ValueError('A rate limiter shared between processes needs '
+                             'a path.')
+        self._token = token
+        self._processes = processes
+        self._threads = threads
+        self._shard_size = shard_size
+        self._limiter = rate_limiter and (
+            rate_limiter.rate, rate_limiter.burst, rate_limiter.path)
+        self._restarts = restarts
+        self._options = options
+
+    def api_many(self, name, urls, ordered=False, **kwargs):
+        """Generic API method for many URLs, like `Client.api_many`.
+
+        Items of `urls` can also be dicts with a `url` and API arguments,
+        like in the command line tool's batch mode. Returns a generator of
+        `(url, result)` pairs.
+        """
+        if name not in Client._apis:
+            raise ValueError('API name must be one of {0}, not {1!r}.'.format(
+                tuple(Client._apis), name))
+        return self._run(name, urls, ordered, kwargs)
+
+    def _run(self, name, urls, ordered, kwargs):
+        """Hand out shards to the workers, and yield their results."""
+        import itertools
+        import multiprocessing
+        import Queue
+        results = multiprocessing.Queue()
+        workers = {}  # Process -> (task queue, list of shard ids)
+        shards = {}  # Shard id -> [items by index, restarts]
+        retry = collections.deque()  # Ids of shards to hand out again.
+        ids = itertools.count()
+        source = enumerate(urls)
+        done = {}  # Results waiting to be yielded, in ordered mode.
+        position = [0, 0]  # Items read and yielded (in ordered mode).
+        window = 4 * self._shard_size * (
+            self._processes or multiprocessing.cpu_count())
+
+        def next_shard():
+            if retry:
+                return retry.popleft()
+            if ordered and position[0] - position[1] >= window:
+                return None
+            items = dict((index, spec) for index, spec in
+                         itertools.islice(source, self._shard_size))
+            if not items:
+                return None
+            position[0] += len(items)
+            shard = next(ids)
+            shards[shard] = [items, 0]
+            return shard
+
+        def assign():
+            for queue, assigned in workers.values():
+                while len(assigned) < 2:
+                    shard = next_shard()
+                    if shard is None:
+                        return
+                    assigned.append(shard)
+                    queue.put((shard, name, sorted(shards[shard][0].items()),
+                               kwargs))
+
+        def start():
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=_process_worker,
+                args=(self._token, self._options, self._limiter,
+                      self._threads, queue, results))
+            process.daemon = True
+            process.start()
+            workers[process] = queue, []
+
+        def recover():
+            lost = []
+            for process, (_, assigned) in list(workers.items()):
+                if process.is_alive():
+                    continue
+                del workers[process]
+                start()
+                for shard in assigned:
+                    if shard not in shards:
+                        continue
+                    shards[shard][1] += 1
+                    if shards[shard][1] <= self._restarts:
+                        retry.append(shard)
+                        continue
+                    for index, spec in shards.pop(shard)[0].items():
+                        lost.append((index, spec, RuntimeError(
+                            'Worker process died.')))
+            return lost
+
+        def emit(index, spec, result):
+            url = spec['url'] if isinstance(spec, dict) else spec
+            if not ordered:
+                yield url, result
+                return
+            done[index] = url, result
+            while position[1] in done:
+                yield done.pop(position[1])
+                position[1] += 1
+
+        for _ in range(self._processes or multiprocessing.cpu_count()):
+            start()
+        checked = time.time()
+        try:
+            assign()
+            while shards:
+                try:
+                    message = results.get(timeout=_POLL_INTERVAL)
+                except Queue.Empty:
+                    message = None
+                if time.time() - checked >= _POLL_INTERVAL:
+                    checked = time.time()
+                    for lost in recover():
+                        for pair in emit(*lost):
+                            yield pair
+                    assign()
+                if message is None:
+                    continue
+                shard, index, spec, result = message
+                if shard not in shards:
+                    continue  # A late result of a shard handed out again.
+                items = shards[shard][0]
+                if index is not None:
+                    if items.pop(index, None) is not None:
+                        for pair in emit(index, spec, result):
+                            yield pair
+                    continue
+                if items:
+                    continue  # Done by a dead worker; handed out again.
+                del shards[shard]
+                for _, assigned in workers.values():
+                    if shard in assigned:
+                        assigned.remove(shard)
+                assign()
+        finally:
+            for process, (queue, _) in workers.items():
+                queue.put(None)
+            for process in workers:
+                process.join(_POLL_INTERVAL * 10)
+                if process.is_alive():
+                    process.terminate()
 
 
 def api(name, url, token, **kwargs):
@@ -227,8 +2781,104 @@ def discussion(url, token, **kwargs):
     return api('discussion', url, token, **kwargs)
 
 
+def _read_batch(src, skip, invalid):
+    """Read batch requests, one URL or JSON object per line.
+
+    Lines that are not valid requests are added to `invalid`, as error
+    records.
+    """
+    for line in src:
+        if isinstance(line, bytes):
+            line = line.decode(ENCODING)
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('{'):
+            try:
+                spec = json.loads(line)
+            except ValueError as exc:
+                invalid.append({'line': line,
+                                'error': 'Invalid JSON: {0}'.format(exc)})
+                continue
+            if 'url' not in spec:
+                invalid.append({'line': line, 'error': 'No "url" given.'})
+                continue
+        else:
+            spec = {'url': line}
+        if spec['url'] not in skip:
+            yield spec
+
+
+def _batch(args, fields):
+    """Run the command line tool in batch mode."""
+    import itertools
+    done = set()
+    if args.resume and args.output and os.path.exists(args.output):
+        end = 0
+        with open(args.output, 'rb') as src:
+            for line in src:
+                if not line.endswith(b'\n'):
+                    break  # Cut off by an interrupted run.
+                end += len(line)
+                try:
+                    record = json.loads(line.decode(ENCODING))
+                except ValueError:
+                    continue
+                if 'result' in record:
+                    done.add(record['url'])
+        # Drop a cut off last line, so that new results start on a new line.
+        with open(args.output, 'r+b') as dst:
+            dst.truncate(end)
+    if args.url == '-':
+        src = sys.stdin
+    else:
+        src = open(args.url, 'rb')
+    if args.output:
+        dst = open(args.output, args.resume and 'a' or 'w')
+    else:
+        dst = sys.stdout
+    # Error records of invalid lines, added while the requests are read.
+    invalid = collections.deque()
+    specs = _read_batch(src, done, invalid)
+    client = None
+    if args.processes > 1:
+        runner = ProcessRunner(args.token, processes=args.processes,
+                               threads=args.workers, pool_size=args.workers)
+        results = runner.api_many(args.api, specs, fields=fields)
+    else:
+        client = Client(args.token, pool_size=args.workers)
+        results = ((spec['url'], result) for spec, result in _parallel(
+            lambda spec: _call_spec(client, args.api, spec,
+                                    {'fields': fields}),
+            specs, workers=args.workers))
+    try:
+        # A last round, for the invalid lines after the last request.
+        for url, result in itertools.chain(results, [(None, None)]):
+            records = []
+            while invalid:
+                records.append(invalid.popleft())
+            if url is not None:
+                record = {'url': url}
+                if isinstance(result, Exception):
+                    record['error'] = str(result)
+                else:
+                    record['result'] = result
+                records.append(record)
+            for record in records:
+                dst.write(json.dumps(record, separators=(',', ':')) + '\n')
+            dst.flush()
+    finally:
+        if client is not None:
+            client.close()
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+
+
 def cli():
     """Command line tool."""
+    import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('api', help="""
         API to call.
@@ -237,6 +2887,7 @@ def cli():
     """)
     parser.add_argument('url', help="""
         URL to pass as the 'url' parameter.
+        In batch mode, a file with one URL or JSON request per line.
     """)
     parser.add_argument('token', help="""
         API key (token).
@@ -249,10 +2900,33 @@ def cli():
         File to read data from.
         Use '-' to read from STDIN.
     """)
+    parser.add_argument('-b', '--batch', help="""
+        Batch mode: read requests from the 'url' file (use '-' for STDIN).
+        Each line is a URL, or a JSON object with a 'url' and optionally
+        'api', 'fields' and other API arguments.
+        Results are written as JSON lines, as they complete.
+    """, action='store_true')
+    parser.add_argument('-w', '--workers', help="""
+        Number of concurrent requests in batch mode.
+    """, type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('-o', '--output', help="""
+        File to write batch results to, instead of STDOUT.
+    """)
+    parser.add_argument('-p', '--processes', help="""
+        Number of processes to spread batch mode requests over, each making
+        up to WORKERS concurrent requests.
+    """, type=int, default=1)
+    parser.add_argument('-r', '--resume', help="""
+        Skip URLs that already have a result in the OUTPUT file.
+    """, action='store_true')
     fields = text = html = None
     _args = parser.parse_args()
+    if _args.resume and not _args.output:
+        parser.error('--resume needs an --output file.')
     if _args.all:
         fields = '*'
+    if _args.batch:
+        return _batch(_args, fields)
     if _args.file == '-':
         text = sys.stdin.read()
     elif _args.file:
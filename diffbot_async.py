@@ -0,0 +1,279 @@
+"""Asyncio client for the Diffbot API (Python 3.6+)."""
+import asyncio
+import collections
+import functools
+import json
+
+from diffbot import (API_VERSION, Client, DedupIndex, DEFAULT_BATCH_SIZE,
+                     DEFAULT_LINGER, DEFAULT_POOL_SIZE, DEFAULT_WORKERS,
+                     ENCODING, _encode_post, _settle_batch)
+
+try:
+    import aiohttp
+except ImportError:
+    pass
+
+
+DEFAULT_CONCURRENCY = 100
+
+
+class AsyncClient(Client):
+    """Asyncio Diffbot client.
+
+    All API methods (`api`, `article`, `frontpage`, etc.) return
+    coroutines, and their `_many` variants asynchronous generators. Use it
+    with `async with`, or await `close`.
+    Requests go through `aiohttp` when it is installed; otherwise they are
+    run in the event loop's default executor using the blocking transport.
+    At most `concurrency` requests are in flight at any time.
+    """
+
+    def __init__(self, token, version=API_VERSION, pool=None,
+                 pool_size=DEFAULT_POOL_SIZE, keep_alive=True, cache=None,
+                 decoder=None, compress=False,
+                 concurrency=DEFAULT_CONCURRENCY):
+        """Initialise the client."""
+        Client.__init__(self, token, version, pool=pool,
+                        pool_size=pool_size, keep_alive=keep_alive,
+                        cache=cache, decoder=decoder, compress=compress)
+        self._concurrency = concurrency
+        self._keep_alive = keep_alive
+        self._semaphore = None
+        self._session = None
+
+    @property
+    def semaphore(self):
+        """Semaphore limiting the number of requests in flight."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        return self._semaphore
+
+    @property
+    def session(self):
+        """The shared `aiohttp.ClientSession`, created on first use.
+
+        Raises `NameError` when `aiohttp` is not available.
+        """
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self._concurrency,
+                force_close=not self._keep_alive)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def _request(self, method, url, params, data=None, headers=None):
+        """Make an HTTP request using aiohttp."""
+        async with self.session.request(method, url, params=params, data=data,
+                                        headers=headers) as response:
+            response.raise_for_status()
+            body = await response.text(encoding=ENCODING)
+        # If JSON fails, return raw data.
+        try:
+            return (self._decoder or json.loads)(body)
+        except ValueError:
+            return body
+
+    async def _get_async(self, url, params=None):
+        """Asynchronous HTTP GET request."""
+        try:
+            return await self._request('GET', url, params)
+        except NameError:
+            return await self._run(self._pool.get, url, params=params,
+                                   decoder=self._decoder)
+
+    async def _post_async(self, url, data, content_type, params=None):
+        """Asynchronous HTTP POST request."""
+        try:
+            body, headers = _encode_post(data, content_type, self._compress)
+            return await self._request('POST', url, params, data=body,
+                                       headers=headers)
+        except NameError:
+            return await self._run(self._pool.post, url, data, content_type,
+                                   params=params, decoder=self._decoder,
+                                   compress=self._compress)
+
+    @staticmethod
+    async def _run(func, *args, **kwargs):
+        """Run a blocking call in the default executor."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(func, *args, **kwargs))
+
+    async def _call_async(self, url, params, data, content_type):
+        """Make the HTTP request for an API call."""
+        async with self.semaphore:
+            if data is not None:
+                return await self._post_async(url, data, content_type,
+                                              params=params)
+            return await self._get_async(url, params=params)
+
+    async def api(self, name, url, **kwargs):
+        """Generic API method."""
+        url, params, data, content_type = self._prepare(name, url, **kwargs)
+        if self._cache is None:
+            return await self._call_async(url, params, data, content_type)
+        key = self._key(name, params, data)
+        result = self._cache.get(key)
+        if result is None:
+            result = await self._call_async(url, params, data, content_type)
+            self._cache.set(key, result)
+        return result
+
+    async def api_many(self, name, urls, workers=None, ordered=False,
+                       dedupe=None, **kwargs):
+        """Generic API method for many URLs, like `Client.api_many`.
+
+        Yields `(url, result)` pairs, in completion order, or in input order
+        if `ordered` is set. URLs are read lazily, with at most `workers`
+        calls (by default `concurrency`) pending at any time.
+        """
+        self._check_api(name)
+        if dedupe is True:
+            dedupe = DedupIndex()
+        limit = min(workers or self._concurrency, self._concurrency)
+
+        async def call(url):
+            try:
+                return url, await self.api(name, url, **kwargs)
+            except Exception as exc:  # pylint: disable=broad-except
+                return url, exc
+
+        urls = iter(urls)
+        pending = collections.deque()
+        try:
+            while True:
+                for url in urls:
+                    if dedupe is None or dedupe.add(self._canonical(url)):
+                        pending.append(asyncio.ensure_future(call(url)))
+                        if len(pending) >= limit:
+                            break
+                if not pending:
+                    return
+                if ordered:
+                    yield await pending.popleft()
+                    continue
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.remove(task)
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _post_batch_async(self, paths):
+        """POST GET requests for the given paths to the batch endpoint."""
+        return await self._post_async(self.endpoint('batch'),
+                                      self._batch_form(paths),
+                                      'application/x-www-form-urlencoded')
+
+    def batch(self, size=DEFAULT_BATCH_SIZE, linger=DEFAULT_LINGER,
+              workers=DEFAULT_WORKERS):
+        """Return an `AsyncBatch`, to make many API calls in few requests.
+
+        Use it with `async with`, so that the last calls get sent:
+
+            async with client.batch() as batch:
+                futures = [batch.api('article', url) for url in urls]
+            results = await asyncio.gather(*futures)
+        """
+        return AsyncBatch(self, size, linger, workers)
+
+    async def close(self):
+        """Close the HTTP session and the connection pool."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        Client.close(self)
+
+    def __enter__(self):
+        raise TypeError('Use "async with" with an AsyncClient.')
+
+    def __exit__(self, *exc_info):
+        raise TypeError('Use "async with" with an AsyncClient.')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class AsyncBatch(object):
+    """API calls packed into requests to the batch endpoint, for asyncio.
+
+    Like `diffbot.Batch`, but `api` returns an `asyncio.Future`, and the
+    batch requests are sent by tasks of the event loop. Up to `workers` of
+    them are in flight at once; later ones wait for their turn.
+    """
+
+    def __init__(self, client, size=DEFAULT_BATCH_SIZE,
+                 linger=DEFAULT_LINGER, workers=DEFAULT_WORKERS):
+        """Initialise the batch."""
+        if size < 1:
+            raise ValueError('A batch needs room for at least one call.')
+        self.size = size
+        self.linger = linger
+        self._client = client
+        self._calls = []
+        self._timer = None
+        self._workers = workers
+        self._slots = None
+        self._tasks = set()
+        self._closed = False
+
+    def api(self, name, url, **kwargs):
+        """Queue an API call, returning an `asyncio.Future` of its result."""
+        path, key, result = self._client._batch_call(name, url, **kwargs)
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        if result is not None:
+            future.set_result(result)
+            return future
+        if self._closed:
+            raise ValueError('The batch is closed.')
+        self._calls.append((path, key, future))
+        if len(self._calls) >= self.size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.linger, self.flush)
+        return future
+
+    def flush(self):
+        """Send the queued calls now."""
+        calls, self._calls = self._calls, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if calls:
+            task = asyncio.ensure_future(self._send(calls))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, calls):
+        """Send a batch request, and resolve the futures of its calls."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._workers)
+        async with self._slots:
+            try:
+                responses = await self._client._post_batch_async(
+                    [path for path, _, _ in calls])
+            except Exception as exc:  # pylint: disable=broad-except
+                for _, _, future in calls:
+                    if not future.done():
+                        future.set_exception(exc)
+                return
+        _settle_batch(self._client, calls, responses)
+
+    async def close(self):
+        """Send the queued calls, and wait for all batch requests."""
+        self._closed = True
+        self.flush()
+        while self._tasks:
+            await asyncio.wait(self._tasks)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -0,0 +1,556 @@
+"""Columnar storage of extraction results, for fast scans.
+
+Objects are flattened into one column per field, and each column is stored
+in its own files in a directory, in the memory layout of Apache Arrow: a
+validity bitmap, then either an array of numbers, or an array of offsets
+into UTF-8 text. Reading maps the files into memory, so scanning a column
+only touches the pages it needs, and nothing is parsed up front:
+
+    fields = 'title,sentiment,tags(label)'
+    with ColumnWriter('articles', fields) as writer:
+        for url, result in client.article_many(urls, fields=fields):
+            writer.extend(result.get('objects', ()))
+
+    with Columns('articles') as columns:
+        scores = [s for s in columns['sentiment'] if s is not None]
+
+Nested fields are given as dotted paths (`offerPriceDetails.amount`,
+`images.0.url`), or in the `fields` syntax of the API (`images(url)`).
+When `pyarrow` is installed, `Columns.to_arrow` returns the data as an
+Arrow table, without copying it (e.g. to save it as Parquet).
+
+Needs Python 3.3+.
+"""
+import json
+import mmap
+import os
+import sys
+from array import array
+
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
+
+from diffbot import RESULT_TYPES
+
+if sys.version_info < (3, 3):
+    raise ImportError('diffbot_columnar needs Python 3.3+.')
+
+
+FORMAT = 'diffbot-columns'
+
+SCHEMA = 'schema.json'
+
+# Rows buffered before being written; a multiple of 8, so that the validity
+# bitmaps of the batches can simply be concatenated.
+DEFAULT_BATCH_SIZE = 65536
+
+# Types of the fields of Diffbot v3 objects that are not text. The types of
+# other fields are inferred from the first batch of values.
+FIELD_TYPES = {
+    'sentiment': 'float',
+    'numPages': 'int',
+    'numPosts': 'int',
+    'availability': 'bool',
+    'height': 'int',
+    'width': 'int',
+    'naturalHeight': 'int',
+    'naturalWidth': 'int',
+    'displayHeight': 'int',
+    'displayWidth': 'int',
+    'offerPriceDetails.amount': 'float',
+    'regularPriceDetails.amount': 'float',
+    'saveAmountDetails.amount': 'float',
+    'images': 'json',
+    'videos': 'json',
+    'tags': 'json',
+    'breadcrumb': 'json',
+    'nextPages': 'json',
+    'specs': 'json',
+    'posts': 'json',
+    'offerPriceDetails': 'json',
+    'regularPriceDetails': 'json',
+    'saveAmountDetails': 'json',
+}
+
+# Array type codes of the numeric column types.
+_CODES = {'float': 'd', 'int': 'q', 'bool': 'B'}
+
+# Column types stored as text; `json` columns hold any JSON value.
+_TEXT_TYPES = frozenset(('str', 'json'))
+
+TYPES = tuple(sorted(_TEXT_TYPES.union(_CODES)))
+
+# Files of each column type, after the validity bitmap.
+_SUFFIXES = {'str': ('offsets', 'data'), 'json': ('offsets', 'data')}
+
+
+def columns(fields):
+    """Return the column names for the `fields` of an API call.
+
+    `fields` is a list, or a string in the syntax of the API, where
+    `images(url,title)` stands for `images.url` and `images.title`.
+    """
+    if not isinstance(fields, str):
+        fields = ','.join(fields)
+    names = []
+    prefix = []
+    token = ''
+    for char in fields + ',':
+        if char not in ',()':
+            token += char
+            continue
+        token = token.strip()
+        if char == '(':
+            if not token:
+                raise ValueError('Missing field name before "(".')
+            prefix.append(token)
+        elif token:
+            names.append('.'.join(prefix + [token]))
+        if char == ')':
+            if not prefix:
+                raise ValueError('Unbalanced ")" in fields.')
+            prefix.pop()
+        token = ''
+    if prefix:
+        raise ValueError('Unbalanced "(" in fields.')
+    return names
+
+
+def _lookup(obj, path):
+    """Return the value at `path` (a list of keys) in `obj`, or `None`.
+
+    A key that isn't an index applies to each item of a list.
+    """
+    for depth, key in enumerate(path):
+        if isinstance(obj, dict):
+            obj = obj.get(key)
+        elif isinstance(obj, list):
+            if key.isdigit():
+                index = int(key)
+                obj = obj[index] if index < len(obj) else None
+            else:
+                rest = path[depth:]
+                return [_lookup(item, rest) for item in obj]
+        else:
+            return None
+        if obj is None:
+            return None
+    return obj
+
+
+def _infer(values):
+    """Return the column type fitting all `values`."""
+    kinds = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            kinds.add('bool')
+        elif isinstance(value, int):
+            kinds.add('int')
+        elif isinstance(value, float):
+            kinds.add('float')
+        elif isinstance(value, str):
+            kinds.add('str')
+        else:
+            return 'json'
+    if len(kinds) == 1:
+        return kinds.pop()
+    if kinds == set(('int', 'float')):
+        return 'float'
+    return 'json' if kinds else 'str'
+
+
+def _float(value):
+    """Convert a value for a `float` column, or return `None`."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(value):
+    """Convert a value for an `int` column, or return `None`."""
+    try:
+        value = int(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return value if -2 ** 63 <= value < 2 ** 63 else None
+
+
+def _bool(value):
+    """Convert a value for a `bool` column, or return `None`."""
+    return value if isinstance(value, bool) else None
+
+
+def _str(value):
+    """Encode a value for a `str` column."""
+    if not isinstance(value, str):
+        value = json.dumps(value, separators=(',', ':'))
+    return value.encode('utf-8', 'surrogatepass')
+
+
+def _json(value):
+    """Encode a value for a `json` column."""
+    return json.dumps(value, separators=(',', ':'),
+                      ensure_ascii=False).encode('utf-8', 'surrogatepass')
+
+
+_CONVERTERS = {
+    'float': _float, 'int': _int, 'bool': _bool, 'str': _str, 'json': _json,
+}
+
+# Values stored for missing numbers.
+_MISSING = {'float': float('nan'), 'int': 0, 'bool': 0}
+
+
+def _bitmap(flags):
+    """Pack booleans into a bitmap, least significant bit first."""
+    bits = bytearray((len(flags) + 7) // 8)
+    for index, flag in enumerate(flags):
+        if flag:
+            bits[index >> 3] |= 1 << (index & 7)
+    return bytes(bits)
+
+
+class ColumnWriter(object):
+    """Write objects to a column store in the directory `path`.
+
+    The columns are the `fields` (see `columns`), by default those of the
+    `api`'s result class. Column `types` (one of `TYPES`) can be given by
+    name; otherwise `FIELD_TYPES` are used, or types are inferred. Values
+    that don't fit the type of their column are stored as missing.
+
+    The schema is written on `close`, so readers never see a partial store.
+    Used as a context manager, the store is left unfinished if the block
+    raises an exception.
+    """
+
+    def __init__(self, path, fields=None, api=None, types=None,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        """Create the store."""
+        if fields is None:
+            if api not in RESULT_TYPES:
+                raise ValueError('Give the fields, or one of the APIs {0}, '
+                                 'not {1!r}.'.format(sorted(RESULT_TYPES),
+                                                     api))
+            fields = RESULT_TYPES[api].fields
+        self.names = columns(fields)
+        if not self.names:
+            raise ValueError('No fields to export.')
+        if batch_size < 8 or batch_size % 8:
+            raise ValueError('The batch size must be a multiple of 8.')
+        types = types or {}
+        for kind in types.values():
+            if kind not in TYPES:
+                raise ValueError('Column types must be one of {0}, '
+                                 'not {1!r}.'.format(TYPES, kind))
+        self.path = path
+        self.batch_size = batch_size
+        self.rows = 0
+        self.types = [types.get(name, FIELD_TYPES.get(name))
+                      for name in self.names]
+        self._paths = [name.split('.') for name in self.names]
+        self._batch = [[] for _ in self.names]
+        self._ends = [0] * len(self.names)
+        self._files = None
+        self._failed = False
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        if os.path.exists(os.path.join(path, SCHEMA)):
+            os.remove(os.path.join(path, SCHEMA))
+
+    def append(self, obj):
+        """Write an object (a dict, or a `diffbot.Result`)."""
+        if not isinstance(obj, dict):
+            obj = obj.raw
+        for values, path in zip(self._batch, self._paths):
+            values.append(_lookup(obj, path))
+        if len(self._batch[0]) >= self.batch_size:
+            self._flush()
+
+    def extend(self, objs):
+        """Write several objects."""
+        for obj in objs:
+            self.append(obj)
+
+    def _open(self):
+        """Settle the column types, and create the column files."""
+        self._files = []
+        for index, values in enumerate(self._batch):
+            if self.types[index] is None:
+                self.types[index] = _infer(values)
+            kind = self.types[index]
+            files = []
+            self._files.append(files)
+            for suffix in ('valid',) + _SUFFIXES.get(kind, ('values',)):
+                files.append(open(self._file(index, suffix), 'wb'))
+            if kind in _TEXT_TYPES:
+                files[1].write(array('q', [0]).tobytes())
+
+    def _file(self, index, suffix):
+        """Path of a column file."""
+        return os.path.join(self.path, '{0}.{1}'.format(index, suffix))
+
+    def _flush(self):
+        """Write the buffered rows."""
+        if self._failed:
+            raise ValueError('Writing {0} failed earlier.'.format(self.path))
+        try:
+            self._write()
+        except Exception:
+            self._failed = True
+            self.abort()
+            raise
+
+    def _write(self):
+        """Write the buffered rows, creating the files first if needed."""
+        if self._files is None:
+            self._open()
+        for index, values in enumerate(self._batch):
+            kind = self.types[index]
+            convert = _CONVERTERS[kind]
+            converted = [None if value is None else convert(value)
+                         for value in values]
+            files = self._files[index]
+            files[0].write(_bitmap([value is not None
+                                    for value in converted]))
+            if kind in _TEXT_TYPES:
+                offsets = array('q')
+                end = self._ends[index]
+                for data in converted:
+                    if data is not None:
+                        end += len(data)
+                    offsets.append(end)
+                self._ends[index] = end
+                files[1].write(offsets.tobytes())
+                files[2].write(b''.join(data for data in converted
+                                        if data is not None))
+            else:
+                missing = _MISSING[kind]
+                files[1].write(array(_CODES[kind], [
+                    missing if value is None else value
+                    for value in converted]).tobytes())
+        self.rows += len(self._batch[0])
+        self._batch = [[] for _ in self.names]
+
+    def close(self):
+        """Write the remaining rows and the schema."""
+        if self._files is None or self._batch[0]:
+            self._flush()
+        self.abort()
+        schema = {
+            'format': FORMAT,
+            'version': 1,
+            'byteorder': sys.byteorder,
+            'rows': self.rows,
+            'columns': [{'name': name, 'type': kind}
+                        for name, kind in zip(self.names, self.types)],
+        }
+        path = os.path.join(self.path, SCHEMA)
+        with open(path + '.tmp', 'w') as dst:
+            json.dump(schema, dst, indent=1)
+        os.rename(path + '.tmp', path)
+
+    def abort(self):
+        """Close the files without writing the schema.
+
+        The store is left unfinished, and can't be opened.
+        """
+        for files in self._files or ():
+            for dst in files:
+                dst.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_columns(path, objs, fields=None, api=None, **kwargs):
+    """Write objects to a column store, returning the number of rows."""
+    with ColumnWriter(path, fields, api, **kwargs) as writer:
+        writer.extend(objs)
+    return writer.rows
+
+
+class Column(Sequence):
+    """A column of a store, backed by memory-mapped files.
+
+    Items are the values, or `None` where missing. For numeric columns,
+    `values` is the array of numbers itself, with NaN or zero for missing
+    values; use it for the fastest scans.
+    """
+
+    def __init__(self, name, kind, rows, valid, values, data=None):
+        """Wrap the buffers of a column."""
+        self.name = name
+        self.type = kind
+        self.rows = rows
+        self._valid = memoryview(valid)
+        self._data = None
+        if kind in _TEXT_TYPES:
+            self._offsets = memoryview(values).cast('q')
+            self._data = memoryview(data)
+            self.values = None
+        else:
+            self.values = memoryview(values).cast(_CODES[kind])
+        self._value = getattr(self, '_' + kind)
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.rows))]
+        if index < 0:
+            index += self.rows
+        if not 0 <= index < self.rows:
+            raise IndexError('Column index out of range.')
+        if not self._valid[index >> 3] >> (index & 7) & 1:
+            return None
+        return self._value(index)
+
+    def __iter__(self):
+        valid = self._valid
+        value = self._value
+        for index in range(self.rows):
+            if valid[index >> 3] >> (index & 7) & 1:
+                yield value(index)
+            else:
+                yield None
+
+    def _str(self, index):
+        return str(self._data[self._offsets[index]:self._offsets[index + 1]],
+                   'utf-8', 'surrogatepass')
+
+    def _json(self, index):
+        return json.loads(self._str(index))
+
+    def _float(self, index):
+        return self.values[index]
+
+    _int = _float
+
+    def _bool(self, index):
+        return bool(self.values[index])
+
+    def _buffers(self):
+        """The buffers of the column, in Arrow's order."""
+        if self.type in _TEXT_TYPES:
+            return self._valid, self._offsets, self._data
+        return self._valid, self.values
+
+    def release(self):
+        """Release the column's views of the mapped files."""
+        for buf in self._buffers():
+            buf.release()
+
+    def __repr__(self):
+        return '<Column {0!r}: {1}, {2} rows>'.format(self.name, self.type,
+                                                      self.rows)
+
+
+class Columns(Mapping):
+    """A column store written by `ColumnWriter`, mapping names to columns.
+
+    The column files are memory-mapped until `close`.
+    """
+
+    def __init__(self, path):
+        """Open the store."""
+        with open(os.path.join(path, SCHEMA)) as src:
+            schema = json.load(src)
+        if schema.get('format') != FORMAT:
+            raise ValueError('{0} is not a column store.'.format(path))
+        if schema['byteorder'] != sys.byteorder:
+            raise ValueError('{0} was written with {1}-endian byte order.'
+                             .format(path, schema['byteorder']))
+        self.path = path
+        self.rows = schema['rows']
+        self._maps = []
+        self._columns = {}
+        self._names = []
+        for index, column in enumerate(schema['columns']):
+            kind = column['type']
+            buffers = [self._map(index, suffix) for suffix in
+                       ('valid',) + _SUFFIXES.get(kind, ('values',))]
+            self._names.append(column['name'])
+            self._columns[column['name']] = Column(
+                column['name'], kind, self.rows, *buffers)
+
+    def _map(self, index, suffix):
+        """Map a column file into memory."""
+        path = os.path.join(self.path, '{0}.{1}'.format(index, suffix))
+        with open(path, 'rb') as src:
+            if not os.fstat(src.fileno()).st_size:
+                return b''
+            buf = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(buf)
+        return buf
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    @property
+    def schema(self):
+        """The `(name, type)` of each column."""
+        return [(name, self._columns[name].type) for name in self._names]
+
+    def records(self, names=None):
+        """Yield the rows as dicts, with the given columns (or all)."""
+        names = self._names if names is None else list(names)
+        for values in zip(*[self._columns[name] for name in names]):
+            yield dict(zip(names, values))
+
+    def to_arrow(self, names=None):
+        """Return the columns as a `pyarrow.Table`, sharing their memory.
+
+        `json` columns are returned as text. Keep the store open while
+        the table is in use.
+        """
+        import pyarrow
+        arrow_types = {
+            'str': pyarrow.large_string(),
+            'json': pyarrow.large_string(),
+            'float': pyarrow.float64(),
+            'int': pyarrow.int64(),
+            'bool': pyarrow.uint8(),
+        }
+        names = self._names if names is None else list(names)
+        arrays = []
+        for name in names:
+            column = self._columns[name]
+            array_ = pyarrow.Array.from_buffers(
+                arrow_types[column.type], self.rows,
+                [pyarrow.py_buffer(buf) for buf in column._buffers()])
+            if column.type == 'bool':
+                array_ = array_.cast(pyarrow.bool_())
+            arrays.append(array_)
+        return pyarrow.Table.from_arrays(arrays, names=names)
+
+    def close(self):
+        """Unmap the column files."""
+        for column in self._columns.values():
+            column.release()
+        for buf in self._maps:
+            buf.close()
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,447 @@
+"""Streaming pipelines on top of the Diffbot client.
+
+A pipeline chains stages, each running in its own threads, connected by
+bounded queues. A stage that falls behind blocks the ones before it, so
+memory use is bounded by the queue sizes, not by the size of the input:
+
+    pipeline = Pipeline(
+        Dedupe(),
+        Extract(client, 'article', workers=16),
+        Objects(),
+        JSONLinesSink('articles.jsonl'),
+    )
+    with open('urls.txt') as urls:
+        pipeline.run(line.strip() for line in urls)
+    for stage in pipeline.stages:
+        print(stage.name, stage.stats)
+"""
+import csv
+import json
+import sys
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from diffbot import DEFAULT_WORKERS, ENCODING, DedupIndex
+
+
+DEFAULT_QUEUE_SIZE = 100
+
+# How often blocked stages check whether the pipeline was stopped.
+_POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+_STOPPED = object()
+
+
+class Stats(object):
+    """Throughput and latency of a stage."""
+
+    def __init__(self):
+        """Initialise the counters."""
+        self.items = 0
+        self.outputs = 0
+        self.busy = 0.0
+        self.max_latency = 0.0
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def record(self, latency, outputs):
+        """Record an item processed in `latency` seconds."""
+        with self._lock:
+            self.items += 1
+            self.outputs += outputs
+            self.busy += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    @property
+    def elapsed(self):
+        """Seconds the stage has been running for."""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def throughput(self):
+        """Items processed per second."""
+        elapsed = self.elapsed
+        return elapsed and self.items / elapsed
+
+    @property
+    def latency(self):
+        """Mean seconds spent on an item."""
+        return self.items and self.busy / self.items
+
+    def __repr__(self):
+        return ('<Stats: {0} items, {1} outputs, {2:.1f}/s, '
+                '{3:.3f}s mean latency, {4:.3f}s max latency>').format(
+                    self.items, self.outputs, self.throughput, self.latency,
+                    self.max_latency)
+
+
+class Stage(object):
+    """A pipeline stage.
+
+    `func` takes an item, and returns (or yields) any number of items for the
+    next stage. It is called from `workers` threads.
+    """
+
+    def __init__(self, func=None, workers=1, name=None):
+        """Initialise the stage."""
+        if func is not None:
+            self.process = func
+        if workers < 1:
+            raise ValueError('A stage needs at least one worker.')
+        self.workers = workers
+        self.name = name or getattr(func, '__name__', type(self).__name__)
+        self.stats = Stats()
+
+    def process(self, item):
+        """Return the items to pass on for `item`."""
+        raise NotImplementedError
+
+    def open(self):
+        """Called before the first item."""
+
+    def close(self):
+        """Called after the last item, even if the pipeline failed."""
+
+
+class Map(Stage):
+    """A stage passing on `func(item)` for each item."""
+
+    def __init__(self, func, workers=1, name=None):
+        """Initialise the stage."""
+        Stage.__init__(self, lambda item: (func(item),), workers,
+                       name or getattr(func, '__name__', None))
+
+
+class Filter(Stage):
+    """A stage passing on the items for which `predicate(item)` is true."""
+
+    def __init__(self, predicate, workers=1, name=None):
+        """Initialise the stage."""
+        Stage.__init__(self, lambda item: (item,) if predicate(item) else (),
+                       workers, name or getattr(predicate, '__name__', None))
+
+
+class Dedupe(Stage):
+    """A stage dropping items already seen, compared by `key(item)`.
+
+    Seen keys are kept in `index`, a `DedupIndex` by default. Pass a
+    `BloomFilter` to bound its memory, and e.g. `canonicalize_url` as the
+    `key` to compare URLs by their canonical form.
+    """
+
+    def __init__(self, key=None, index=None, name=None):
+        """Initialise the stage."""
+        Stage.__init__(self, workers=1, name=name)
+        self._key = key
+        self.index = DedupIndex() if index is None else index
+
+    def process(self, item):
+        """Pass on `item` if it was not seen before."""
+        key = item if self._key is None else self._key(item)
+        return (item,) if self.index.add(key) else ()
+
+
+class Extract(Stage):
+    """A stage calling a Diffbot API.
+
+    Items are URLs, or dicts with a `url` and other API arguments (as in the
+    command line tool's batch mode). For each item, a record is passed on,
+    with the `url` and either its `result` or the `error` message.
+    """
+
+    def __init__(self, client, api='article', workers=DEFAULT_WORKERS,
+                 name=None, **kwargs):
+        """Initialise the stage. `kwargs` are passed on to the API."""
+        Stage.__init__(self, workers=workers, name=name or api)
+        self._client = client
+        self._api = api
+        self._kwargs = kwargs
+
+    def process(self, item):
+        """Extract a URL."""
+        kwargs = dict(self._kwargs)
+        if isinstance(item, dict):
+            kwargs.update(item)
+            url = kwargs.pop('url')
+        else:
+            url = item
+        name = kwargs.pop('api', self._api)
+        try:
+            return ({'url': url,
+                     'result': self._client.api(name, url, **kwargs)},)
+        except Exception as exc:  # pylint: disable=broad-except
+            return ({'url': url, 'error': str(exc)},)
+
+
+class Objects(Stage):
+    """A stage splitting API results into their objects.
+
+    Each object is passed on with the `url` it was extracted from. Records
+    with an `error` are passed on as they are.
+    """
+
+    def process(self, item):
+        """Pass on the objects of a result."""
+        result = item.get('result')
+        if result is None:
+            return (item,)
+        objects = result.get('objects', (result,))
+        return [dict(obj, url=item['url']) for obj in objects]
+
+
+class _FileSink(Stage):
+    """A stage writing items to a file, or a path to be opened."""
+
+    def __init__(self, dst, name=None):
+        """Initialise the sink."""
+        Stage.__init__(self, workers=1, name=name)
+        self._dst = dst
+        self._file = None
+
+    def _open(self):
+        """Open the output file."""
+        return open(self._dst, 'w')
+
+    def open(self):
+        """Open the output file, if given a path."""
+        if isinstance(self._dst, (str, type(u''))):
+            self._file = self._open()
+        else:
+            self._file = self._dst
+
+    def close(self):
+        """Close the output file, if opened by the sink."""
+        if self._file is not None and self._file is not self._dst:
+            self._file.close()
+        self._file = None
+
+
+class JSONLinesSink(_FileSink):
+    """A sink writing items as JSON, one per line."""
+
+    def process(self, item):
+        """Write an item."""
+        self._file.write(json.dumps(item, separators=(',', ':')) + '\n')
+        return ()
+
+
+class CSVSink(_FileSink):
+    """A sink writing the given `fields` of the items as CSV.
+
+    Missing fields are left empty, lists and objects are written as JSON.
+    """
+
+    def __init__(self, dst, fields, name=None):
+        """Initialise the sink."""
+        _FileSink.__init__(self, dst, name)
+        self.fields = tuple(fields)
+        self._writer = None
+
+    def _open(self):
+        """Open the output file."""
+        if sys.version_info[0] < 3:
+            return open(self._dst, 'wb')
+        return open(self._dst, 'w', newline='', encoding=ENCODING)
+
+    def open(self):
+        """Open the output file, and write the header."""
+        _FileSink.open(self)
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.fields)
+
+    def process(self, item):
+        """Write an item."""
+        self._writer.writerow([_csv_value(item.get(field))
+                               for field in self.fields])
+        return ()
+
+
+class ColumnarSink(Stage):
+    """A sink writing items to a column store, for fast scans.
+
+    See `diffbot_columnar.ColumnWriter` for the arguments.
+    """
+
+    def __init__(self, path, fields=None, api=None, name=None, **kwargs):
+        """Initialise the sink."""
+        Stage.__init__(self, workers=1, name=name)
+        self._args = (path, fields, api)
+        self._kwargs = kwargs
+        self.writer = None
+
+    def open(self):
+        """Create the column store."""
+        from diffbot_columnar import ColumnWriter
+        self.writer = ColumnWriter(*self._args, **self._kwargs)
+
+    def process(self, item):
+        """Write an item."""
+        self.writer.append(item)
+        return ()
+
+    def close(self):
+        """Write the remaining items and the schema, if all items arrived.
+
+        If the pipeline failed, the store is left unfinished.
+        """
+        if self.stats.finished is None:
+            self.writer.abort()
+        else:
+            self.writer.close()
+
+
+def _csv_value(value):
+    """Format a value for a CSV cell."""
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    if sys.version_info[0] < 3 and isinstance(value, type(u'')):
+        value = value.encode(ENCODING)
+    return value
+
+
+class Pipeline(object):
+    """A chain of stages, connected by queues of `queue_size` items."""
+
+    def __init__(self, *stages, **kwargs):
+        """Initialise the pipeline."""
+        if not stages:
+            raise ValueError('A pipeline needs at least one stage.')
+        self.stages = stages
+        self.queue_size = kwargs.pop('queue_size', DEFAULT_QUEUE_SIZE)
+        if kwargs:
+            raise TypeError('Unexpected arguments: {0}.'.format(
+                ', '.join(sorted(kwargs))))
+
+    def iter(self, items):
+        """Run the pipeline on `items`, yielding the last stage's output."""
+        queues = [queue.Queue(self.queue_size) for _ in self.stages]
+        queues.append(queue.Queue(self.queue_size))
+        stop = threading.Event()
+        errors = []
+        threads = []
+        opened = []
+        try:
+            for stage in self.stages:
+                stage.stats = Stats()
+                stage.open()
+                opened.append(stage)
+            feeder = threading.Thread(target=self._feed,
+                                      args=(items, queues[0], stop, errors))
+            threads.append(feeder)
+            for stage, src, dst in zip(self.stages, queues, queues[1:]):
+                threads.extend(self._start(stage, src, dst, stop, errors))
+            feeder.daemon = True
+            feeder.start()
+            while True:
+                item = _get(queues[-1], stop)
+                if item is _DONE or item is _STOPPED:
+                    break
+                yield item
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            for stage in opened:
+                stage.close()
+        if errors:
+            raise errors[0]
+
+    def run(self, items):
+        """Run the pipeline on `items` until done, and return the stages."""
+        for _ in self.iter(items):
+            pass
+        return self.stages
+
+    @staticmethod
+    def _feed(items, dst, stop, errors):
+        """Put the input items on the first queue."""
+        try:
+            for item in items:
+                if not _put(dst, item, stop):
+                    return
+        except Exception as exc:  # pylint: disable=broad-except
+            errors.append(exc)
+            stop.set()
+            return
+        _put(dst, _DONE, stop)
+
+    @staticmethod
+    def _start(stage, src, dst, stop, errors):
+        """Start the worker threads of a stage."""
+        stats = stage.stats
+        stats.started = time.time()
+        remaining = [stage.workers]
+        lock = threading.Lock()
+
+        def work():
+            try:
+                while True:
+                    item = _get(src, stop)
+                    if item is _STOPPED:
+                        return
+                    if item is _DONE:
+                        src.put(_DONE)  # Let the other workers see it.
+                        break
+                    # Time only the stage itself, not waiting for space
+                    # downstream.
+                    latency = 0
+                    outputs = 0
+                    start = time.time()
+                    for output in stage.process(item):
+                        latency += time.time() - start
+                        if not _put(dst, output, stop):
+                            return
+                        outputs += 1
+                        start = time.time()
+                    stats.record(latency + time.time() - start, outputs)
+            except Exception as exc:  # pylint: disable=broad-except
+                errors.append(exc)
+                stop.set()
+                return
+            with lock:
+                remaining[0] -= 1
+                last = not remaining[0]
+            if last:
+                stats.finished = time.time()
+                _put(dst, _DONE, stop)
+
+        threads = []
+        for _ in range(stage.workers):
+            thread = threading.Thread(target=work)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        return threads
+
+
+def _get(src, stop):
+    """Get an item from a queue, or `_STOPPED` if the pipeline was stopped."""
+    while not stop.is_set():
+        try:
+            return src.get(timeout=_POLL_INTERVAL)
+        except queue.Empty:
+            pass
+    return _STOPPED
+
+
+def _put(dst, item, stop):
+    """Put an item on a queue; return `False` if the pipeline was stopped."""
+    while not stop.is_set():
+        try:
+            dst.put(item, timeout=_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            pass
+    return False
@@ -1,16 +1,10 @@
 # -*- coding: utf-8 -*-
 """Python client for the Diffbot API."""
-import sys
 from setuptools import setup
 
 
-PY_VERSION = sys.version_info[0], sys.version_info[1]
-
 REQUIREMENTS = []
 
-if PY_VERSION == (2, 6):
-    REQUIREMENTS.append('argparse')
-
 with open('README.rst') as README:
     LONG_DESCRIPTION = README.read()
 
@@ -28,7 +22,6 @@ setup(
         "Intended Audience :: Developers",
         "License :: OSI Approved :: MIT License",
         "Programming Language :: Python",
-        "Programming Language :: Python :: 2.6",
         "Programming Language :: Python :: 2.7",
         "Programming Language :: Python :: 3.2",
         "Programming Language :: Python :: 3.3",
@@ -41,7 +34,8 @@ setup(
         "requests",
         "nose",
     ],
-    py_modules=['diffbot'],
+    py_modules=['diffbot', 'diffbot_async', 'diffbot_columnar',
+                'diffbot_pipeline'],
     include_package_data=False,
     entry_points={
         'console_scripts': [
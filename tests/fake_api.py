@@ -0,0 +1,255 @@
+"""A local stand-in for the Diffbot API, for tests and benchmarks.
+
+API calls are answered from the fixtures in `tests/resources`, or with a
+generated result for URLs without one, also when packed into a request to
+the batch endpoint. Crawl job status and result downloads (JSON or CSV, with
+HTTP Range support) are served as well.
+"""
+import json
+import os.path
+import random
+import re
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    import urlparse
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    import urllib.parse as urlparse
+
+
+RESOURCES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'resources')
+
+_API = re.compile(r'^/v(\d+)/(\w+)$')
+
+_DOWNLOAD = re.compile(r'^/v\d+/crawl/download/.*_data\.(json|csv)$')
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    """A threaded HTTP server."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler, object):
+    """Request handler, configured by the `MockServer` it belongs to."""
+
+    protocol_version = 'HTTP/1.1'
+
+    # Headers and body are written separately, don't wait for ACKs in
+    # between on kept alive connections.
+    disable_nagle_algorithm = True
+
+    mock = None
+
+    def log_message(self, *args):
+        """Don't log requests."""
+
+    def send(self, status, body, content_type='application/json',
+             headers=()):
+        """Send a response."""
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handle a GET request."""
+        self.handle_request()
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Handle a POST request, with form parameters if it has any."""
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        form = {}
+        if self.headers.get('Content-Type') == \
+                'application/x-www-form-urlencoded':
+            form = dict(urlparse.parse_qsl(body.decode('utf-8')))
+        self.handle_request(form)
+
+    def handle_request(self, form=None):
+        """Answer an API call, batch, job status or download request."""
+        mock = self.mock
+        mock.count()
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        params.update(form or {})
+        if mock.latency:
+            time.sleep(mock.delay())
+        if mock.error_rate and mock.random() < mock.error_rate:
+            mock.count(error=True)
+            return self.send(503, b'{"error": "Service unavailable."}')
+        match = _DOWNLOAD.match(url.path)
+        if match:
+            return self.download(match.group(1))
+        match = _API.match(url.path)
+        if match is None:
+            return self.send(404, b'{"error": "Not found."}')
+        version, api = match.groups()
+        if api == 'crawl':
+            return self.send(200, json.dumps(
+                mock.job(params, self.command)).encode())
+        if api == 'batch':
+            return self.send(200, json.dumps(mock.batch(params)).encode())
+        return self.send(200, mock.result(version, api, params.get('url')))
+
+    def download(self, format):
+        """Send the crawl results, or the requested range of them."""
+        body = self.mock.download(format)
+        content_type = format == 'csv' and 'text/csv' or 'application/json'
+        match = re.match(r'bytes=(\d+)-$', self.headers.get('Range') or '')
+        if match is None:
+            return self.send(200, body, content_type)
+        start = int(match.group(1))
+        if start >= len(body):
+            return self.send(416, b'')
+        return self.send(206, body[start:], content_type, headers=[(
+            'Content-Range', 'bytes {0}-{1}/{2}'.format(
+                start, len(body) - 1, len(body)))])
+
+
+class MockServer(object):
+    """A local Diffbot API server.
+
+    `latency` is the delay of each response in seconds, or a `(low, high)`
+    range to pick it from. A fraction `error_rate` of the requests fail with
+    a 503 status. With `payload_size` set, generated results have a `text`
+    of that many bytes. Crawl downloads have `records` records.
+    """
+
+    def __init__(self, latency=0, error_rate=0, payload_size=None,
+                 records=1000, seed=0):
+        """Initialise the server."""
+        self.latency = latency
+        self.error_rate = error_rate
+        self.payload_size = payload_size
+        self.records = records
+        self.requests = self.errors = self.batched = 0
+        self.crawls = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._downloads = {}
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """The root URL of the server, to use instead of `API_ROOT`."""
+        host, port = self._server.server_address[:2]
+        return 'http://{0}:{1}'.format(host, port)
+
+    def start(self):
+        """Start serving, in a background thread."""
+        handler = type('Handler', (_Handler,), {'mock': self})
+        self._server = _Server(('127.0.0.1', 0), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def count(self, error=False):
+        """Count a request, or an error response."""
+        with self._lock:
+            if error:
+                self.errors += 1
+            else:
+                self.requests += 1
+
+    def random(self):
+        """A random number, from the server's seeded generator."""
+        with self._lock:
+            return self._random.random()
+
+    def delay(self):
+        """The latency of a response."""
+        if isinstance(self.latency, (tuple, list)):
+            with self._lock:
+                return self._random.uniform(*self.latency)
+        return self.latency
+
+    def result(self, version, api, url):
+        """The encoded API result for `url`."""
+        netloc = urlparse.urlparse(url or '').netloc
+        resource = os.path.join(RESOURCES, netloc, 'v' + version,
+                                api + '.json')
+        if netloc and os.path.exists(resource):
+            with open(resource, 'rb') as src:
+                return src.read()
+        obj = {'type': api, 'pageUrl': url, 'title': 'Page title',
+               'text': 'x' * (self.payload_size or 100)}
+        return json.dumps({'request': {'api': api, 'pageUrl': url},
+                           'objects': [obj]}).encode()
+
+    def batch(self, params):
+        """The responses to the calls packed into a batch request."""
+        responses = []
+        for request in json.loads(params.get('batch') or '[]'):
+            url = urlparse.urlparse(request.get('relative_url') or '')
+            match = _API.match(url.path)
+            if request.get('method') != 'GET' or match is None or \
+                    match.group(2) in ('batch', 'crawl'):
+                responses.append({'code': 404,
+                                  'body': '{"error": "Not found."}'})
+                continue
+            call = dict(urlparse.parse_qsl(url.query))
+            body = self.result(match.group(1), match.group(2),
+                               call.get('url'))
+            responses.append({'code': 200, 'body': body.decode('utf-8')})
+        with self._lock:
+            self.batched += len(responses)
+        return responses
+
+    def job(self, params, method='GET'):
+        """The status of a finished crawl job.
+
+        Requests creating a job (with `seeds`) are kept in `crawls`, as
+        `(method, params)` pairs.
+        """
+        if 'seeds' in params:
+            with self._lock:
+                self.crawls.append((method, params))
+        return {'jobs': [{
+            'name': params.get('name'),
+            'jobStatus': {'status': 9, 'message': 'Job has completed.'},
+            'objectsFound': self.records,
+            'pageCrawlSuccesses': self.records,
+        }]}
+
+    def download(self, format):
+        """The crawl results in `format`."""
+        with self._lock:
+            if format not in self._downloads:
+                records = [{'pageUrl': 'http://example.com/{0}'.format(i),
+                            'title': 'Page {0}'.format(i),
+                            'text': 'x' * (self.payload_size or 100)}
+                           for i in range(self.records)]
+                if format == 'csv':
+                    lines = ['pageUrl,title,text'] + [
+                        '{pageUrl},{title},{text}'.format(**record)
+                        for record in records]
+                    body = '\r\n'.join(lines) + '\r\n'
+                else:
+                    body = json.dumps(records)
+                self._downloads[format] = body.encode()
+            return self._downloads[format]
@@ -1,24 +1,49 @@
 """Diffbot API tests."""
+import datetime
+import hashlib
 import imp
+import io
+import itertools
 import json
 import os.path
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
 import unittest
 import sys
+import zlib
 
 import mock
 
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
 try:
     import urlparse
 except ImportError:
     import urllib.parse as urlparse
 
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
 
 TOKEN = 'test'
 
 GITHUB_COM = 'https://github.com'
 
 
-def fake_requests_get(url, params=None):
+def fake_requests_get(url, params=None, **kwargs):
     """A stub `requests.get()` implementation."""
     api = urlparse.urlparse(url)
     url = urlparse.urlparse(params['url'])
@@ -33,20 +58,62 @@ def fake_requests_post(url, params=None, data=None, headers=None):
     return fake_requests_get(url, params=params)
 
 
-def fake_urllib2_urlopen(url, data=None):
-    """A stub `urllib2.urlopen()` implementation."""
-    if not isinstance(url, str):
-        url = url.get_full_url()
+def fake_session_get(session, url, params=None, **kwargs):
+    """A stub `requests.Session.get()` implementation."""
+    return fake_requests_get(url, params=params)
+
+
+def fake_session_post(session, url, params=None, data=None, headers=None,
+                      **kwargs):
+    """A stub `requests.Session.post()` implementation."""
+    return fake_requests_post(url, params=params, data=data, headers=headers)
+
+
+def fake_urllib2_urlopen(request, data=None, timeout=None):
+    """A stub `urllib2.urlopen()` implementation.
+
+    The response is gzip-encoded if the request accepts it.
+    """
+    url = request if isinstance(request, str) else request.get_full_url()
     api = urlparse.urlparse(url)
     url = urlparse.urlparse(urlparse.parse_qs(api.query)['url'][0])
     resource = os.path.join('tests', 'resources', url.netloc,
                             api.path.strip('/') + '.json')
-    return open(resource, 'rb')
+    with open(resource, 'rb') as src:
+        body = src.read()
+    headers = {}
+    if not isinstance(request, str) and \
+            request.get_header('Accept-encoding') == 'gzip':
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        body = compressor.compress(body) + compressor.flush()
+        headers['Content-Encoding'] = 'gzip'
+    return FakeUrllibResponse(body, headers)
+
+
+class FakeUrllibResponse(io.BytesIO):
+    """A stub `urllib2` response implementation."""
+
+    def __init__(self, body, headers):
+        """Set up the body and the headers."""
+        io.BytesIO.__init__(self, body)
+        self.headers = headers
+
+    def info(self):
+        """Return the response headers."""
+        return self.headers
+
+    def getcode(self):
+        """Return the status code."""
+        return 200
 
 
 class FakeResponse(object):
     """A stub `requests.Response` implementation."""
 
+    status_code = 200
+
+    elapsed = datetime.timedelta(milliseconds=5)
+
     def __init__(self, json_data):
         """Set up the json data."""
         self._json = json_data
@@ -55,6 +122,11 @@ class FakeResponse(object):
         """Return the JSON data."""
         return self._json
 
+    @property
+    def content(self):
+        """Return the encoded JSON data."""
+        return json.dumps(self._json).encode('utf-8')
+
     def raise_for_status(self):
         """This would raise an exception if the status code >= 400."""
 
@@ -81,7 +153,7 @@ class ClientTest(unittest.TestCase):
 
     def setUp(self):
         """Set up a mock patcher."""
-        self.patcher = mock.patch('requests.get', fake_requests_get)
+        self.patcher = mock.patch('requests.Session.get', fake_session_get)
         self.patcher.start()
         import diffbot
         self.module = diffbot
@@ -213,6 +285,1185 @@ class ClientTest(unittest.TestCase):
         self.assertRaises(ValueError, raises)
 
 
+class PoolTest(unittest.TestCase):
+    """Connection pool tests."""
+
+    def setUp(self):
+        """Set up a mock patcher."""
+        self.patcher = mock.patch('requests.Session.get', fake_session_get)
+        self.patcher.start()
+        import diffbot
+        self.module = diffbot
+
+    def tearDown(self):
+        """Stop the patcher."""
+        self.patcher.stop()
+
+    def test_session_reused(self):
+        """Test that consecutive calls share one session."""
+        client = self.module.Client(token=TOKEN)
+        client.article(GITHUB_COM)
+        session = client.pool.session
+        client.product(GITHUB_COM)
+        self.assertTrue(client.pool.session is session)
+
+    def test_pool_size(self):
+        """Test that the pool size is passed to the transport adapter."""
+        client = self.module.Client(token=TOKEN, pool_size=3)
+        adapter = client.pool.session.get_adapter(GITHUB_COM)
+        self.assertEqual(adapter._pool_maxsize, 3)
+
+    def test_shared_pool(self):
+        """Test sharing a pool between clients and crawl jobs."""
+        pool = self.module.Pool(size=2)
+        client = self.module.Client(token=TOKEN, pool=pool)
+        other = self.module.Client(token=TOKEN, pool=pool)
+        job = self.module.Job(TOKEN, 'crawl', pool=pool)
+        self.assertTrue(client.pool is other.pool is job.pool)
+        session = pool.session
+        client.close()
+        self.assertTrue(pool.session is session)
+        pool.close()
+        self.assertFalse(pool.session is session)
+
+    def test_context_manager(self):
+        """Test closing the client's own pool on exit."""
+        with self.module.Client(token=TOKEN) as client:
+            result = client.article(GITHUB_COM)
+            session = client.pool.session
+        self.assertEqual(result['type'], 'article')
+        self.assertFalse(client.pool.session is session)
+
+
+class ClientTestMany(unittest.TestCase):
+    """Bulk API method tests."""
+
+    def setUp(self):
+        """Set up a mock patcher."""
+        self.patcher = mock.patch('requests.Session.get', fake_session_get)
+        self.patcher.start()
+        import diffbot
+        self.client = imp.reload(diffbot).Client(token=TOKEN)
+
+    def tearDown(self):
+        """Stop the patcher."""
+        self.patcher.stop()
+
+    def test_article_many(self):
+        """Test the Article API with many URLs."""
+        results = list(self.client.article_many([GITHUB_COM] * 20, workers=4))
+        self.assertEqual(len(results), 20)
+        for url, result in results:
+            self.assertEqual(url, GITHUB_COM)
+            self.assertEqual(result['type'], 'article')
+
+    def test_errors_as_values(self):
+        """Test that a failing URL doesn't abort the batch."""
+        urls = [GITHUB_COM, 'https://example.com', GITHUB_COM]
+        results = list(self.client.api_many('product', urls, ordered=True))
+        self.assertEqual([url for url, _ in results], urls)
+        self.assertEqual(results[0][1]['type'], 'product')
+        self.assertTrue(isinstance(results[1][1], EnvironmentError))
+        self.assertEqual(results[2][1]['type'], 'product')
+
+    def test_ordered(self):
+        """Test that results come back in input order."""
+        urls = ['{0}/?page={1}'.format(GITHUB_COM, i) for i in range(50)]
+        self.client.api = lambda name, url, **kwargs: url
+        results = list(self.client.api_many('image', urls, workers=5,
+                                            ordered=True))
+        self.assertEqual(results, list(zip(urls, urls)))
+
+    def test_lazy(self):
+        """Test consuming an unbounded iterator of URLs."""
+        urls = ('{0}/?page={1}'.format(GITHUB_COM, i)
+                for i in itertools.count())
+        self.client.api = lambda name, url, **kwargs: url
+        results = self.client.api_many('image', urls, workers=2)
+        self.assertEqual(len(list(itertools.islice(results, 5))), 5)
+        results.close()
+
+    def test_invalid_api(self):
+        """Test that the API name is checked before any call is made."""
+        self.assertRaises(ValueError, self.client.api_many, 'foo', [])
+
+
+class DedupTest(unittest.TestCase):
+    """URL canonicalization and deduplication tests."""
+
+    def setUp(self):
+        """Set up a client that counts its calls."""
+        import diffbot
+        self.module = imp.reload(diffbot)
+        self.calls = []
+        self.patcher = mock.patch('requests.Session.get',
+                                  lambda *args, **kwargs: self.fake_get(
+                                      *args, **kwargs))
+        self.patcher.start()
+
+    def tearDown(self):
+        """Stop the patcher."""
+        self.patcher.stop()
+
+    def fake_get(self, session, url, params=None, **kwargs):
+        """Record the call."""
+        self.calls.append(params)
+        return FakeResponse({'url': params.get('url')})
+
+    def test_canonicalize_url(self):
+        """Test canonicalizing URLs."""
+        canonicalize_url = self.module.canonicalize_url
+        for url in ('https://X.com/a#top', 'HTTPS://x.com:443/a',
+                    'https://x.com/a?utm_source=feed&utm_medium=rss',
+                    'https://x.com./a?fbclid=1#x', ' https://x.com/a? '):
+            self.assertEqual(canonicalize_url(url), 'https://x.com/a')
+        self.assertEqual(canonicalize_url('http://x.com/a?utm_source=x'),
+                         'http://x.com/a')
+        self.assertEqual(canonicalize_url('http://x.com/a', https=True),
+                         'https://x.com/a')
+        self.assertEqual(canonicalize_url('http://u:P@X.com:8080?b=2&a=&c'),
+                         'http://u:P@x.com:8080/?a=&b=2&c')
+        self.assertEqual(canonicalize_url('http://x.com/A/b?x=%2F&x=1'),
+                         'http://x.com/A/b?x=%2F&x=1')
+
+    def test_dedup_index(self):
+        """Test the exact dedup index."""
+        index = self.module.DedupIndex()
+        self.assertTrue(index.add('a'))
+        self.assertFalse(index.add('a'))
+        self.assertTrue('a' in index)
+        self.assertFalse('b' in index)
+        self.assertEqual(len(index), 1)
+
+    def test_bloom_filter(self):
+        """Test the Bloom filter and its error rate."""
+        bloom = self.module.BloomFilter(10000, error_rate=0.01)
+        keys = ['http://x.com/{0}'.format(i) for i in range(10000)]
+        self.assertTrue(all(bloom.add(key) for key in keys[:10]))
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        self.assertFalse(bloom.add(keys[0]))
+        self.assertTrue(9900 <= len(bloom) <= 10000)
+        false = sum(u'http://y.com/{0}'.format(i) in bloom
+                    for i in range(10000))
+        self.assertTrue(false < 200)
+        self.assertTrue(len(bloom._bits) < 12000)
+        self.assertRaises(ValueError, self.module.BloomFilter, 0)
+        self.assertRaises(ValueError, self.module.BloomFilter, 10, 1)
+
+    def test_api_many(self):
+        """Test skipping duplicate URLs in a batch."""
+        client = self.module.Client(token=TOKEN, canonicalize=True)
+        urls = ['https://x.com/a#top', 'https://X.com/a?utm_source=x',
+                'https://x.com/b', 'https://x.com/a']
+        results = list(client.api_many('article', urls, ordered=True,
+                                       dedupe=True))
+        self.assertEqual([url for url, _ in results], urls[::2])
+        self.assertEqual([result['url'] for _, result in results],
+                         ['https://x.com/a', 'https://x.com/b'])
+        bloom = self.module.BloomFilter(100)
+        bloom.add('https://x.com/b')
+        results = list(client.api_many('article', urls, dedupe=bloom))
+        self.assertEqual([url for url, _ in results], urls[:1])
+        self.assertEqual(len(self.calls), 3)
+
+    def test_crawl_seeds(self):
+        """Test dropping duplicate crawl seeds."""
+        client = self.module.Client(token=TOKEN, canonicalize=True)
+        client.crawl(['https://x.com/', 'https://X.com/#a', 'https://y.com'])
+        self.assertEqual(self.calls[0]['seeds'],
+                         'https://x.com/ https://y.com/')
+        client = self.module.Client(token=TOKEN)
+        client.crawl('https://x.com/ https://x.com/ https://X.com/')
+        self.assertEqual(self.calls[1]['seeds'],
+                         'https://x.com/ https://X.com/')
+
+
+class CacheTest(unittest.TestCase):
+    """Response cache tests."""
+
+    def setUp(self):
+        """Set up a mock patcher."""
+        self.get = mock.Mock(side_effect=fake_requests_get)
+        self.patcher = mock.patch('requests.Session.get',
+                                  lambda session, *a, **kw: self.get(*a, **kw))
+        self.patcher.start()
+        import diffbot
+        self.module = imp.reload(diffbot)
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Stop the patcher."""
+        self.patcher.stop()
+        shutil.rmtree(self.tmp)
+
+    def test_client_cache(self):
+        """Test that repeated calls are served from the cache."""
+        cache = self.module.MemoryCache()
+        client = self.module.Client(token=TOKEN, cache=cache)
+        first = client.article(GITHUB_COM, fields=['title', 'url'])
+        second = client.article(GITHUB_COM, fields='url,title')
+        self.assertEqual(first, second)
+        self.assertEqual(self.get.call_count, 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        client.article(GITHUB_COM, fields='url')
+        client.product(GITHUB_COM, fields='url,title')
+        self.assertEqual(self.get.call_count, 3)
+
+    def test_lru(self):
+        """Test evicting the least recently used entry."""
+        cache = self.module.MemoryCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_ttl(self):
+        """Test that expired entries are not returned."""
+        cache = self.module.MemoryCache(ttl=0)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.misses, 1)
+
+    def test_sqlite(self):
+        """Test that the SQLite cache survives a restart."""
+        path = os.path.join(self.tmp, 'cache.db')
+        cache = self.module.SQLiteCache(path, maxsize=2)
+        client = self.module.Client(token=TOKEN, cache=cache)
+        client.article(GITHUB_COM)
+        cache.close()
+        cache = self.module.SQLiteCache(path, maxsize=2)
+        client = self.module.Client(token=TOKEN, cache=cache)
+        self.assertEqual(client.article(GITHUB_COM)['type'], 'article')
+        self.assertEqual(self.get.call_count, 1)
+        cache.set('b', [2])
+        cache.get('b')
+        cache.set('c', {'c': 3})
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('c'), {'c': 3})
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        cache.close()
+
+    def test_sqlite_lru(self):
+        """Test evicting the least recent SQLite cache entries in batches."""
+        path = os.path.join(self.tmp, 'cache.db')
+        cache = self.module.SQLiteCache(path, maxsize=200)
+        for key in range(200):
+            cache.set(str(key), key)
+        cache.get('0')
+        cache.close()
+        cache = self.module.SQLiteCache(path, maxsize=200)
+        cache.set('new', 1)
+        self.assertEqual(len(cache), 198)
+        self.assertEqual([cache.get(key) for key in ('0', '1', '3', '4')],
+                         [0, None, None, 4])
+        cache.close()
+
+
+class SingleFlightTest(unittest.TestCase):
+    """Request coalescing tests."""
+
+    def setUp(self):
+        """Set up a mock patcher that blocks until released."""
+        self.release = threading.Event()
+        self.calls = []
+        self.patcher = mock.patch(
+            'requests.Session.get',
+            lambda session, *args, **kwargs: self.fake_get(*args, **kwargs))
+        self.patcher.start()
+        import diffbot
+        self.module = imp.reload(diffbot)
+
+    def tearDown(self):
+        """Stop the patcher."""
+        self.patcher.stop()
+
+    def fake_get(self, url, params=None, **kwargs):
+        """Count calls, and wait for the test to release them."""
+        self.calls.append(url)
+        self.release.wait()
+        return fake_requests_get(url, params=params)
+
+    def run_threads(self, client, url, count=5):
+        """Call the Article API from several threads at once."""
+        results = []
+
+        def article():
+            try:
+                results.append(client.article(url))
+            except Exception as exc:  # pylint: disable=broad-except
+                results.append(exc)
+
+        threads = [threading.Thread(target=article) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        while not self.calls and len(results) < count:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_single_flight(self):
+        """Test that concurrent identical calls share one request."""
+        client = self.module.Client(token=TOKEN, single_flight=True)
+        results = self.run_threads(client, GITHUB_COM)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual([result['type'] for result in results],
+                         ['article'] * 5)
+        client.article(GITHUB_COM)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_single_flight_error(self):
+        """Test that all waiting callers get the exception."""
+        client = self.module.Client(token=TOKEN, single_flight=True)
+        results = self.run_threads(client, 'https://example.com')
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(len(results), 5)
+        for result in results:
+            self.assertTrue(isinstance(result, EnvironmentError))
+
+    def test_disabled(self):
+        """Test that calls are not coalesced by default."""
+        client = self.module.Client(token=TOKEN)
+        self.run_threads(client, GITHUB_COM, count=3)
+        self.assertEqual(len(self.calls), 3)
+
+
+class FakeHTTPError(Exception):
+    """A stub `requests.HTTPError` implementation."""
+
+    def __init__(self, status_code):
+        """Set up the response status code."""
+        Exception.__init__(self, status_code)
+        self.response = mock.Mock(status_code=status_code)
+
+
+class RateLimitTest(unittest.TestCase):
+    """Rate limiter and concurrency controller tests."""
+
+    def setUp(self):
+        """Set up a mock patcher."""
+        self.patcher = mock.patch('requests.Session.get', fake_session_get)
+        self.patcher.start()
+        import diffbot
+        self.module = imp.reload(diffbot)
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Stop the patcher."""
+        self.patcher.stop()
+        shutil.rmtree(self.tmp)
+
+    def test_rate_limiter(self):
+        """Test that calls are spaced out once the burst is used up."""
+        limiter = self.module.RateLimiter(rate=100, burst=5)
+        client = self.module.Client(token=TOKEN, rate_limiter=limiter)
+        start = time.time()
+        for _ in range(15):
+            client.article(GITHUB_COM)
+        self.assertTrue(time.time() - start >= 0.09)
+
+    def test_rate_limiter_file(self):
+        """Test sharing a bucket between limiters through a file."""
+        path = os.path.join(self.tmp, 'bucket')
+        first = self.module.RateLimiter(rate=20, burst=3, path=path)
+        second = self.module.RateLimiter(rate=20, burst=3, path=path)
+        for _ in range(3):
+            first.acquire()
+        start = time.time()
+        second.acquire()
+        self.assertTrue(time.time() - start >= 0.04)
+
+    def test_controller(self):
+        """Test additive increase and multiplicative decrease."""
+        controller = self.module.ConcurrencyController(
+            initial=4, minimum=1, maximum=5)
+        for _ in range(4):
+            controller.acquire()
+        self.assertEqual(controller.in_flight, 4)
+        for _ in range(4):
+            controller.release()
+        self.assertTrue(4.9 < controller.limit < 5)
+        controller.acquire()
+        controller.release()
+        self.assertEqual(controller.limit, 5)
+        controller.acquire()
+        controller.release(overloaded=True)
+        self.assertEqual(controller.limit, 2.5)
+        for _ in range(3):
+            controller.acquire()
+            controller.release(overloaded=True)
+        self.assertEqual(controller.limit, 1)
+
+    def test_controller_backoff(self):
+        """Test that the client reports overload errors."""
+        controller = self.module.ConcurrencyController(initial=8)
+        client = self.module.Client(token=TOKEN, controller=controller)
+        client.article(GITHUB_COM)
+        self.assertEqual(controller.limit, 8.125)
+        self.assertRaises(EnvironmentError, client.article,
+                          'https://example.com')
+        self.assertEqual(controller.limit, 8.125 + 1 / 8.125)
+        for status in (429, 503):
+            client._pool.get = mock.Mock(side_effect=FakeHTTPError(status))
+            self.assertRaises(FakeHTTPError, client.article, GITHUB_COM)
+        self.assertTrue(controller.limit < 2.5)
+        self.assertEqual(controller.in_flight, 0)
+
+
+class RetryTest(unittest.TestCase):
+    """Retry policy tests."""
+
+    def setUp(self):
+        """Set up a client with a stub transport."""
+        import diffbot
+        self.module = imp.reload(diffbot)
+        self.responses = []
+        self.calls = []
+
+    def fake_get(self, url, params=None, timeout=None, **kwargs):
+        """Return or raise the next queued response."""
+        self.calls.append((params, timeout))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        if callable(response):
+            return response()
+        return response
+
+    def client(self, **kwargs):
+        """Create a client with a retry policy."""
+        client = self.module.Client(
+            token=TOKEN, retry=self.module.RetryPolicy(**kwargs))
+        client._pool.get = self.fake_get
+        return client
+
+    def test_retry(self):
+        """Test retrying transient errors."""
+        client = self.client(backoff=0)
+        self.responses = [FakeHTTPError(503), IOError('reset'), {'ok': 1}]
+        self.assertEqual(client.article(GITHUB_COM), {'ok': 1})
+        self.assertEqual(len(self.calls), 3)
+
+    def test_attempts(self):
+        """Test giving up after the maximum number of attempts."""
+        client = self.client(attempts=2, backoff=0)
+        self.responses = [FakeHTTPError(502), FakeHTTPError(502), {}]
+        self.assertRaises(FakeHTTPError, client.article, GITHUB_COM)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_not_retryable(self):
+        """Test that client errors are not retried."""
+        client = self.client(backoff=0)
+        self.responses = [FakeHTTPError(404), {}]
+        self.assertRaises(FakeHTTPError, client.article, GITHUB_COM)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_backoff(self):
+        """Test the full jitter backoff delays."""
+        policy = self.module.RetryPolicy(backoff=1, max_backoff=5)
+        for attempt, limit in ((1, 1), (2, 2), (3, 4), (4, 5), (10, 5)):
+            for _ in range(10):
+                self.assertTrue(0 <= policy.delay(attempt) <= limit)
+
+    def test_deadline(self):
+        """Test that timeouts are limited by the deadline."""
+        client = self.client(deadline=2)
+        client._retry.delay = lambda attempt: 5
+        self.responses = [FakeHTTPError(503), {}]
+        self.assertRaises(FakeHTTPError, client.article, GITHUB_COM,
+                          timeout=5000)
+        self.assertEqual(len(self.calls), 1)
+        params, timeout = self.calls[0]
+        self.assertTrue(1.9 < timeout <= 2)
+        self.assertTrue(1900 < params['timeout'] <= 2000)
+
+    def test_hedge(self):
+        """Test that a hedged request wins over a slow one."""
+        client = self.client(hedge=0.05)
+
+        def slow():
+            time.sleep(0.5)
+            return {'slow': 1}
+
+        self.responses = [slow, {'fast': 1}]
+        start = time.time()
+        self.assertEqual(client.article(GITHUB_COM), {'fast': 1})
+        self.assertTrue(time.time() - start < 0.4)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_hedge_api_only(self):
+        """Test that only API calls are hedged, not crawl control calls."""
+        client = self.client(hedge=0.01)
+        job = self.module.Job(TOKEN, 'crawl', pool=client.pool,
+                              retry=client._retry)
+
+        def slow():
+            time.sleep(0.1)
+            return {'jobs': [{'name': 'crawl'}]}
+
+        self.responses = [slow, {}]
+        self.assertEqual(job.delete(), {'name': 'crawl'})
+        self.assertEqual(len(self.calls), 1)
+
+    def test_hedge_latencies(self):
+        """Test that only API calls count towards the hedging delay."""
+        client = self.client(hedge=True)
+        job = self.module.Job(TOKEN, 'crawl', pool=client.pool,
+                              retry=client._retry)
+        self.responses = [{'jobs': [{'name': 'crawl'}]}, {'ok': 1}]
+        job.delete()
+        self.assertEqual(len(client._retry._latencies), 0)
+        client.article(GITHUB_COM)
+        self.assertEqual(len(client._retry._latencies), 1)
+
+    def test_hedge_stream(self):
+        """Test closing a losing hedged stream."""
+        client = self.client()
+        streams = [self.module.Stream(200, {}, iter(()), mock.Mock())
+                   for _ in range(2)]
+
+        attempts = [(streams[0], 0.1), (streams[1], 0)]
+
+        def send():
+            stream, delay = attempts.pop(0)
+            time.sleep(delay)
+            return stream
+
+        self.assertTrue(client._hedge(0.01, send) is streams[1])
+        time.sleep(0.2)
+        self.assertTrue(streams[0]._close.called)
+        self.assertFalse(streams[1]._close.called)
+
+    def test_hedge_p95(self):
+        """Test hedging after the 95th percentile latency."""
+        policy = self.module.RetryPolicy(hedge=True)
+        self.assertEqual(policy.hedge_delay(), None)
+        for latency in range(100):
+            policy.record(latency / 100.0)
+        self.assertEqual(policy.hedge_delay(), 0.95)
+
+
+class HooksTest(unittest.TestCase):
+    """Instrumentation hook and metrics tests."""
+
+    def setUp(self):
+        """Set up a mock patcher."""
+        self.patcher = mock.patch('requests.Session.get', fake_session_get)
+        self.patcher.start()
+        import diffbot
+        self.module = imp.reload(diffbot)
+
+    def tearDown(self):
+        """Stop the patcher."""
+        self.patcher.stop()
+
+    def test_hooks(self):
+        """Test the order and arguments of the callbacks."""
+        events = []
+
+        class Hooks(self.module.Hooks):
+            """Record the callbacks."""
+
+            def before_request(self, call):
+                events.append(('before', call.api, call.status))
+
+            def after_response(self, call):
+                events.append(('after', call.api, call.status,
+                               call.bytes_received, call.response_time))
+
+            def on_error(self, call, exc):
+                events.append(('error', call.api, type(exc)))
+
+        client = self.module.Client(token=TOKEN, hooks=[Hooks()])
+        client.article(GITHUB_COM)
+        self.assertRaises(EnvironmentError, client.article,
+                          'https://example.com')
+        self.assertEqual(events[0], ('before', 'article', None))
+        self.assertEqual(events[1][:3], ('after', 'article', 200))
+        self.assertTrue(events[1][3] > 1000)
+        self.assertEqual(events[1][4], 0.005)
+        self.assertEqual(events[3][:2], ('error', 'article'))
+        self.assertTrue(issubclass(events[3][2], EnvironmentError))
+
+    def test_metrics(self):
+        """Test collecting metrics per API."""
+        metrics = self.module.Metrics()
+        client = self.module.Client(
+            token=TOKEN, hooks=[metrics],
+            retry=self.module.RetryPolicy(backoff=0))
+        responses = [FakeHTTPError(503), {'ok': 1}]
+
+        def fake_get(url, params=None, call=None, **kwargs):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            call.status = 200
+            return response
+
+        client.article(GITHUB_COM)
+        client.product(GITHUB_COM)
+        client._pool.get = fake_get
+        client.article(GITHUB_COM)
+        stats = metrics.stats()
+        self.assertEqual(sorted(stats), ['article', 'product'])
+        article = stats['article']
+        self.assertEqual((article['calls'], article['errors'],
+                          article['retries']), (3, 1, 1))
+        self.assertEqual(article['statuses'], {200: 2, 503: 1})
+        self.assertTrue(article['bytes_received'] > 1000)
+        self.assertEqual(article['bytes_sent'], 0)
+        self.assertTrue(0 <= article['p50'] <= article['p99'])
+        self.assertTrue(article['queued'] >= 0)
+        metrics.reset()
+        self.assertEqual(metrics.stats(), {})
+
+    def test_percentiles(self):
+        """Test the accuracy of the latency percentiles."""
+        metrics = self.module.Metrics()
+        for i in range(1, 1001):
+            call = self.module.Call('article', GITHUB_COM)
+            call.sent = call.started
+            call.finished = call.sent + i / 1000.0
+            metrics.after_response(call)
+        stats = metrics.stats()['article']
+        for key, value in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+            self.assertTrue(value <= stats[key] <= value * 1.1)
+        self.assertAlmostEqual(stats['mean'], 0.5005)
+
+
+class FakeStreamResponse(object):
+    """A stub streamed `requests.Response` implementation."""
+
+    def __init__(self, body, chunk_size=7, status_code=200, headers=None):
+        """Set up the response body, served in tiny chunks."""
+        self.body = body
+        self.chunk_size = chunk_size
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def raise_for_status(self):
+        """This would raise an exception if the status code >= 400."""
+
+    def iter_content(self, chunk_size):
+        """Yield the body in chunks."""
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+
+    def close(self):
+        """Mark the response as closed."""
+        self.closed = True
+
+
+class JobDownloadTest(unittest.TestCase):
+    """Crawl job download tests."""
+
+    def setUp(self):
+        """Set up a stub transport serving the crawl data."""
+        import diffbot
+        self.module = imp.reload(diffbot)
+        self.job = self.module.Job(TOKEN, 'crawl')
+        self.requests = []
+        self.response = None
+
+    def fake_get(self, url, params=None, **kwargs):
+        """Record the request and return the stub response."""
+        self.requests.append((url, kwargs))
+        return self.response
+
+    def download(self, body, format='json', **kwargs):
+        """Stream a download with the given body."""
+        self.response = FakeStreamResponse(body, **kwargs)
+        with mock.patch('requests.Session.get',
+                        lambda session, *a, **kw: self.fake_get(*a, **kw)):
+            return list(self.job.iter_download(format))
+
+    def test_iter_download_json(self):
+        """Test streaming JSON records."""
+        records = [
+            {'title': u'Hello, World!', 'url': 'http://a.com/[1]'},
+            {'title': u'\u00c1rv\u00edzt\u0171r\u0151', 'tags': [1, {}]},
+            {'text': u'"{,}" ' * 50},
+        ]
+        body = json.dumps(records, indent=1).encode('utf-8')
+        self.assertEqual(self.download(body), records)
+        url, kwargs = self.requests[0]
+        self.assertEqual(url, 'http://api.diffbot.com/v3/crawl/download/'
+                              'test-crawl_data.json')
+        self.assertTrue(kwargs['stream'])
+        self.assertTrue(self.response.closed)
+
+    def test_iter_download_json_numbers(self):
+        """Test streaming numbers split between chunks."""
+        self.assertEqual(self.download(b'[123,4567, 8, true]', chunk_size=4),
+                         [123, 4567, 8, True])
+        self.assertRaises(ValueError, self.download, b'[12', chunk_size=2)
+
+    def test_iter_download_json_empty(self):
+        """Test streaming an empty JSON array."""
+        self.assertEqual(self.download(b' [ ] '), [])
+
+    def test_iter_download_json_invalid(self):
+        """Test streaming truncated JSON."""
+        self.assertRaises(ValueError, self.download, b'[{"a": 1}, {"b"')
+        self.assertRaises(ValueError, self.download, b'{"a": 1}')
+
+    def test_iter_download_csv(self):
+        """Test streaming CSV records."""
+        body = u'title,url\r\n"Multi\nline",http://a.com/\r\n' \
+            u'\u00c1rv\u00edzt\u0171r\u0151,http://b.com/\r\n'
+        records = self.download(body.encode('utf-8'), format='csv')
+        self.assertEqual([dict(record) for record in records], [
+            {'title': 'Multi\nline', 'url': 'http://a.com/'},
+            {'title': u'\u00c1rv\u00edzt\u0171r\u0151',
+             'url': 'http://b.com/'},
+        ])
+
+    def serve(self, body, ranges=True, fail_after=None, changed=None,
+              if_range=True, etags=True):
+        """Serve a download, optionally supporting ranges or failing.
+
+        After the first request, the `changed` body is served, if given.
+        """
+        def fake_get(session, url, params=None, headers=None, **kwargs):
+            headers = headers or {}
+            self.requests.append(dict(headers))
+            current = body
+            if changed is not None and len(self.requests) > 1:
+                current = changed
+            etag = '"{0}"'.format(hashlib.md5(current).hexdigest())
+            offset = 0
+            if ranges and 'Range' in headers and not (
+                    if_range and headers.get('If-Range') not in (None, etag)):
+                offset = int(headers['Range'][6:-1])
+            data = current[offset:]
+            response_headers = {'Content-Length': str(len(data))}
+            if etags:
+                response_headers['ETag'] = etag
+            if offset:
+                response_headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(
+                    offset, len(current) - 1, len(current))
+            response = FakeStreamResponse(
+                data, status_code=206 if offset else 200,
+                headers=response_headers)
+            if fail_after is not None and len(self.requests) == 1:
+                chunks = response.iter_content
+
+                def iter_content(chunk_size):
+                    for index, chunk in enumerate(chunks(chunk_size)):
+                        if index == fail_after:
+                            raise IOError('Connection reset.')
+                        yield chunk
+                response.iter_content = iter_content
+            return response
+        return mock.patch('requests.Session.get', fake_get)
+
+    def test_download_to(self):
+        """Test downloading to a file."""
+        tmp = tempfile.mkdtemp()
+        path = os.path.join(tmp, 'crawl.json')
+        body = b'[{"a": 1}, {"b": 2}]' * 10
+        try:
+            with self.serve(body):
+                digest = self.job.download_to(path)
+            with open(path, 'rb') as src:
+                self.assertEqual(src.read(), body)
+            self.assertEqual(digest, hashlib.sha256(body).hexdigest())
+            self.assertFalse(os.path.exists(path + '.part'))
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_download_to_resume(self):
+        """Test resuming an interrupted download."""
+        tmp = tempfile.mkdtemp()
+        path = os.path.join(tmp, 'crawl.json')
+        body = b''.join(str(i).encode('ascii') for i in range(100))
+        try:
+            with self.serve(body, fail_after=3):
+                digest = self.job.download_to(path, hash='md5',
+                                              expected_hash=hashlib.md5(
+                                                  body).hexdigest())
+            self.assertEqual(self.requests[1]['Range'], 'bytes=21-')
+            with open(path, 'rb') as src:
+                self.assertEqual(src.read(), body)
+            self.assertEqual(digest, hashlib.md5(body).hexdigest())
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_download_to_changed(self):
+        """Test starting over when the file changed since it was cut off."""
+        tmp = tempfile.mkdtemp()
+        path = os.path.join(tmp, 'crawl.json')
+        body = b''.join(str(i).encode('ascii') for i in range(100))
+        changed = body[::-1] + b'0'
+        try:
+            # A server ignoring If-Range is caught by the ETag, or failing
+            # that, by the size in the Content-Range.
+            for if_range, etags, ranges in (
+                    (True, True, [False, True]),
+                    (False, True, [False, True, False]),
+                    (False, False, [False, True, False])):
+                self.requests = []
+                with self.serve(body, fail_after=3, changed=changed,
+                                if_range=if_range, etags=etags):
+                    self.job.download_to(path)
+                self.assertEqual(['Range' in request
+                                  for request in self.requests], ranges)
+                self.assertEqual('If-Range' in self.requests[1], etags)
+                with open(path, 'rb') as src:
+                    self.assertEqual(src.read(), changed)
+                self.assertEqual(os.listdir(tmp), ['crawl.json'])
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_download_to_no_ranges(self):
+        """Test restarting when the server ignores the range."""
+        tmp = tempfile.mkdtemp()
+        path = os.path.join(tmp, 'crawl.csv')
+        body = b'title,url\r\n' * 20
+        try:
+            with open(path + '.part', 'wb') as dst:
+                dst.write(b'garbage')
+            with self.serve(body, ranges=False):
+                self.job.download_to(path, format='csv')
+            self.assertEqual(self.requests[0]['Range'], 'bytes=7-')
+            with open(path, 'rb') as src:
+                self.assertEqual(src.read(), body)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_download_to_checksum(self):
+        """Test a checksum mismatch."""
+        tmp = tempfile.mkdtemp()
+        path = os.path.join(tmp, 'crawl.json')
+        try:
+            with self.serve(b'[]'):
+                self.assertRaises(ValueError, self.job.download_to, path,
+                                  expected_hash='0' * 64)
+            self.assertFalse(os.path.exists(path))
+            self.assertFalse(os.path.exists(path + '.part'))
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_iter_download_format(self):
+        """Test requesting an unsupported format."""
+        self.assertRaises(ValueError, self.job.iter_download, 'xml')
+
+    def sync(self, checkpoint, records, **kwargs):
+        """Sync a download of the given records."""
+        with self.serve(json.dumps(records).encode('utf-8')):
+            return list(self.job.sync(checkpoint, **kwargs))
+
+    def test_sync(self):
+        """Test yielding only new and changed records."""
+        tmp = tempfile.mkdtemp()
+        path = os.path.join(tmp, 'sync.db')
+        first = [
+            {'pageUrl': 'http://a.com/', 'title': 'A', 'timestamp': 1},
+            {'pageUrl': 'http://b.com/', 'title': 'B', 'timestamp': 1},
+            {'title': 'No URL'},
+        ]
+        second = [
+            {'pageUrl': 'http://a.com/', 'title': 'A', 'timestamp': 2},
+            {'pageUrl': 'http://c.com/', 'title': 'C', 'timestamp': 2},
+            {'title': 'No URL'},
+        ]
+        try:
+            self.assertEqual(self.sync(path, first), first)
+            self.assertEqual(self.sync(path, first), [])
+            self.assertEqual(self.sync(path, second), second[:2])
+            checkpoint = self.module.SyncCheckpoint(
+                os.path.join(tmp, 'ignore.db'))
+            ignore = ['timestamp']
+            self.assertEqual(self.sync(checkpoint, first, ignore=ignore),
+                             first)
+            self.assertEqual(checkpoint.removed(), [])
+            self.assertEqual(self.sync(checkpoint, second, ignore=ignore),
+                             second[1:2])
+            self.assertEqual(checkpoint.removed(), ['http://b.com/'])
+            second[0]['title'] = 'Changed'
+            self.assertEqual(self.sync(checkpoint, second, ignore=ignore),
+                             second[:1])
+            self.assertEqual(len(checkpoint), 4)
+            checkpoint.close()
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_sync_interrupted(self):
+        """Test resuming an interrupted sync."""
+        tmp = tempfile.mkdtemp()
+        checkpoint = self.module.SyncCheckpoint(
+            os.path.join(tmp, 'sync.db'), batch_size=2)
+        records = [{'pageUrl': 'http://a.com/{0}'.format(i)}
+                   for i in range(5)]
+        try:
+            with self.serve(json.dumps(records).encode('utf-8')):
+                synced = self.job.sync(checkpoint)
+                self.assertEqual([next(synced) for _ in range(3)],
+                                 records[:3])
+                synced.close()
+            self.assertEqual(checkpoint.removed(), [])
+            self.assertEqual(self.sync(checkpoint, records), records[2:])
+            checkpoint.close()
+        finally:
+            shutil.rmtree(tmp)
+
+
+class JobStatusTest(unittest.TestCase):
+    """Crawl job status tests."""
+
+    def setUp(self):
+        """Set up a job with a stub status endpoint."""
+        import diffbot
+        self.module = imp.reload(diffbot)
+        self.job = self.module.Job(TOKEN, 'crawl')
+        self.statuses = []
+        self.calls = 0
+        self.job._pool.get = self.fake_get
+
+    def fake_get(self, url, params=None, **kwargs):
+        """Return the next job status in the crawl job list."""
+        self.calls += 1
+        status, crawled = self.statuses.pop(0)
+        return {'jobs': [
+            {'name': 'other', 'jobStatus': {'status': 1}},
+            {'name': 'crawl', 'jobStatus': {'status': status},
+             'pageCrawlSuccesses': crawled},
+        ]}
+
+    def test_snapshot(self):
+        """Test that the status predicates share one request."""
+        self.statuses = [(7, 0), (9, 0)]
+        self.assertFalse(self.job.is_finished())
+        self.assertTrue(self.job.is_running())
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.job.snapshot['jobStatus']['status'], 7)
+        self.assertEqual(self.job.status_code(), 9)
+        self.assertEqual(self.calls, 2)
+
+    def test_wait(self):
+        """Test waiting with adaptive polling intervals."""
+        self.statuses = [(7, 0), (7, 0), (7, 0), (7, 5), (7, 10), (9, 10)]
+        progress = []
+        with mock.patch('time.sleep') as sleep:
+            job = self.job.wait(interval=1, max_interval=3,
+                                on_progress=progress.append)
+        self.assertEqual(job['jobStatus']['status'], 9)
+        self.assertEqual(len(progress), 6)
+        self.assertEqual([call[0][0] for call in sleep.call_args_list],
+                         [1, 2, 3, 1.5, 1])
+
+    def test_wait_timeout(self):
+        """Test giving up waiting."""
+        self.statuses = [(7, 0)] * 10
+        job = self.job.wait(timeout=0.05, interval=0.02)
+        self.assertEqual(job['jobStatus']['status'], 7)
+        self.calls = 0
+        with mock.patch('time.sleep') as sleep:
+            job = self.job.wait(timeout=0)
+        self.assertEqual(job['jobStatus']['status'], 7)
+        self.assertEqual(self.calls, 1)
+        self.assertFalse(sleep.called)
+
+
+class JobManagerTest(unittest.TestCase):
+    """Crawl job manager tests."""
+
+    def setUp(self):
+        """Set up a client with a stub crawl endpoint."""
+        import diffbot
+        self.module = imp.reload(diffbot)
+        self.client = self.module.Client(token=TOKEN)
+        self.client._pool.get = self.fake_get
+        self.statuses = {}
+        self.requests = []
+
+    def fake_get(self, url, params=None, **kwargs):
+        """Return the list of all crawl jobs."""
+        self.requests.append(params)
+        return {'jobs': [
+            {'name': name, 'jobStatus': {'status': status}}
+            for name, status in sorted(self.statuses.items())]}
+
+    def test_poll(self):
+        """Test polling many jobs with one request."""
+        changes = []
+        manager = self.client.job_manager(
+            ['a', 'b'], on_change=lambda *args: changes.append(args))
+        job = manager.add(self.module.Job(TOKEN, 'c'))
+        self.assertEqual(len(manager), 3)
+        self.statuses = {'a': 7, 'b': 7, 'c': 0, 'x': 9}
+        self.assertEqual(len(manager.poll()), 3)
+        self.assertEqual(self.requests, [{'token': TOKEN}])
+        self.assertEqual(job.snapshot['jobStatus']['status'], 0)
+        self.assertFalse(manager['a'].is_finished())
+        self.assertEqual(len(self.requests), 1)
+        self.statuses['b'] = 9
+        self.assertEqual(manager.poll(), [manager['b']])
+        self.assertEqual(changes[-1], (manager['b'], 7, 9))
+        self.assertEqual(len(changes), 4)
+
+    def test_wait(self):
+        """Test waiting for all jobs to finish."""
+        manager = self.client.job_manager(['a', 'b'])
+        self.statuses = {'a': 9, 'b': 7}
+        with mock.patch('time.sleep', lambda seconds: self.statuses.update(
+                b=1)):
+            self.assertEqual(manager.wait(), [])
+        self.assertEqual(len(self.requests), 2)
+        manager.remove('a')
+        self.assertEqual([job.name for job in manager], ['b'])
+
+    def test_missing(self):
+        """Test that jobs missing from the job list are not waited for."""
+        changes = []
+        manager = self.client.job_manager(
+            ['a', 'b', 'c'], on_change=lambda *args: changes.append(args))
+        self.statuses = {'a': 9, 'b': 7}
+        with mock.patch('time.sleep', lambda seconds: self.statuses.update(
+                b=9)):
+            self.assertEqual(manager.wait(), [])
+        self.assertEqual(manager.missing, [manager['c']])
+        self.assertEqual(sorted(((job.name, previous, code)
+                                 for job, previous, code in changes),
+                                key=lambda change: change[0]),
+                         [('a', None, 9), ('b', None, 7), ('b', 7, 9),
+                          ('c', None, None)])
+        del self.statuses['b']
+        self.assertEqual(manager.poll(), [manager['b']])
+        self.assertEqual(changes[-1], (manager['b'], 9, None))
+        self.statuses['b'] = 9
+        self.assertEqual(manager.poll(), [manager['b']])
+        self.assertEqual(changes[-1], (manager['b'], None, 9))
+        self.assertEqual(manager.wait(timeout=0), [])
+        manager.remove('c')
+        self.assertEqual(manager.missing, [])
+
+
+class ImportTest(unittest.TestCase):
+    """Import tests."""
+
+    script = """
+import json
+import sys
+import diffbot
+sys.stdout.write(json.dumps(sorted(sys.modules)))
+"""
+
+    def test_import(self):
+        """Test that importing doesn't load the transports or the CLI."""
+        modules = json.loads(subprocess.check_output([
+            sys.executable, '-c', self.script]).decode('ascii'))
+        for module in ('requests', 'urllib2', 'urllib.request', 'argparse'):
+            self.assertFalse(module in modules, module)
+
+    def test_lazy_requests(self):
+        """Test that `requests` is loaded on first use."""
+        import diffbot
+        diffbot = imp.reload(diffbot)
+        self.assertTrue(diffbot.requests.Session is sys.modules[
+            'requests'].Session)
+
+
+class DecoderTest(unittest.TestCase):
+    """JSON decoder tests."""
+
+    def setUp(self):
+        """Set up a mock patcher."""
+        self.patcher = mock.patch('requests.Session.get', fake_session_get)
+        self.patcher.start()
+        import diffbot
+        self.module = imp.reload(diffbot)
+
+    def tearDown(self):
+        """Stop the patcher."""
+        self.patcher.stop()
+
+    def test_decoder(self):
+        """Test using a custom decoder."""
+        decoder = mock.Mock(side_effect=json.loads)
+        client = self.module.Client(token=TOKEN, decoder=decoder)
+        self.assertEqual(client.article(GITHUB_COM)['type'], 'article')
+        self.assertEqual(decoder.call_count, 1)
+
+    def test_fast_decoder(self):
+        """Test picking the fastest decoder available."""
+        with mock.patch.dict(sys.modules, {'orjson': None, 'ujson': None}):
+            self.assertTrue(self.module.fast_decoder() is json.loads)
+        ujson = mock.Mock()
+        with mock.patch.dict(sys.modules, {'orjson': None, 'ujson': ujson}):
+            self.assertTrue(self.module.fast_decoder() is ujson.loads)
+
+
+class ResultTest(unittest.TestCase):
+    """Result object tests."""
+
+    def setUp(self):
+        """Set up some API objects."""
+        import diffbot
+        self.module = imp.reload(diffbot)
+        self.article = {
+            'type': 'article', 'title': 'GitHub', 'siteName': 'GitHub',
+            'pageUrl': GITHUB_COM, 'date': None, 'foo': [{'bar': 1}],
+            'images': [{'url': GITHUB_COM + '/x.png', 'primary': True}]}
+        self.response = json.loads(json.dumps({'objects': [
+            self.article, self.article,
+            {'type': 'image', 'url': GITHUB_COM + '/x.png'},
+            {'type': 'video', 'title': 'x'}]}))
+
+    def test_fields(self):
+        """Test accessing the fields of a result."""
+        article = self.module.Article(self.article)
+        self.assertEqual(article.title, 'GitHub')
+        self.assertEqual(article.foo, [{'bar': 1}])
+        self.assertEqual(article.images[0]['primary'], True)
+        self.assertTrue(article.date is None)
+        self.assertTrue(article.author is None)
+        self.assertRaises(AttributeError, getattr, article, 'bar')
+        self.assertRaises(AttributeError, setattr, article, 'bar', 1)
+        self.assertEqual(article.raw, self.article)
+        self.assertTrue(GITHUB_COM in repr(article))
+
+    def test_objects(self):
+        """Test wrapping the objects of a response."""
+        results = self.module.objects(self.response)
+        self.assertEqual([type(result).__name__ for result in results],
+                         ['Article', 'Article', 'Image', 'dict'])
+        self.assertEqual(results[2].url, GITHUB_COM + '/x.png')
+        self.assertEqual(results[3], {'type': 'video', 'title': 'x'})
+        self.assertEqual(self.module.objects({}), [])
+
+    def test_interning(self):
+        """Test that keys and repeated values are shared between results."""
+        first, second = self.module.objects(self.response)[:2]
+        self.assertTrue(first.siteName is second.siteName)
+        self.assertTrue(first.type is second.type)
+        self.assertFalse(first.title is second.title)
+        key = list(first.images[0])[0]
+        self.assertTrue(key is list(second.images[0])[0])
+
+    def test_interning_limit(self):
+        """Test that the table of shared strings stops growing when full."""
+        self.module.objects(self.response)
+        size = len(self.module._interned)
+        with mock.patch.object(self.module, 'INTERN_LIMIT', size + 10):
+            for i in range(100):
+                self.module.Article({'type': 'article',
+                                     'specs': {'spec%d' % i: 'x'}})
+            self.assertEqual(len(self.module._interned), size + 10)
+            first, second = self.module.objects(self.response)[:2]
+        self.assertTrue(first.siteName is second.siteName)
+
+
 class ClientTestUrllib(unittest.TestCase):
     """API method tests using `urllib2` and `urllib`.
 
@@ -253,7 +1504,7 @@ class ClientTestPOST(unittest.TestCase):
 
     def setUp(self):
         """Set up a mock patcher."""
-        self.patcher = mock.patch('requests.post', fake_requests_post)
+        self.patcher = mock.patch('requests.Session.post', fake_session_post)
         self.patcher.start()
         import diffbot
         self.client = diffbot.Client(token=TOKEN)
@@ -284,6 +1535,31 @@ class ClientTestPOST(unittest.TestCase):
             ''')
         self.assertRaises(ValueError, raises)
 
+    def test_compress(self):
+        """Test sending compressed and binary request bodies."""
+        posts = []
+
+        def post(session, url, params=None, data=None, headers=None,
+                 **kwargs):
+            posts.append((data, headers))
+            return fake_requests_post(url, params=params)
+
+        import diffbot
+        client = diffbot.Client(token=TOKEN, compress=True)
+        html = u'<p>\u00e1</p>' * 1000
+        with mock.patch('requests.Session.post', post):
+            client.article(GITHUB_COM, html=html)
+            for body in (b'<p>x</p>', bytearray(b'<p>x</p>'),
+                         memoryview(b'<p>x</p>')):
+                client.article(GITHUB_COM, html=body)
+        data, headers = posts[0]
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(zlib.decompress(data, 16 + zlib.MAX_WBITS),
+                         html.encode('utf-8'))
+        for data, headers in posts[1:]:
+            self.assertEqual(data, b'<p>x</p>')
+            self.assertEqual(headers, {'Content-Type': 'text/html'})
+
 
 class ClientTestPOSTUrllib(unittest.TestCase):
     """POST API method tests using `urllib2` and `urllib`.
@@ -307,6 +1583,7 @@ class ClientTestPOSTUrllib(unittest.TestCase):
         import diffbot
         diffbot = imp.reload(diffbot)
         del diffbot.requests
+        self.module = diffbot
         self.client = diffbot.Client(token=TOKEN)
 
     def tearDown(self):
@@ -322,14 +1599,765 @@ class ClientTestPOSTUrllib(unittest.TestCase):
         self.assertEqual(result['url'], GITHUB_COM)
         self.assertEqual(result['title'], 'Build software better, together.')
 
+    def test_gzip_response(self):
+        """Test reading a gzip-encoded response in chunks."""
+        url = 'http://api.diffbot.com/v3/article?url=' + GITHUB_COM
+        resource = os.path.join('tests', 'resources', 'github.com', 'v3',
+                                'article.json')
+        with open(resource, 'rb') as src:
+            body = src.read()
+        response = self.module._urlopen(url)
+        self.assertEqual(b''.join(iter(lambda: response.read(100), b'')),
+                         body)
+        self.assertEqual(self.module._urlopen(url).read(), body)
+        response = self.module._urlopen(
+            url, headers={'Accept-Encoding': 'identity'})
+        self.assertEqual(response.info(), {})
+
+
+class PipelineTest(unittest.TestCase):
+    """Pipeline tests."""
+
+    def setUp(self):
+        """Set up a mock patcher and a temporary directory."""
+        self.patcher = mock.patch('requests.Session.get', fake_session_get)
+        self.patcher.start()
+        import diffbot
+        import diffbot_pipeline
+        self.module = diffbot_pipeline
+        self.client = imp.reload(diffbot).Client(token=TOKEN)
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Stop the patcher and remove the temporary directory."""
+        self.patcher.stop()
+        shutil.rmtree(self.tmp)
+
+    def test_jsonl(self):
+        """Test extracting URLs into a JSON lines file."""
+        module = self.module
+        path = os.path.join(self.tmp, 'out.jsonl')
+        urls = [GITHUB_COM, 'https://example.com'] * 10
+        pipeline = module.Pipeline(
+            module.Dedupe(),
+            module.Extract(self.client, 'article', workers=4),
+            module.Objects(),
+            module.JSONLinesSink(path),
+            queue_size=2)
+        stages = pipeline.run(iter(urls))
+        with open(path) as src:
+            records = sorted((json.loads(line) for line in src),
+                             key=lambda record: record['url'])
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['url'], 'https://example.com')
+        self.assertTrue('error' in records[0])
+        self.assertEqual(records[1]['url'], GITHUB_COM)
+        self.assertEqual(records[1]['type'], 'article')
+        self.assertEqual([stage.name for stage in stages],
+                         ['Dedupe', 'article', 'Objects', 'JSONLinesSink'])
+        self.assertEqual([(stage.stats.items, stage.stats.outputs)
+                          for stage in stages],
+                         [(20, 2), (2, 2), (2, 2), (2, 0)])
+        for stage in stages:
+            self.assertTrue(stage.stats.throughput > 0)
+            self.assertTrue(stage.stats.latency <= stage.stats.max_latency)
+            self.assertTrue('items' in repr(stage.stats))
+
+    def test_csv(self):
+        """Test writing records as CSV."""
+        module = self.module
+        path = os.path.join(self.tmp, 'out.csv')
+        records = [{'url': u'http://a/\u00e1', 'tags': ['x', 'y']},
+                   {'url': 'http://b/', 'n': 1}]
+        module.Pipeline(module.CSVSink(path, ['url', 'n', 'tags'])).run(
+            records)
+        with open(path, 'rb') as src:
+            lines = src.read().decode('utf-8').splitlines()
+        self.assertEqual(lines, [u'url,n,tags',
+                                 u'http://a/\u00e1,,"[""x"", ""y""]"',
+                                 u'http://b/,1,'])
+
+    @unittest.skipIf(sys.version_info < (3, 3), 'needs Python 3.3+')
+    def test_columnar(self):
+        """Test writing records to a column store."""
+        module = self.module
+        path = os.path.join(self.tmp, 'out')
+        records = [{'url': 'http://a/', 'sentiment': 0.5},
+                   {'url': 'http://b/'}]
+        module.Pipeline(module.ColumnarSink(path, ['url', 'sentiment'])).run(
+            records)
+        import diffbot_columnar
+        with diffbot_columnar.Columns(path) as columns:
+            self.assertEqual(list(columns.records()), [
+                {'url': 'http://a/', 'sentiment': 0.5},
+                {'url': 'http://b/', 'sentiment': None}])
+
+        def fail(item):
+            if item['url'] == 'http://b/':
+                raise ZeroDivisionError()
+            return item
+
+        path = os.path.join(self.tmp, 'failed')
+        self.assertRaises(ZeroDivisionError, module.Pipeline(
+            module.Map(fail), module.ColumnarSink(path, ['url'])).run,
+            records)
+        self.assertRaises(EnvironmentError, diffbot_columnar.Columns, path)
+
+    def test_iter(self):
+        """Test iterating over the output of parallel stages."""
+        module = self.module
+        pipeline = module.Pipeline(
+            module.Map(lambda n: n * 2, workers=3),
+            module.Filter(lambda n: n % 3),
+            module.Stage(lambda n: range(n % 4)),
+            queue_size=1)
+        self.assertEqual(sorted(pipeline.iter(range(10))),
+                         sorted(i for n in range(10) if n * 2 % 3
+                                for i in range(n * 2 % 4)))
+
+    def test_bounded(self):
+        """Test that the input is read no further ahead than the queues."""
+        module = self.module
+        read = []
+        release = threading.Event()
+
+        def source():
+            for item in range(100):
+                read.append(item)
+                yield item
+
+        def wait(item):
+            release.wait()
+            return item
+
+        pipeline = module.Pipeline(module.Map(wait), queue_size=2)
+        output = pipeline.iter(source())
+        thread = threading.Thread(target=lambda: self.assertEqual(
+            len(list(output)), 100))
+        thread.start()
+        time.sleep(0.1)
+        self.assertTrue(len(read) <= 6)
+        release.set()
+        thread.join()
+        self.assertEqual(len(read), 100)
+
+    def test_latency(self):
+        """Test that the latency excludes waiting for the next stage."""
+        module = self.module
+
+        def slow(item):
+            time.sleep(0.05)
+            return item
+
+        stages = module.Pipeline(module.Map(lambda n: n), module.Map(slow),
+                                 queue_size=1).run(range(5))
+        self.assertTrue(stages[0].stats.max_latency < 0.025)
+        self.assertTrue(stages[1].stats.latency >= 0.05)
+
+    def test_error(self):
+        """Test that a failing stage stops the pipeline."""
+        module = self.module
+        closed = []
+
+        def fail(item):
+            if item == 5:
+                raise ZeroDivisionError()
+            return item
+
+        stage = module.Map(fail)
+        stage.close = lambda: closed.append(True)
+        pipeline = module.Pipeline(stage, module.Map(lambda n: n))
+        self.assertRaises(ZeroDivisionError, pipeline.run, range(1000))
+        self.assertEqual(closed, [True])
+        self.assertRaises(ValueError, module.Pipeline)
+        self.assertRaises(ValueError, module.Stage, len, workers=0)
+
+    def test_open_error(self):
+        """Test that stages opened before a failing one are closed."""
+        module = self.module
+        path = os.path.join(self.tmp, u'out.jsonl')
+        sink = module.JSONLinesSink(path)
+
+        def fail():
+            raise IOError()
+
+        stage = module.Map(lambda n: n)
+        stage.open = fail
+        stage.close = lambda: self.fail('Closed a stage that failed to open.')
+        pipeline = module.Pipeline(sink, stage)
+        self.assertRaises(IOError, pipeline.run, range(10))
+        self.assertTrue(os.path.exists(path))
+        self.assertTrue(sink._file is None)
+
+
+@unittest.skipIf(sys.version_info < (3, 3), 'needs Python 3.3+')
+class ColumnarTest(unittest.TestCase):
+    """Column store tests."""
+
+    def setUp(self):
+        """Set up a temporary directory."""
+        import diffbot_columnar
+        self.module = diffbot_columnar
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'columns')
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.tmp)
+
+    def test_columns(self):
+        """Test column names for API fields."""
+        columns = self.module.columns
+        self.assertEqual(columns('title, images(url,title),tags(label)'),
+                         ['title', 'images.url', 'images.title',
+                          'tags.label'])
+        self.assertEqual(columns(['a', 'b(c(d))']), ['a', 'b.c.d'])
+        self.assertRaises(ValueError, columns, 'a(b')
+        self.assertRaises(ValueError, columns, 'a)')
+        self.assertRaises(ValueError, columns, '(a)')
+
+    def test_round_trip(self):
+        """Test writing and reading objects, over several batches."""
+        objs = []
+        for i in range(21):
+            objs.append({
+                'title': u'\u00c1rt\u00edcle {0}'.format(i),
+                'sentiment': i / 4.0 if i % 3 else None,
+                'numPages': i,
+                'availability': i % 2 == 0,
+                'tags': [{'label': 'tag{0}'.format(j)} for j in range(i % 3)],
+                'images': [{'url': 'http://a/{0}.png'.format(i)}],
+                'score': i if i % 2 else i + 0.5,
+                'mixed': i if i % 2 else str(i),
+            })
+        objs[1]['sentiment'] = 'n/a'
+        objs[2]['numPages'] = 2 ** 64
+        del objs[3]['title']
+        fields = ['title', 'sentiment', 'numPages', 'availability', 'tags',
+                  'tags.label', 'images.0.url', 'score', 'mixed', 'missing']
+        import diffbot
+        objs[4] = diffbot.wrap(dict(objs[4], type='article'))
+        self.assertEqual(self.module.write_columns(
+            self.path, objs, fields, batch_size=8), 21)
+        objs[1]['sentiment'] = objs[2]['numPages'] = None
+        objs[4] = objs[4].raw
+        with self.module.Columns(self.path) as columns:
+            self.assertEqual(columns.rows, 21)
+            self.assertEqual(list(columns), fields)
+            self.assertEqual(columns.schema, [
+                ('title', 'str'), ('sentiment', 'float'), ('numPages', 'int'),
+                ('availability', 'bool'), ('tags', 'json'),
+                ('tags.label', 'json'), ('images.0.url', 'str'),
+                ('score', 'float'), ('mixed', 'json'), ('missing', 'str')])
+            for obj, record in zip(objs, columns.records()):
+                self.assertEqual(record, {
+                    'title': obj.get('title'),
+                    'sentiment': obj['sentiment'],
+                    'numPages': obj['numPages'],
+                    'availability': obj['availability'],
+                    'tags': obj['tags'] or [],
+                    'tags.label': [tag['label'] for tag in obj['tags']],
+                    'images.0.url': obj['images'][0]['url'],
+                    'score': obj['score'],
+                    'mixed': obj['mixed'],
+                    'missing': None,
+                })
+            numbers = columns['numPages']
+            self.assertEqual(len(numbers), 21)
+            self.assertEqual(numbers[-1], 20)
+            self.assertEqual(numbers[1:4], [1, None, 3])
+            self.assertEqual(numbers.values[2], 0)
+            self.assertRaises(IndexError, lambda: numbers[21])
+            self.assertEqual(sum(columns['score'].values), 215.5)
+            self.assertTrue('numPages' in repr(numbers))
+
+    def test_api_fields(self):
+        """Test the default columns of an API."""
+        import diffbot
+        writer = self.module.ColumnWriter(self.path, api='product')
+        self.assertEqual(writer.names, list(diffbot.Product.fields))
+        writer.close()
+        with self.module.Columns(self.path) as columns:
+            self.assertEqual(columns.rows, 0)
+            self.assertEqual(columns['availability'].type, 'bool')
+        self.assertRaises(ValueError, self.module.ColumnWriter, self.path)
+        self.assertRaises(ValueError, self.module.ColumnWriter, self.path,
+                          ['a'], batch_size=10)
+        self.assertRaises(ValueError, self.module.ColumnWriter, self.path,
+                          ['a'], types={'a': 'date'})
+
+    def test_incomplete(self):
+        """Test that an unfinished store can't be read."""
+        writer = self.module.ColumnWriter(self.path, ['a'], batch_size=8)
+        writer.extend({'a': i} for i in range(10))
+        self.assertRaises(EnvironmentError, self.module.Columns, self.path)
+        writer.close()
+        with self.module.Columns(self.path) as columns:
+            self.assertEqual(list(columns['a']), list(range(10)))
+
+        def interrupted():
+            with self.module.ColumnWriter(self.path, ['a']) as writer:
+                writer.extend({'a': i} for i in range(10))
+                raise ZeroDivisionError()
+
+        self.assertRaises(ZeroDivisionError, interrupted)
+        self.assertRaises(EnvironmentError, self.module.Columns, self.path)
+
+    def test_failed(self):
+        """Test that a store that failed to be written stays unfinished."""
+        os.makedirs(os.path.join(self.path, '1.valid'))
+        writer = self.module.ColumnWriter(self.path, ['a', 'b'])
+        writer.append({'a': 1, 'b': 2})
+        self.assertRaises(EnvironmentError, writer.close)
+        self.assertRaises(ValueError, writer.close)
+        self.assertRaises(EnvironmentError, self.module.Columns, self.path)
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_to_arrow(self):
+        """Test reading a store as an Arrow table."""
+        self.module.write_columns(
+            self.path, [{'a': 1, 'b': 'x', 'c': True}, {'b': None}],
+            ['a', 'b', 'c'])
+        with self.module.Columns(self.path) as columns:
+            table = columns.to_arrow()
+            self.assertEqual(table.to_pydict(), {
+                'a': [1, None], 'b': ['x', None], 'c': [True, None]})
+            del table
+
+
+class FakeAPITest(unittest.TestCase):
+    """End-to-end tests over HTTP, against a local stand-in API server."""
+
+    def setUp(self):
+        """Start the server, and point the client to it."""
+        import diffbot
+        import fake_api
+        self.module = imp.reload(diffbot)
+        self.server = fake_api.MockServer(records=50).start()
+        self.patcher = mock.patch.object(self.module, 'API_ROOT',
+                                         self.server.url)
+        self.patcher.start()
+        self.client = self.module.Client(token=TOKEN)
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Stop the server."""
+        self.client.close()
+        self.patcher.stop()
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def test_api(self):
+        """Test API calls answered from fixtures, or generated."""
+        result = self.client.article(GITHUB_COM)
+        self.assertEqual(result['title'], 'Build software better, together.')
+        result = self.client.product('http://example.com/x', text='x')
+        self.assertEqual(result['objects'][0]['type'], 'product')
+        self.assertEqual(result['objects'][0]['pageUrl'],
+                         'http://example.com/x')
+        self.assertEqual(self.server.requests, 2)
+
+    def test_errors(self):
+        """Test injected errors, and retrying them."""
+        self.server.error_rate = 1
+        self.assertRaises(EnvironmentError, self.client.article, GITHUB_COM)
+        self.server.error_rate = 0.5
+        client = self.module.Client(token=TOKEN, retry=self.module.RetryPolicy(
+            attempts=20, backoff=0))
+        results = list(client.article_many([GITHUB_COM] * 10))
+        self.assertTrue(all(isinstance(result, dict) for _, result in results))
+        self.assertTrue(self.server.errors > 1)
+        client.close()
+
+    def test_download(self):
+        """Test streaming and resuming crawl downloads."""
+        job = self.client.crawl([GITHUB_COM], name='test')
+        self.assertTrue(job.is_finished())
+        self.assertEqual(len(list(job.iter_download())), 50)
+        self.assertEqual(len(list(job.iter_download('csv'))), 50)
+        path = os.path.join(self.tmp, 'data.json')
+        body = self.server.download('json')
+        with open(path + '.part', 'wb') as dst:
+            dst.write(body[:100])
+        self.assertEqual(job.download_to(path),
+                         hashlib.sha256(body).hexdigest())
+
+    def test_crawl(self):
+        """Test crawl submissions, and their first status."""
+        job = self.client.crawl([GITHUB_COM], name='small')
+        seeds = ['http://example.com/{0}'.format(i) for i in range(300)]
+        big = self.client.crawl(seeds + seeds[:10], name='big',
+                                maxToCrawl=100)
+        self.assertEqual([(method, params['name'])
+                          for method, params in self.server.crawls],
+                         [('GET', 'small'), ('POST', 'big')])
+        params = self.server.crawls[1][1]
+        self.assertEqual(params['seeds'].split(), seeds)
+        self.assertEqual(params['maxToCrawl'], '100')
+        self.assertEqual(params['token'], TOKEN)
+        self.assertEqual(big.snapshot['name'], 'big')
+        self.assertTrue(job.is_finished())
+        self.assertEqual(self.server.requests, 2)
+
+    def test_crawl_many(self):
+        """Test splitting seeds between jobs, started concurrently."""
+        seeds = ['http://example.com/{0}'.format(i) for i in range(25)]
+        crawls = self.client.split_seeds(seeds * 2, 'big', seeds_per_job=10)
+        self.assertEqual([(name, len(urls)) for name, urls in crawls],
+                         [('big-0', 10), ('big-1', 10), ('big-2', 5)])
+        self.assertEqual(self.client.split_seeds(seeds, 'one', 25),
+                         [('one', seeds)])
+        jobs = dict(self.client.crawl_many(crawls, workers=3))
+        self.assertEqual(sorted(jobs), ['big-0', 'big-1', 'big-2'])
+        for name, job in jobs.items():
+            self.assertEqual(job.name, name)
+            self.assertEqual(job.snapshot['jobStatus']['status'], 9)
+        self.assertEqual(sorted(seed for _, params in self.server.crawls
+                                for seed in params['seeds'].split()),
+                         sorted(seeds))
+        self.assertEqual(self.server.requests, 3)
+        self.server.error_rate = 1
+        name, error = next(self.client.crawl_many({'failed': seeds}))
+        self.assertEqual(name, 'failed')
+        self.assertTrue(isinstance(error, EnvironmentError))
+
+    def test_batch(self):
+        """Test packing API calls into batch requests."""
+        urls = [GITHUB_COM] + ['http://example.com/{0}'.format(i)
+                               for i in range(119)]
+        with self.client.batch(size=50, linger=60) as batch:
+            futures = [batch.api('article', url, fields=['title'])
+                       for url in urls]
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(self.server.batched, 120)
+        results = [future.result() for future in futures]
+        self.assertEqual(results[0]['title'],
+                         'Build software better, together.')
+        self.assertEqual([result['objects'][0]['pageUrl']
+                          for result in results[1:]], urls[1:])
+        self.assertRaises(ValueError, batch.api, 'article', GITHUB_COM)
+
+    def test_batch_linger(self):
+        """Test sending a partial batch after the linger time."""
+        cache = self.module.MemoryCache()
+        client = self.module.Client(token=TOKEN, cache=cache)
+        batch = client.batch(size=100, linger=0.01)
+        futures = [batch.api('image', 'http://example.com/{0}'.format(i))
+                   for i in range(3)]
+        for future in futures:
+            self.assertTrue(future.wait(5))
+        self.assertEqual(self.server.requests, 1)
+        cached = batch.api('image', 'http://example.com/0')
+        self.assertTrue(cached.done())
+        self.assertEqual(cached.result(), futures[0].result())
+        self.assertRaises(ValueError, batch.api, 'article', GITHUB_COM,
+                          text='x')
+        batch.close()
+        self.assertEqual(self.server.requests, 1)
+        client.close()
+
+    def test_batch_errors(self):
+        """Test failed batch requests and calls."""
+        self.server.error_rate = 1
+        with self.client.batch() as batch:
+            futures = [batch.api('article', GITHUB_COM) for _ in range(2)]
+        for future in futures:
+            self.assertRaises(EnvironmentError, future.result)
+        try:
+            self.module._batch_result({'code': 404, 'body': 'Not found.'},
+                                      None)
+        except EnvironmentError as exc:
+            self.assertEqual(exc.code, 404)
+        else:
+            self.fail('No error raised.')
+        self.assertRaises(ValueError, self.client.batch, size=0)
+
+
+class ProcessRunnerTest(unittest.TestCase):
+    """Multi-process runner tests, against a local stand-in API server."""
+
+    def setUp(self):
+        """Start the server, and point the clients to it."""
+        import diffbot
+        import fake_api
+        self.module = imp.reload(diffbot)
+        self.server = fake_api.MockServer().start()
+        self.patcher = mock.patch.object(self.module, 'API_ROOT',
+                                         self.server.url)
+        self.patcher.start()
+        self.tmp = tempfile.mkdtemp()
+        self.urls = ['http://example.com/{0}'.format(i) for i in range(20)]
+
+    def tearDown(self):
+        """Stop the server."""
+        self.patcher.stop()
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def test_api_many(self):
+        """Test spreading calls over processes."""
+        runner = self.module.ProcessRunner(TOKEN, processes=2, threads=2,
+                                           shard_size=3)
+        results = list(runner.api_many('article', self.urls))
+        self.assertEqual(sorted(url for url, _ in results),
+                         sorted(self.urls))
+        for url, result in results:
+            self.assertEqual(result['objects'][0]['pageUrl'], url)
+        specs = self.urls + [{'url': GITHUB_COM, 'api': 'product'}]
+        results = list(runner.api_many('article', specs, ordered=True))
+        self.assertEqual([url for url, _ in results], self.urls + [GITHUB_COM])
+        self.assertEqual(results[-1][1]['type'], 'product')
+        self.assertEqual(self.server.requests, 41)
+
+    def test_crash(self):
+        """Test handing out the calls of a dead worker again."""
+        marker = os.path.join(self.tmp, 'crashed')
+        api = self.module.Client.api
+
+        def crash(client, name, url, **kwargs):
+            if url.endswith('/7') and not os.path.exists(marker):
+                open(marker, 'w').close()
+                os._exit(1)
+            if url.endswith('/13'):
+                os._exit(1)
+            return api(client, name, url, **kwargs)
+
+        runner = self.module.ProcessRunner(TOKEN, processes=2, threads=1,
+                                           shard_size=1, restarts=1)
+        with mock.patch.object(self.module.Client, 'api', crash):
+            results = dict(runner.api_many('article', self.urls))
+        self.assertEqual(sorted(results), sorted(self.urls))
+        self.assertEqual(results[self.urls[7]]['objects'][0]['pageUrl'],
+                         self.urls[7])
+        self.assertTrue(isinstance(results[self.urls[13]], RuntimeError))
+
+    def test_rate_limiter(self):
+        """Test sharing a rate limiter between processes."""
+        limiter = self.module.RateLimiter(1000)
+        self.assertRaises(ValueError, self.module.ProcessRunner, TOKEN,
+                          rate_limiter=limiter)
+        limiter = self.module.RateLimiter(
+            1000, path=os.path.join(self.tmp, 'limit'))
+        runner = self.module.ProcessRunner(TOKEN, processes=2,
+                                           rate_limiter=limiter)
+        self.assertEqual(len(list(runner.api_many('image', self.urls))), 20)
+        self.assertTrue(os.path.exists(limiter.path))
+        self.assertRaises(ValueError, runner.api_many, 'foo', self.urls)
+
+
+def no_aiohttp(client):
+    """Stand in for `AsyncClient.session` when `aiohttp` is missing."""
+    raise NameError('aiohttp is not available.')
+
+
+def run_until_complete(loop, awaitable):
+    """Run a coroutine, or collect the items of an asynchronous generator."""
+    if not hasattr(awaitable, '__anext__'):
+        return loop.run_until_complete(awaitable)
+    items = []
+    while True:
+        try:
+            items.append(loop.run_until_complete(awaitable.__anext__()))
+        except StopAsyncIteration:
+            return items
+
+
+@unittest.skipIf(asyncio is None, 'asyncio is not available')
+class AsyncClientTest(unittest.TestCase):
+    """Asyncio client tests.
+
+    These run without `aiohttp`, using the blocking transport in an executor.
+    """
+
+    def setUp(self):
+        """Set up a mock patcher."""
+        self.patcher_post = mock.patch('requests.Session.post',
+                                       fake_session_post)
+        self.patcher_get = mock.patch('requests.Session.get',
+                                      fake_session_get)
+        self.patcher_post.start()
+        self.patcher_get.start()
+        import diffbot
+        import diffbot_async
+        imp.reload(diffbot)
+        diffbot_async = imp.reload(diffbot_async)
+        self.patcher_session = mock.patch.object(
+            diffbot_async.AsyncClient, 'session', property(no_aiohttp))
+        self.patcher_session.start()
+        self.client = diffbot_async.AsyncClient(token=TOKEN, concurrency=2)
+
+    def tearDown(self):
+        """Stop the patcher."""
+        self.patcher_post.stop()
+        self.patcher_get.stop()
+        self.patcher_session.stop()
+
+    def run_async(self, coroutine):
+        """Run a coroutine (or a callable returning one) to completion."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            if callable(coroutine):
+                coroutine = coroutine()
+            return run_until_complete(loop, coroutine)
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    def test_article(self):
+        """Test the Article API."""
+        result = self.run_async(self.client.article(GITHUB_COM))
+        self.assertEqual(result['url'], GITHUB_COM)
+        self.assertEqual(result['type'], 'article')
+
+    def test_post(self):
+        """Test POSTing text to the Article API."""
+        result = self.run_async(self.client.article(GITHUB_COM, text='Hi!'))
+        self.assertEqual(result['type'], 'article')
+
+    def test_gather(self):
+        """Test running more calls than the concurrency limit."""
+        results = self.run_async(lambda: asyncio.gather(*[
+            self.client.api(name, GITHUB_COM)
+            for name in ('article', 'product', 'image') * 3]))
+        self.assertEqual([result['type'] for result in results],
+                         ['article', 'product', 'image'] * 3)
+
+    def test_invalid_api(self):
+        """Test calling an invalid API."""
+        self.assertRaises(ValueError, self.run_async,
+                          self.client.api('foo', GITHUB_COM))
+
+    def test_conflict(self):
+        """Test passing both `text` and `html`."""
+        self.assertRaises(ValueError, self.run_async,
+                          self.client.article(GITHUB_COM, text='a', html='b'))
+
+    def test_many(self):
+        """Test calling an API for many URLs."""
+        results = self.run_async(self.client.article_many(
+            [GITHUB_COM, 'http://nowhere/', GITHUB_COM], dedupe=True,
+            ordered=True))
+        self.assertEqual([url for url, _ in results],
+                         [GITHUB_COM, 'http://nowhere/'])
+        self.assertEqual(results[0][1]['type'], 'article')
+        self.assertTrue(isinstance(results[1][1], Exception))
+
+    def test_many_lazy(self):
+        """Test that URLs are read no further ahead than the calls."""
+        read = []
+
+        def urls():
+            for i in range(10):
+                read.append(i)
+                yield GITHUB_COM
+
+        many = self.client.article_many(urls(), workers=5)
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            url, _ = loop.run_until_complete(many.__anext__())
+            self.assertEqual(url, GITHUB_COM)
+            self.assertEqual(len(read), 2)
+            self.assertEqual(len(run_until_complete(loop, many)), 9)
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+        self.assertEqual(len(read), 10)
+
+    def test_context_manager(self):
+        """Test that the client can't be used with a plain `with`."""
+        self.assertRaises(TypeError, self.client.__enter__)
+        self.assertRaises(TypeError, self.client.__exit__, None, None, None)
+
+    def test_sync_methods(self):
+        """Test the blocking methods inherited from `Client`."""
+        result = self.client._get(self.client.endpoint('article'),
+                                  {'url': GITHUB_COM, 'token': TOKEN})
+        self.assertEqual(result['type'], 'article')
+
+
+@unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+class AsyncFakeAPITest(unittest.TestCase):
+    """Asyncio client tests over aiohttp, against a local API server."""
+
+    def setUp(self):
+        """Start the server, and point the client to it."""
+        import diffbot
+        import diffbot_async
+        import fake_api
+        self.module = imp.reload(diffbot)
+        self.async_module = imp.reload(diffbot_async)
+        self.server = fake_api.MockServer().start()
+        self.patcher = mock.patch.object(self.module, 'API_ROOT',
+                                         self.server.url)
+        self.patcher.start()
+
+    def tearDown(self):
+        """Stop the server."""
+        self.patcher.stop()
+        self.server.stop()
+
+    def run_async(self, *coroutines):
+        """Run coroutines made by a new client, then close the client."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        client = self.async_module.AsyncClient(token=TOKEN, concurrency=4)
+        try:
+            return [run_until_complete(loop, coroutine(client))
+                    for coroutine in coroutines]
+        finally:
+            loop.run_until_complete(client.close())
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    def test_api(self):
+        """Test GET and POST calls over aiohttp."""
+        urls = ['http://example.com/{0}'.format(i) for i in range(10)]
+        with mock.patch.object(self.module.Pool, 'get') as pool_get:
+            results, posted = self.run_async(
+                lambda client: client.article_many(urls, ordered=True),
+                lambda client: client.product('http://example.com/x',
+                                              text='x'))
+        self.assertFalse(pool_get.called)
+        self.assertEqual([result['objects'][0]['pageUrl']
+                          for _, result in results], urls)
+        self.assertEqual(posted['objects'][0]['type'], 'product')
+        self.assertEqual(self.server.requests, 11)
+
+    def test_batch(self):
+        """Test packing API calls into batch requests."""
+        urls = ['http://example.com/{0}'.format(i) for i in range(12)]
+
+        def calls(client):
+            batch = client.batch(size=5, linger=60, workers=2)
+            futures = [batch.api('article', url) for url in urls]
+            self.assertRaises(ValueError, batch.api, 'article', GITHUB_COM,
+                              text='x')
+            return asyncio.gather(batch.close(), *futures)
+
+        results = self.run_async(calls)[0][1:]
+        self.assertEqual([result['objects'][0]['pageUrl']
+                          for result in results], urls)
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(self.server.batched, 12)
+
+    def test_errors(self):
+        """Test HTTP errors over aiohttp."""
+        self.server.error_rate = 1
+        self.assertRaises(aiohttp.ClientResponseError, self.run_async,
+                          lambda client: client.article(GITHUB_COM))
+
 
 class CLITest(unittest.TestCase):
     """Test the command line interface."""
 
     def setUp(self):
         """Set up a mock patcher."""
-        self.patcher_post = mock.patch('requests.post', fake_requests_post)
-        self.patcher_get = mock.patch('requests.get', fake_requests_get)
+        self.patcher_post = mock.patch('requests.Session.post',
+                                       fake_session_post)
+        self.patcher_get = mock.patch('requests.Session.get',
+                                      fake_session_get)
         self.patcher_post.start()
         self.patcher_get.start()
         import diffbot
@@ -377,3 +2405,111 @@ class CLITest(unittest.TestCase):
             self.module.cli()
         sys.argv[:] = _sys_argv
         sys.stdin = _sys_stdin
+
+    def test_batch(self):
+        """Test batch mode, resuming an earlier run."""
+        tmp = tempfile.mkdtemp()
+        urls = os.path.join(tmp, 'urls.txt')
+        output = os.path.join(tmp, 'results.jsonl')
+        _sys_argv = sys.argv[:]
+        try:
+            with open(urls, 'w') as dst:
+                dst.write(GITHUB_COM + '\n\n')
+                dst.write('{"url": "https://example.com"}\n')
+            sys.argv[:] = [_sys_argv[0], 'article', urls, 'secret', '-b',
+                           '-w', '2', '-o', output]
+            self.module.cli()
+            with open(urls, 'a') as dst:
+                dst.write(json.dumps({'url': GITHUB_COM + '/?p=1',
+                                      'api': 'product'}) + '\n')
+            sys.argv.append('--resume')
+            self.module.cli()
+            with open(output) as src:
+                records = [json.loads(line) for line in src]
+        finally:
+            sys.argv[:] = _sys_argv
+            shutil.rmtree(tmp)
+        self.assertEqual(len(records), 4)
+        results = dict((record['url'], record) for record in records)
+        self.assertEqual(results[GITHUB_COM]['result']['type'], 'article')
+        self.assertEqual(results[GITHUB_COM + '/?p=1']['result']['type'],
+                         'product')
+        self.assertEqual(
+            [record['url'] for record in records].count(GITHUB_COM), 1)
+        self.assertTrue('error' in results['https://example.com'])
+
+    def test_batch_resume_truncated(self):
+        """Test resuming a run that was interrupted mid-line."""
+        tmp = tempfile.mkdtemp()
+        urls = os.path.join(tmp, 'urls.txt')
+        output = os.path.join(tmp, 'results.jsonl')
+        _sys_argv = sys.argv[:]
+        try:
+            with open(urls, 'w') as dst:
+                dst.write('{0}\n{0}/?p=1\n'.format(GITHUB_COM))
+            with open(output, 'w') as dst:
+                dst.write(json.dumps({'url': GITHUB_COM,
+                                      'result': {'type': 'article'}}) + '\n')
+                dst.write('{"url": "' + GITHUB_COM + '/?p=1", "res')
+            sys.argv[:] = [_sys_argv[0], 'article', urls, 'secret', '-b',
+                           '-o', output, '--resume']
+            self.module.cli()
+            with open(output) as src:
+                records = [json.loads(line) for line in src]
+        finally:
+            sys.argv[:] = _sys_argv
+            shutil.rmtree(tmp)
+        self.assertEqual([record['url'] for record in records],
+                         [GITHUB_COM, GITHUB_COM + '/?p=1'])
+        self.assertTrue('result' in records[1])
+
+    def test_batch_invalid(self):
+        """Test that invalid request lines don't abort the batch."""
+        tmp = tempfile.mkdtemp()
+        urls = os.path.join(tmp, 'urls.txt')
+        output = os.path.join(tmp, 'results.jsonl')
+        _sys_argv = sys.argv[:]
+        try:
+            with open(urls, 'w') as dst:
+                dst.write('{"api": "product"}\n' + GITHUB_COM +
+                          '\n{"url"\n')
+            for processes in ('1', '2'):
+                sys.argv[:] = [_sys_argv[0], 'article', urls, 'secret', '-b',
+                               '-o', output, '-p', processes]
+                self.module.cli()
+                with open(output) as src:
+                    records = [json.loads(line) for line in src]
+                self.assertEqual(len(records), 3)
+                results = [record for record in records if 'url' in record]
+                self.assertEqual(results[0]['result']['type'], 'article')
+                self.assertEqual(sorted(record['line'] for record in records
+                                        if 'error' in record),
+                                 ['{"api": "product"}', '{"url"'])
+            sys.argv[:] = [_sys_argv[0], 'article', urls, 'secret', '-b',
+                           '--resume']
+            with mock.patch('sys.stderr'):
+                self.assertRaises(SystemExit, self.module.cli)
+        finally:
+            sys.argv[:] = _sys_argv
+            shutil.rmtree(tmp)
+
+    def test_batch_processes(self):
+        """Test batch mode using several processes."""
+        tmp = tempfile.mkdtemp()
+        urls = os.path.join(tmp, 'urls.txt')
+        output = os.path.join(tmp, 'results.jsonl')
+        _sys_argv = sys.argv[:]
+        try:
+            with open(urls, 'w') as dst:
+                dst.write('{0}\nhttps://example.com\n'.format(GITHUB_COM))
+            sys.argv[:] = [_sys_argv[0], 'article', urls, 'secret', '-b',
+                           '-p', '2', '-o', output]
+            self.module.cli()
+            with open(output) as src:
+                records = [json.loads(line) for line in src]
+        finally:
+            sys.argv[:] = _sys_argv
+            shutil.rmtree(tmp)
+        results = dict((record['url'], record) for record in records)
+        self.assertEqual(results[GITHUB_COM]['result']['type'], 'article')
+        self.assertTrue('error' in results['https://example.com'])